@@ -2,14 +2,18 @@
 
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, UserInvitation, BiometricToken
+from private_chat_app.paginators import EstimatedCountPaginator
+from .models import User, UserInvitation, BiometricToken, QueuedEmail
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
     list_display = ['email', 'username', 'is_email_verified', 'is_staff', 'created_at']
     list_filter = ['is_email_verified', 'is_staff', 'is_superuser', 'is_active']
-    search_fields = ['email', 'username']
-    ordering = ['-created_at']
+    # Prefix searches are served by the UPPER(col) text_pattern_ops indexes
+    search_fields = ['^email', '^username']
+    ordering = ['-id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = UserAdmin.fieldsets + (
         ('Additional Info', {
@@ -23,10 +27,27 @@ class UserInvitationAdmin(admin.ModelAdmin):
     list_filter = ['is_used', 'created_at']
     search_fields = ['email', 'invited_by__email']
     readonly_fields = ['token', 'created_at']
+    list_select_related = ['invited_by']
+    raw_id_fields = ['invited_by']
+    ordering = ['-id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(BiometricToken)
 class BiometricTokenAdmin(admin.ModelAdmin):
     list_display = ['user', 'device_name', 'is_active', 'last_used']
     list_filter = ['is_active', 'created_at']
     search_fields = ['user__email', 'device_name', 'device_id']
-    readonly_fields = ['created_at', 'last_used']
\ No newline at end of file
+    readonly_fields = ['created_at', 'last_used']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+
+@admin.register(QueuedEmail)
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ['id', 'to', 'kind', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['=to']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+    ordering = ['-id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
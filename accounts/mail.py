@@ -0,0 +1,230 @@
+# accounts/mail.py
+# Outbound mail queue
+#
+# Views and commands never talk to SMTP: queue_email()/queue_emails() render the
+# message and store it as a QueuedEmail row. The scheduled accounts.tasks.send_queued_email
+# task (or `manage.py send_queued_email`) claims due rows with SKIP LOCKED and sends them
+# over one SMTP connection that stays open across batches, so a bulk invitation run pays
+# for one handshake and TLS negotiation rather than one per message. Temporary failures
+# (4xx replies, dropped connections) retry with exponential backoff up to
+# EMAIL_MAX_ATTEMPTS; permanent ones (5xx) fail the row.
+
+import csv
+import logging
+import secrets
+import smtplib
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.mail import EmailMessage, get_connection
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from private_chat_app import metrics
+from .models import QueuedEmail, UserInvitation
+
+logger = logging.getLogger('accounts.mail')
+User = get_user_model()
+
+VERIFY_EMAIL_SALT = 'accounts.verify_email'
+
+
+def render_email(template, context):
+    """(subject, body) from accounts/email/<template>_subject.txt and <template>.txt"""
+    context = {'site_url': settings.SITE_URL, **context}
+    subject = render_to_string(f'accounts/email/{template}_subject.txt', context)
+    body = render_to_string(f'accounts/email/{template}.txt', context)
+    return ' '.join(subject.split()), body
+
+
+def queue_email(to, template, context, kind=''):
+    """Render and queue one email"""
+    subject, body = render_email(template, context)
+    return QueuedEmail.objects.create(to=to, subject=subject, body=body, kind=kind or template)
+
+
+def queue_emails(emails):
+    """Queue many (to, subject, body, kind) messages in one INSERT per 500"""
+    return QueuedEmail.objects.bulk_create(
+        [QueuedEmail(to=to, subject=subject, body=body, kind=kind) for to, subject, body, kind in emails],
+        batch_size=500,
+    )
+
+
+# -- Invitations and verification ---------------------------------------------
+
+def read_addresses(lines):
+    """Email addresses from CSV lines: the 'email' column if there is a header, else the first"""
+    rows = list(csv.reader(lines))
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    column = header.index('email') if 'email' in header else 0
+    if 'email' in header:
+        rows = rows[1:]
+    return [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+
+
+def invite(addresses, invited_by):
+    """
+    Invite every new address and queue the emails. Returns (invited, skipped), where
+    skipped maps each address left out to why: invalid, duplicate, already a user or
+    already invited.
+    """
+    skipped, candidates = {}, {}
+    for address in addresses:
+        email = address.strip().lower()
+        try:
+            validate_email(email)
+        except ValidationError:
+            skipped[address] = 'invalid'
+            continue
+        if email in candidates:
+            skipped[address] = 'duplicate'
+            continue
+        candidates[email] = address
+
+    # Two queries for the whole list rather than two per address
+    for email in User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=candidates).values_list('email_lower', flat=True):
+        skipped[candidates.pop(email)] = 'already a user'
+    pending = UserInvitation.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=candidates, is_used=False)
+    for email in pending.values_list('email_lower', flat=True).distinct():
+        skipped[candidates.pop(email)] = 'already invited'
+
+    invitations = [
+        UserInvitation(email=email, invited_by=invited_by, token=secrets.token_urlsafe(32))
+        for email in candidates
+    ]
+    emails = []
+    for invitation in invitations:
+        subject, body = render_email('invitation', {
+            'invited_by': invited_by,
+            'url': f"{settings.SITE_URL}{reverse('accounts:register')}?token={invitation.token}",
+        })
+        emails.append((invitation.email, subject, body, 'invitation'))
+    with transaction.atomic():
+        UserInvitation.objects.bulk_create(invitations, batch_size=500)
+        queue_emails(emails)
+    return [invitation.email for invitation in invitations], skipped
+
+
+def verification_token(user):
+    return signing.dumps({'user': user.id, 'email': user.email}, salt=VERIFY_EMAIL_SALT)
+
+
+def check_verification_token(token):
+    """The user a verification link was issued to, or None if it is forged, expired or stale"""
+    try:
+        data = signing.loads(token, salt=VERIFY_EMAIL_SALT, max_age=settings.EMAIL_VERIFICATION_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    # A link issued before an email change no longer verifies anything
+    return User.objects.filter(id=data['user'], email=data['email']).first()
+
+
+def queue_verification_email(user):
+    url = settings.SITE_URL + reverse('accounts:verify_email', args=[verification_token(user)])
+    return queue_email(user.email, 'verify_email', {'user': user, 'url': url})
+
+
+# -- Sending ------------------------------------------------------------------
+
+def _backoff(attempts):
+    return timedelta(seconds=min(settings.EMAIL_RETRY_BASE * 2 ** (attempts - 1), settings.EMAIL_RETRY_MAX))
+
+
+def _classify(error):
+    """'failed' for a permanent SMTP rejection, 'retry' for anything that may pass later"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return 'failed' if codes and min(codes) >= 500 else 'retry'
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 'failed' if error.smtp_code >= 500 else 'retry'
+    return 'retry'
+
+
+class Sender:
+    """Sends due mail over one SMTP connection, kept open between batches while in use"""
+
+    def __init__(self):
+        self.connection = None
+        self.last_used = 0
+
+    def _open(self):
+        if self.connection is not None and time.monotonic() - self.last_used > settings.EMAIL_CONNECTION_IDLE:
+            # Servers drop idle clients; reconnect rather than fail the next send
+            self.close()
+        if self.connection is None:
+            self.connection = get_connection(fail_silently=False)
+        if self.connection.open():
+            metrics.EMAIL_CONNECTIONS.inc()
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def send_due(self, batch_size=None):
+        """Send one batch of due mail; returns {'sent', 'retry', 'failed'} counts"""
+        counts = {'sent': 0, 'retry': 0, 'failed': 0}
+        start = time.perf_counter()
+        with transaction.atomic():
+            batch = list(
+                QueuedEmail.objects.select_for_update(skip_locked=True)
+                .filter(status='pending', next_attempt_at__lte=timezone.now())
+                .order_by('next_attempt_at')[:batch_size or settings.EMAIL_BATCH_SIZE]
+            )
+            if not batch:
+                return counts
+
+            done = []
+            for email in batch:
+                outcome = self._send(email)
+                counts[outcome] += 1
+                done.append(email)
+                if outcome == 'retry' and self.connection is None:
+                    # The server went away; leave the rest of the batch for the next sweep
+                    break
+            QueuedEmail.objects.bulk_update(done, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+
+        metrics.EMAIL_BATCH_SECONDS.observe(time.perf_counter() - start)
+        for outcome, count in counts.items():
+            metrics.EMAIL_SENT.inc(count, outcome=outcome)
+        return counts
+
+    def _send(self, email):
+        email.attempts += 1
+        message = EmailMessage(email.subject, email.body, settings.DEFAULT_FROM_EMAIL, [email.to])
+        try:
+            self._open().send_messages([message])
+        except OSError as e:  # smtplib's exceptions included
+            outcome = _classify(e)
+            if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                # No reply at all (refused, timed out, disconnected): the connection is gone
+                self.close()
+            if outcome == 'retry' and email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+                outcome = 'failed'
+            email.last_error = f'{type(e).__name__}: {e}'[:1000]
+            if outcome == 'failed':
+                email.status = 'failed'
+                logger.warning('Giving up on email %s to %s: %s', email.id, email.to, email.last_error)
+            else:
+                email.next_attempt_at = timezone.now() + _backoff(email.attempts)
+            return outcome
+        finally:
+            self.last_used = time.monotonic()
+
+        email.status = 'sent'
+        email.sent_at = timezone.now()
+        email.last_error = ''
+        return 'sent'
@@ -0,0 +1,36 @@
+# accounts/management/commands/invite_users.py
+
+import sys
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from accounts.mail import invite, read_addresses
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Invite a list of email addresses (CSV) and queue their invitation emails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv', help="CSV file with an 'email' column, or one address per line ('-' for stdin)")
+        parser.add_argument('--invited-by', required=True, metavar='EMAIL', help='User the invitations come from')
+
+    def handle(self, *args, **options):
+        inviter = User.objects.filter(email__iexact=options['invited_by']).first()
+        if inviter is None:
+            raise CommandError(f"No user with email {options['invited_by']}")
+        try:
+            if options['csv'] == '-':
+                addresses = read_addresses(sys.stdin)
+            else:
+                with open(options['csv'], newline='', encoding='utf-8') as lines:
+                    addresses = read_addresses(lines)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        invited, skipped = invite(addresses, inviter)
+        for address, reason in skipped.items():
+            self.stdout.write(f'  skipped {address}: {reason}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Queued {len(invited)} invitation(s), skipped {len(skipped)}; send_queued_email delivers them'
+        ))
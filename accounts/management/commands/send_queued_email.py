@@ -0,0 +1,33 @@
+# accounts/management/commands/send_queued_email.py
+
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from accounts.mail import Sender
+
+
+class Command(BaseCommand):
+    help = 'Send queued email over one reused SMTP connection, retrying temporary failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Messages per batch (default: EMAIL_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new mail')
+
+    def handle(self, *args, **options):
+        sender = Sender()
+        try:
+            while True:
+                start = time.perf_counter()
+                counts = sender.send_due(options['batch_size'])
+                if any(counts.values()):
+                    self.stdout.write(
+                        f"Sent {counts['sent']}, deferred {counts['retry']}, failed {counts['failed']} "
+                        f'in {time.perf_counter() - start:.2f}s'
+                    )
+                    self.stdout.flush()
+                    continue
+                if not options['loop']:
+                    return
+                time.sleep(settings.EMAIL_POLL_INTERVAL)
+        finally:
+            sender.close()
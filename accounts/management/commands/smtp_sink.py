@@ -0,0 +1,144 @@
+# accounts/management/commands/smtp_sink.py
+
+import asyncio
+import fnmatch
+import random
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand
+
+
+class Sink:
+    """
+    Just enough SMTP to stand in for a provider: accepts mail, optionally writes each
+    message to a directory, and can refuse or defer recipients and messages so the
+    sender's retry and reconnect paths can be exercised.
+    """
+
+    def __init__(self, stdout, maildir=None, reject=(), defer=(), defer_rate=0.0, drop_after=0):
+        self.stdout = stdout
+        self.maildir = Path(maildir) if maildir else None
+        self.reject = reject
+        self.defer = defer
+        self.defer_rate = defer_rate
+        self.drop_after = drop_after
+        self.connections = 0
+        self.messages = 0
+
+    async def session(self, reader, writer):
+        self.connections += 1
+        connection = self.connections
+        received = 0
+        sender, recipients = None, []
+
+        def reply(line):
+            writer.write(f'{line}\r\n'.encode())
+
+        reply('220 smtp-sink ESMTP')
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('utf-8', 'replace').strip()
+                verb, _, argument = command.partition(' ')
+                verb = verb.upper()
+                if verb == 'EHLO':
+                    writer.write(b'250-smtp-sink\r\n250-8BITMIME\r\n250 SMTPUTF8\r\n')
+                elif verb == 'HELO':
+                    reply('250 smtp-sink')
+                elif verb == 'MAIL':
+                    sender, recipients = argument.partition(':')[2].strip().strip('<>').split('>')[0], []
+                    reply('250 2.1.0 OK')
+                elif verb == 'RCPT':
+                    address = argument.partition(':')[2].strip().strip('<>').split('>')[0]
+                    if any(fnmatch.fnmatch(address, pattern) for pattern in self.reject):
+                        reply('550 5.1.1 Recipient rejected')
+                    elif any(fnmatch.fnmatch(address, pattern) for pattern in self.defer):
+                        reply('450 4.2.1 Mailbox busy, try again later')
+                    else:
+                        recipients.append(address)
+                        reply('250 2.1.5 OK')
+                elif verb == 'DATA':
+                    if not recipients:
+                        reply('503 5.5.1 No valid recipients')
+                        continue
+                    reply('354 End data with <CR><LF>.<CR><LF>')
+                    await writer.drain()
+                    data = []
+                    while True:
+                        chunk = await reader.readline()
+                        if not chunk or chunk in (b'.\r\n', b'.\n'):
+                            break
+                        data.append(chunk[1:] if chunk.startswith(b'..') else chunk)
+                    if random.random() < self.defer_rate:
+                        reply('451 4.3.0 Temporary failure, try again later')
+                    else:
+                        self.store(connection, sender, recipients, b''.join(data))
+                        reply('250 2.0.0 Queued')
+                        received += 1
+                    sender, recipients = None, []
+                    if self.drop_after and received >= self.drop_after:
+                        # Hang up mid-session, like a provider enforcing a per-connection limit
+                        await writer.drain()
+                        break
+                elif verb == 'RSET':
+                    sender, recipients = None, []
+                    reply('250 2.0.0 OK')
+                elif verb == 'NOOP':
+                    reply('250 2.0.0 OK')
+                elif verb == 'QUIT':
+                    reply('221 2.0.0 Bye')
+                    await writer.drain()
+                    break
+                else:
+                    reply('502 5.5.2 Command not implemented')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def store(self, connection, sender, recipients, message):
+        self.messages += 1
+        subject = next(
+            (line[8:].decode('utf-8', 'replace').strip() for line in message.splitlines() if line.lower().startswith(b'subject:')),
+            ''
+        )
+        self.stdout.write(f"#{self.messages} conn {connection}: {sender} -> {', '.join(recipients)} ({len(message)} bytes) {subject}")
+        if self.maildir:
+            self.maildir.mkdir(parents=True, exist_ok=True)
+            (self.maildir / f'{time.time_ns()}-{self.messages}.eml').write_bytes(message)
+
+
+class Command(BaseCommand):
+    help = 'Run a local SMTP stand-in that accepts (or refuses and defers) mail, for developing and testing the mail queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--maildir', help='Write every accepted message here as a .eml file')
+        parser.add_argument('--reject', action='append', default=[], metavar='PATTERN', help='Refuse recipients matching this glob with 550')
+        parser.add_argument('--defer', action='append', default=[], metavar='PATTERN', help='Defer recipients matching this glob with 450')
+        parser.add_argument('--defer-rate', type=float, default=0.0, help='Share of messages answered with 451 after DATA')
+        parser.add_argument('--drop-after', type=int, default=0, metavar='N', help='Hang up after N messages on a connection')
+
+    def handle(self, *args, **options):
+        sink = Sink(
+            self.stdout, options['maildir'], options['reject'], options['defer'],
+            options['defer_rate'], options['drop_after'],
+        )
+
+        async def serve():
+            server = await asyncio.start_server(sink.session, options['host'], options['port'])
+            self.stdout.write(
+                f"SMTP sink on {options['host']}:{options['port']} "
+                f"(run the sender with EMAIL_HOST={options['host']} EMAIL_PORT={options['port']} EMAIL_USE_TLS=False)"
+            )
+            async with server:
+                await server.serve_forever()
+
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            self.stdout.write(f'{sink.messages} message(s) over {sink.connections} connection(s)')
@@ -0,0 +1,25 @@
+# Prefix indexes backing the participant autocomplete.
+#
+# istartswith compiles to UPPER(col::text) LIKE UPPER('q%'), which can only use an
+# expression index on UPPER(col) with the pattern operator class. Django 4.2 cannot
+# render OpClass around a function expression, so the indexes are created in SQL.
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS "user_email_prefix_idx" ON "accounts_user" (UPPER("email"::text) text_pattern_ops);',
+            reverse_sql='DROP INDEX IF EXISTS "user_email_prefix_idx";',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS "user_username_prefix_idx" ON "accounts_user" (UPPER("username"::text) text_pattern_ops);',
+            reverse_sql='DROP INDEX IF EXISTS "user_username_prefix_idx";',
+        ),
+    ]
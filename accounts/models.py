@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
@@ -58,4 +59,32 @@ class BiometricToken(models.Model):
     is_active = models.BooleanField(default=True)
     
     def __str__(self):
-        return f"Biometric token for {self.user.email}"
\ No newline at end of file
+        return f"Biometric token for {self.user.email}"
+
+class QueuedEmail(models.Model):
+    """Outbound email for the background sender (accounts.mail)"""
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    kind = models.CharField(max_length=30, blank=True)  # e.g. 'invitation', 'verify_email'
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Only mail still waiting to go out is indexed for the sender's sweep
+            models.Index(fields=['next_attempt_at'], name='accounts_email_due_idx', condition=models.Q(status='pending')),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind or 'Email'} to {self.to} ({self.status})"
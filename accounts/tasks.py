@@ -0,0 +1,17 @@
+# accounts/tasks.py
+# Background tasks (tasks.queue) for accounts: run by `manage.py run_tasks`
+
+from django.conf import settings
+from tasks.queue import task
+from .mail import Sender
+
+# One per worker process, so its SMTP connection outlives a single batch
+_sender = Sender()
+
+
+@task(max_attempts=1)
+def send_queued_email():
+    """Send one batch of due mail, and come straight back if the batch was full"""
+    counts = _sender.send_due()
+    if sum(counts.values()) >= settings.EMAIL_BATCH_SIZE:
+        send_queued_email.enqueue(key='accounts.send_queued_email')
@@ -12,4 +12,6 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('profile/', views.profile_view, name='profile'),
     path('verify-email/<str:token>/', views.verify_email, name='verify_email'),
+    path('users/search/', views.user_search, name='user_search'),
+    path('public-key/', views.public_key_view, name='public_key'),
 ]
\ No newline at end of file
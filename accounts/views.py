@@ -5,6 +5,11 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+from chat.keys import invalidate_key_directory
+from .mail import check_verification_token, queue_verification_email
 from .models import UserInvitation
 import uuid
 
@@ -81,6 +86,9 @@ def register_view(request):
             invitation.is_used = True
             invitation.save()
         
+        # Queued, not sent: the background sender delivers it (accounts.mail)
+        queue_verification_email(user)
+        
         # Log the user in
         login(request, user)
         messages.success(request, f'Welcome, {username}! Your account has been created.')
@@ -131,6 +139,58 @@ def profile_view(request):
 
 def verify_email(request, token):
     """Verify user email address"""
-    # Email verification logic (to be implemented)
+    user = check_verification_token(token)
+    if user is None:
+        messages.error(request, 'This verification link is invalid or has expired.')
+        return redirect('accounts:login')
+    
+    User.objects.filter(id=user.id).update(is_email_verified=True)
     messages.success(request, 'Email verified successfully!')
-    return redirect('accounts:login')
\ No newline at end of file
+    return redirect('accounts:login')
+
+
+@login_required
+def user_search(request):
+    """Prefix search over users for the participant picker (keyset paginated)"""
+    query = request.GET.get('q', '').strip()
+    after = request.GET.get('after', '')
+
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 50)
+    except ValueError:
+        limit = 20
+
+    if len(query) < 2:
+        return JsonResponse({'results': [], 'next': None})
+
+    # istartswith compiles to UPPER(col) LIKE 'Q%', served by the prefix indexes on User
+    users = User.objects.filter(
+        Q(email__istartswith=query) | Q(username__istartswith=query)
+    ).exclude(id=request.user.id).order_by('email')
+
+    if after:
+        users = users.filter(email__gt=after)
+
+    # Fetch one extra row to know whether another page exists without a COUNT(*)
+    page = list(users.values('id', 'username', 'email')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    return JsonResponse({
+        'results': page,
+        'next': page[-1]['email'] if has_more else None,
+    })
+
+
+
+@login_required
+@require_POST
+def public_key_view(request):
+    """Publish the current user's public key to the room key directories"""
+    public_key = request.POST.get('public_key', '').strip()
+    if not public_key:
+        return JsonResponse({'error': 'No public key provided'}, status=400)
+
+    User.objects.filter(id=request.user.id).update(public_key=public_key)
+    invalidate_key_directory(request.user.chat_rooms.values_list('id', flat=True))
+    return JsonResponse({'success': True})
@@ -1,3 +1,137 @@
+# chat/admin.py
+
+from functools import reduce
+from operator import or_
 from django.contrib import admin
+from django.db.models import Q
+from private_chat_app.paginators import EstimatedCountPaginator
+from .models import Attachment, ChatRoom, Message, MessageReadReceipt, MessageRevision, PushDevice, Reaction, PushNotification, RoomExport, RoomKey
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist defaults that stay cheap on multi-million-row tables"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    # Newest first along the primary key index: cheap to sort and to page through
+    ordering = ['-id']
+    # Integer columns matched exactly when the search term is a number; admin's own
+    # '=field' search would compare UPPER(field::text) and skip the index
+    id_search_fields = ['id']
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if term.isdigit():
+            condition = reduce(or_, (Q(**{field: int(term)}) for field in self.id_search_fields))
+            return queryset.filter(condition), False
+        return super().get_search_results(request, queryset, search_term)
+
+
+@admin.register(ChatRoom)
+class ChatRoomAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'room_type', 'created_by', 'is_active', 'key_epoch', 'updated_at']
+    list_filter = ['room_type', 'is_active']
+    list_select_related = ['created_by']
+    search_fields = ['=created_by__email']
+    raw_id_fields = ['created_by', 'participants']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+class AttachmentInline(admin.TabularInline):
+    model = Attachment
+    extra = 0
+    fields = ['position', 'name', 'size', 'mime_type', 'width', 'height', 'duration', 'sha256', 'url']
+    readonly_fields = ['sha256']
+
+
+@admin.register(Message)
+class MessageAdmin(LargeTableAdmin):
+    list_display = ['id', 'chat_room', 'sender', 'message_type', 'timestamp', 'reply_count', 'edited_at', 'deleted_at', 'expires_at']
+    list_filter = ['message_type']
+    list_select_related = ['chat_room', 'sender']
+    # Message bodies are encrypted, so only indexed lookups (ids, sender email) are offered
+    search_fields = ['=sender__email']
+    id_search_fields = ['id', 'chat_room_id']
+    raw_id_fields = ['chat_room', 'sender', 'reply_to']
+    # Materialized by chat.reactions
+    readonly_fields = ['timestamp', 'reaction_counts', 'reply_count']
+    inlines = [AttachmentInline]
+
+
+@admin.register(Attachment)
+class AttachmentAdmin(LargeTableAdmin):
+    list_display = ['id', 'message_id', 'name', 'size', 'mime_type', 'width', 'height', 'duration']
+    search_fields = ['=message__sender__email']
+    id_search_fields = ['id', 'message_id']
+    raw_id_fields = ['message']
+
+
+@admin.register(MessageRevision)
+class MessageRevisionAdmin(LargeTableAdmin):
+    list_display = ['id', 'chat_room_id', 'seq', 'message_id', 'kind', 'created_at']
+    list_filter = ['kind']
+    search_fields = ['=message__sender__email']
+    id_search_fields = ['message_id', 'chat_room_id']
+    raw_id_fields = ['message', 'chat_room']
+    readonly_fields = ['created_at']
+
+
+@admin.register(Reaction)
+class ReactionAdmin(LargeTableAdmin):
+    list_display = ['id', 'message_id', 'user', 'emoji', 'created_at']
+    list_select_related = ['user']
+    search_fields = ['=user__email']
+    id_search_fields = ['id', 'message_id']
+    raw_id_fields = ['message', 'user']
+    readonly_fields = ['created_at']
+
+
+@admin.register(MessageReadReceipt)
+class MessageReadReceiptAdmin(LargeTableAdmin):
+    list_display = ['id', 'message_id', 'user', 'read_at']
+    list_select_related = ['user']
+    search_fields = ['=user__email']
+    id_search_fields = ['message_id']
+    raw_id_fields = ['message', 'user']
+    readonly_fields = ['read_at']
+
+
+@admin.register(RoomKey)
+class RoomKeyAdmin(LargeTableAdmin):
+    list_display = ['id', 'chat_room_id', 'recipient', 'epoch', 'created_at']
+    list_select_related = ['recipient']
+    search_fields = ['=recipient__email']
+    id_search_fields = ['chat_room_id']
+    raw_id_fields = ['chat_room', 'recipient', 'created_by']
+    readonly_fields = ['created_at']
+
+
+@admin.register(RoomExport)
+class RoomExportAdmin(LargeTableAdmin):
+    list_display = ['id', 'chat_room_id', 'requested_by', 'format', 'status', 'message_count', 'attempts', 'updated_at']
+    list_filter = ['status', 'format']
+    list_select_related = ['requested_by']
+    search_fields = ['=requested_by__email']
+    id_search_fields = ['id', 'chat_room_id']
+    raw_id_fields = ['chat_room', 'requested_by']
+    readonly_fields = ['created_at', 'updated_at', 'finished_at']
+
+
+@admin.register(PushDevice)
+class PushDeviceAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'platform', 'is_active', 'updated_at']
+    list_filter = ['platform', 'is_active']
+    list_select_related = ['user']
+    search_fields = ['=user__email']
+    id_search_fields = ['id', 'user_id']
+    raw_id_fields = ['user']
+    readonly_fields = ['created_at', 'updated_at']
+
 
-# Register your models here.
+@admin.register(PushNotification)
+class PushNotificationAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'chat_room_id', 'pending', 'due_at', 'last_sent_at']
+    list_select_related = ['user']
+    search_fields = ['=user__email']
+    id_search_fields = ['id', 'chat_room_id']
+    raw_id_fields = ['user', 'chat_room', 'last_sender']
@@ -0,0 +1,145 @@
+# chat/attachments.py
+# Message attachments
+#
+# Files live in their own table (chat.models.Attachment), so text messages, the vast
+# majority, carry no file columns, and a message can hold several files. The upload
+# view records what the request already tells it (URL, name, size, a MIME type guessed
+# from the extension); describe_message() fills in the rest from the stored bytes on a
+# worker (chat.tasks.describe_attachments): SHA-256, the image type and dimensions
+# Pillow finds, and the duration of WAV files, or of any audio and video when ffprobe
+# is installed.
+#
+# Events and API responses carry an 'attachments' list, and the first attachment as
+# file_url/file_name/file_size for clients that only know about one file.
+
+import hashlib
+import json
+import logging
+import mimetypes
+import shutil
+import subprocess
+import tempfile
+import wave
+from .models import Attachment
+from .signing import media_expiry, sign_media_url
+from .storage import open_chat_file
+
+logger = logging.getLogger('chat.attachments')
+
+CHUNK_SIZE = 1024 * 1024
+PROBE_TIMEOUT = 60
+
+
+def guess_mime_type(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def as_event(attachment):
+    """An attachment as it travels in channel layer events (URL unsigned)"""
+    return {
+        'url': attachment.url,
+        'name': attachment.name,
+        'size': attachment.size,
+        'mime_type': attachment.mime_type,
+        'width': attachment.width,
+        'height': attachment.height,
+        'duration': attachment.duration,
+    }
+
+
+def signed_fields(attachments, message_id, user_id, expires=None):
+    """Message fields for attachment events, with every URL signed for user_id"""
+    expires = media_expiry() if expires is None else expires
+    signed = [
+        {**attachment, 'url': sign_media_url(attachment['url'], message_id, user_id, expires)}
+        for attachment in attachments
+    ]
+    first = signed[0] if signed else {}
+    return {
+        'attachments': signed,
+        'file_url': first.get('url'),
+        'file_name': first.get('name'),
+        'file_size': first.get('size'),
+    }
+
+
+# -- Derived metadata ---------------------------------------------------------
+
+def _image_info(path):
+    try:
+        from PIL import Image, UnidentifiedImageError
+    except ImportError:
+        return {}
+    try:
+        # Only the header is read; pixels are never decoded
+        with Image.open(path) as image:
+            info = {'width': image.width, 'height': image.height}
+            if image.format in Image.MIME:
+                info['mime_type'] = Image.MIME[image.format]
+            return info
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return {}
+
+
+def _wave_info(path):
+    try:
+        with wave.open(path) as audio:
+            return {'duration': audio.getnframes() / audio.getframerate()}
+    except (wave.Error, EOFError, ZeroDivisionError):
+        return {}
+
+
+def _probe(path):
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None:
+        return {}
+    try:
+        result = subprocess.run(
+            [ffprobe, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path],
+            capture_output=True, timeout=PROBE_TIMEOUT, check=True,
+        )
+        data = json.loads(result.stdout)
+    except (OSError, subprocess.SubprocessError, ValueError) as e:
+        logger.info('ffprobe could not read %s: %s', path, e)
+        return {}
+    info = {}
+    if data.get('format', {}).get('duration'):
+        info['duration'] = float(data['format']['duration'])
+    video = next((stream for stream in data.get('streams', []) if stream.get('codec_type') == 'video'), None)
+    if video and video.get('width'):
+        info.update(width=video['width'], height=video['height'])
+    return info
+
+
+def describe(attachment):
+    """Metadata derived from an attachment's stored bytes"""
+    digest = hashlib.sha256()
+    with open_chat_file(attachment.url) as source, tempfile.NamedTemporaryFile(suffix='-attachment') as copy:
+        # Hosted files are only streamable, so the inspectors get a local copy
+        while chunk := source.read(CHUNK_SIZE):
+            digest.update(chunk)
+            copy.write(chunk)
+        copy.flush()
+
+        info = {'sha256': digest.hexdigest()}
+        kind = (attachment.mime_type or guess_mime_type(attachment.name)).split('/')[0]
+        if kind == 'image':
+            info.update(_image_info(copy.name))
+        elif kind in ('audio', 'video'):
+            info.update(_wave_info(copy.name) or _probe(copy.name))
+    return info
+
+
+def describe_message(message_id):
+    """Fill in the derived metadata of a message's attachments; returns how many were described"""
+    described = 0
+    # Queued as the upload commits, which a lagging replica may not have seen yet
+    for attachment in Attachment.objects.using('default').filter(message_id=message_id, sha256=''):
+        try:
+            info = describe(attachment)
+        except FileNotFoundError:
+            # Deleted by retention (or by hand) before the worker got to it
+            continue
+        Attachment.objects.filter(id=attachment.id).update(**info)
+        described += 1
+    return described
@@ -0,0 +1,366 @@
+# chat/bulkload.py
+# Bulk history import and synthetic seeding through Postgres COPY
+#
+# Message, attachment and read-receipt rows are written as CSV into an in-memory buffer and
+# shipped with one COPY per batch, so input of any size streams through in constant
+# memory. Ids are assigned here rather than by the sequences (the tables are locked
+# against other writers for the load), which lets a receipt reference its message
+# without a round trip; the sequences are reset to the new maximum afterwards.
+#
+# With defer_indexes, the secondary indexes and foreign keys of the loaded tables
+# are dropped first and rebuilt once at the end, which is far cheaper than keeping
+# them up to date row by row. That holds an ACCESS EXCLUSIVE lock for the whole
+# load, so it is meant for migrations and benchmark databases. The load is a
+# single transaction: if it fails, the database is left as it was.
+
+import base64
+import csv
+import gzip
+import io
+import itertools
+import json
+import sys
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.urls import reverse
+from .membership import Membership
+from .attachments import guess_mime_type
+from .keys import invalidate_key_directory
+from .models import Attachment, ChatRoom, Message, MessageReadReceipt
+
+User = get_user_model()
+
+MESSAGE_COLUMNS = (
+    'id', 'chat_room_id', 'sender_id', 'message_type', 'encrypted_content', 'timestamp', 'is_edited', 'expires_at',
+    'reply_count',
+)
+ATTACHMENT_COLUMNS = ('id', 'message_id', 'position', 'url', 'name', 'size', 'mime_type', 'sha256')
+RECEIPT_COLUMNS = ('id', 'message_id', 'user_id', 'read_at')
+LOADED_MODELS = (Message, Attachment, MessageReadReceipt)
+MEMBERSHIP_BATCH = 10000
+FILE_TYPES = ('image', 'document', 'audio', 'video')
+
+
+class _CopyBuffer:
+    """CSV rows for one table, sent with a single COPY on flush"""
+
+    def __init__(self, model, columns, not_null=()):
+        quote = connection.ops.quote_name
+        options = 'FORMAT csv'
+        if not_null:
+            # An unquoted empty CSV field is NULL; these columns take it as ''
+            options += f", FORCE_NOT_NULL ({', '.join(map(quote, not_null))})"
+        self.sql = (
+            f"COPY {quote(model._meta.db_table)} ({', '.join(map(quote, columns))}) "
+            f"FROM STDIN WITH ({options})"
+        )
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.rows = 0
+
+    def add(self, row):
+        self.writer.writerow(row)
+        self.rows += 1
+
+    def flush(self, cursor):
+        if self.rows:
+            self.buffer.seek(0)
+            cursor.copy_expert(self.sql, self.buffer)
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.rows = 0
+
+
+def _max_id(cursor, model):
+    cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(model._meta.db_table)}')
+    return cursor.fetchone()[0]
+
+
+def _drop_deferred(cursor, tables):
+    """Drop foreign keys and non-constraint indexes; returns the DDL that recreates them"""
+    quote = connection.ops.quote_name
+    # Rows written earlier in the transaction (seeded rooms, imported users) still
+    # have deferred foreign key checks queued, and ALTER TABLE refuses to run then
+    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    indexes, foreign_keys = [], []
+    for table in tables:
+        cursor.execute("""
+            SELECT c.relname, pg_get_indexdef(c.oid)
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = %s::regclass AND NOT i.indisprimary
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid AND k.conrelid = i.indrelid)
+        """, [table])
+        indexes += cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table]
+        )
+        foreign_keys += [(table, name, definition) for name, definition in cursor.fetchall()]
+
+    for table, name, _ in foreign_keys:
+        cursor.execute(f'ALTER TABLE {quote(table)} DROP CONSTRAINT {quote(name)}')
+    for name, _ in indexes:
+        cursor.execute(f'DROP INDEX {quote(name)}')
+    # Indexes first: validating a foreign key is then one join against indexed tables
+    return [definition for _, definition in indexes] + [
+        f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}'
+        for table, name, definition in foreign_keys
+    ]
+
+
+def load(messages, batch_size=50000, defer_indexes=True, progress=None):
+    """
+    COPY (room_id, sender_id, message_type, content, timestamp, attachments, expires_at,
+    read_by_ids) tuples, attachments being [(url, name, size, mime_type, sha256)], into
+    chat_message and its related tables. Senders and readers become room participants. Returns counts and timings.
+    """
+    quote = connection.ops.quote_name
+    tables = [model._meta.db_table for model in LOADED_MODELS]
+    stats = {'messages': 0, 'attachments': 0, 'receipts': 0, 'rooms': 0}
+    start = time.perf_counter()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Other writers wait for the load; readers carry on unless indexes are deferred
+        cursor.execute(f"LOCK TABLE {', '.join(map(quote, tables))} IN SHARE ROW EXCLUSIVE MODE")
+        deferred = _drop_deferred(cursor, tables) if defer_indexes else []
+
+        message_rows = _CopyBuffer(Message, MESSAGE_COLUMNS, not_null=['encrypted_content'])
+        attachment_rows = _CopyBuffer(Attachment, ATTACHMENT_COLUMNS, not_null=['name', 'mime_type', 'sha256'])
+        receipt_rows = _CopyBuffer(MessageReadReceipt, RECEIPT_COLUMNS)
+        message_id = _max_id(cursor, Message)
+        attachment_id = _max_id(cursor, Attachment)
+        receipt_id = _max_id(cursor, MessageReadReceipt)
+        members = set()
+
+        for room_id, sender_id, message_type, content, timestamp, attachments, expires_at, read_by in messages:
+            message_id += 1
+            stats['messages'] += 1
+            message_rows.add((message_id, room_id, sender_id, message_type, content, timestamp, False, expires_at, 0))
+            for position, (url, name, size, mime_type, sha256) in enumerate(attachments):
+                attachment_id += 1
+                attachment_rows.add((attachment_id, message_id, position, url, name, size, mime_type, sha256))
+            stats['attachments'] += len(attachments)
+            members.add((room_id, sender_id))
+            for user_id in read_by:
+                receipt_id += 1
+                receipt_rows.add((receipt_id, message_id, user_id, timestamp))
+                members.add((room_id, user_id))
+            stats['receipts'] += len(read_by)
+
+            if message_rows.rows >= batch_size:
+                message_rows.flush(cursor)
+                attachment_rows.flush(cursor)
+                receipt_rows.flush(cursor)
+                if progress:
+                    progress(stats['messages'], stats['receipts'], time.perf_counter() - start)
+        message_rows.flush(cursor)
+        attachment_rows.flush(cursor)
+        receipt_rows.flush(cursor)
+        stats['load_seconds'] = time.perf_counter() - start
+
+        rebuild = time.perf_counter()
+        for statement in deferred:
+            cursor.execute(statement)
+        stats['rebuild_seconds'] = time.perf_counter() - rebuild
+
+        finish = time.perf_counter()
+        pairs = sorted(members)
+        for offset in range(0, len(pairs), MEMBERSHIP_BATCH):
+            Membership.objects.bulk_create(
+                [Membership(chatroom_id=room_id, user_id=user_id) for room_id, user_id in pairs[offset:offset + MEMBERSHIP_BATCH]],
+                ignore_conflicts=True,
+            )
+        # Rooms that gained members drop their cached key directory once the load commits
+        invalidate_key_directory(sorted({room_id for room_id, _ in pairs}))
+        for statement in connection.ops.sequence_reset_sql(no_style(), LOADED_MODELS):
+            cursor.execute(statement)
+        # Rooms sort by their latest activity; bring them up to the newest loaded message
+        room_ids = sorted({room_id for room_id, _ in members})
+        cursor.execute(f"""
+            UPDATE {quote(ChatRoom._meta.db_table)} r SET updated_at = GREATEST(r.updated_at, m.latest)
+            FROM (SELECT chat_room_id, MAX(timestamp) AS latest FROM {quote(Message._meta.db_table)}
+                  WHERE chat_room_id = ANY(%s) GROUP BY chat_room_id) m
+            WHERE r.id = m.chat_room_id
+        """, [room_ids])
+        for table in tables:
+            cursor.execute(f'ANALYZE {quote(table)}')
+        stats['finish_seconds'] = time.perf_counter() - finish
+
+    stats['rooms'] = len(room_ids)
+    stats['total_seconds'] = time.perf_counter() - start
+    return stats
+
+
+# -- Sources ------------------------------------------------------------------
+
+def open_input(path):
+    """Text lines from a file ('-' for stdin); .gz files are decompressed on the fly"""
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+class _Directory:
+    """Resolves NDJSON senders and rooms to ids, creating missing ones once"""
+
+    def __init__(self, room_id=None):
+        self.users = {}
+        self.rooms = {}
+        self.room_id = room_id
+        if room_id is not None and not ChatRoom.objects.filter(id=room_id).exists():
+            raise ValueError(f'Chat room {room_id} does not exist')
+
+    def user(self, key):
+        if key not in self.users:
+            lookup = {'email__iexact': key} if '@' in key else {'username': key}
+            user_id = User.objects.filter(**lookup).values_list('id', flat=True).first()
+            if user_id is None:
+                user_id = self._create_user(key).id
+            self.users[key] = user_id
+        return self.users[key]
+
+    def _create_user(self, key):
+        email = key if '@' in key else f'{key}@imported.invalid'
+        base = username = key.split('@')[0][:140]
+        for suffix in itertools.count(2):
+            if not User.objects.filter(username=username).exists():
+                break
+            username = f'{base}-{suffix}'
+        # No usable password: imported users sign in through a password reset
+        return User.objects.create_user(username=username, email=email, password=None)
+
+    def room(self, key, line, sender_id):
+        if self.room_id is not None:
+            return self.room_id
+        if key not in self.rooms:
+            if isinstance(key, int):
+                if not ChatRoom.objects.filter(id=key).exists():
+                    raise ValueError(f'Chat room {key} does not exist')
+                self.rooms[key] = key
+            else:
+                room_type = line.get('room_type', 'group')
+                self.rooms[key] = ChatRoom.objects.create(name=str(key), room_type=room_type, created_by_id=sender_id).id
+        return self.rooms[key]
+
+
+def ndjson_messages(lines, room_id=None):
+    """
+    Message tuples for load() from NDJSON lines:
+    {"room": id or name, "sender": email or username, "type", "content", "timestamp",
+     "expires_at", "attachments": [{"url", "name", "size", "mime_type", "sha256"}, ...],
+     "read_by": [email or username, ...]}
+    A single "file" URL with "file_name" and "file_size" is read as one attachment, and
+    attachments without a URL (room exports carry paths inside the ZIP) are left out.
+    Unknown senders are created; a room given by name is created on first sight.
+    With room_id every line goes to that room, so a room export loads back as is.
+    """
+    directory = _Directory(room_id)
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+            sender_id = directory.user(str(data['sender']))
+            chat_room_id = directory.room(data.get('room'), data, sender_id)
+            read_by = [directory.user(str(reader)) for reader in data.get('read_by') or ()]
+            attachments = _ndjson_attachments(data)
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f'line {number}: {e!r}')
+        yield (
+            chat_room_id, sender_id, data.get('type') or 'text', data.get('content') or '',
+            data.get('timestamp') or 'now', attachments, data.get('expires_at'),
+            [user_id for user_id in read_by if user_id != sender_id],
+        )
+
+
+def _ndjson_attachments(data):
+    files = data.get('attachments')
+    if files is None:
+        files = [{'url': data['file'], 'name': data.get('file_name'), 'size': data.get('file_size')}] if data.get('file') else []
+    return [
+        (
+            file['url'], file.get('name') or 'file', file.get('size') or 0,
+            file.get('mime_type') or guess_mime_type(file.get('name') or ''), file.get('sha256') or '',
+        )
+        for file in files if file.get('url')
+    ]
+
+
+def weights(count, distribution, skew):
+    """Relative weights of count items: equal, or Zipf-like (rank ** -skew)"""
+    if distribution == 'zipf':
+        return [rank ** -skew for rank in range(1, count + 1)]
+    return [1] * count
+
+
+def create_seed_users(count, prefix, batch_size=5000):
+    """Create count users without usable passwords and return their ids"""
+    password = '!'  # What set_unusable_password() stores, minus the random suffix
+    ids = []
+    for offset in range(0, count, batch_size):
+        users = User.objects.bulk_create([
+            User(username=f'{prefix}-{n}', email=f'{prefix}-{n}@seed.invalid', password=password)
+            for n in range(offset, min(offset + batch_size, count))
+        ])
+        ids += [user.id for user in users]
+    return ids
+
+
+def create_seed_rooms(rng, user_ids, count, room_size, user_weights, prefix):
+    """
+    Create count rooms of 2..room_size members drawn by user_weights, and return
+    [(room_id, member_ids)]. Two-member rooms are private chats, the rest groups.
+    """
+    cumulative = list(itertools.accumulate(user_weights))
+    plans = []
+    for n in range(count):
+        size = rng.randint(2, max(2, min(room_size, len(user_ids))))
+        members = set()
+        while len(members) < size:
+            members.update(rng.choices(user_ids, cum_weights=cumulative, k=size - len(members)))
+        plans.append(sorted(members))
+
+    rooms = ChatRoom.objects.bulk_create([
+        ChatRoom(
+            name=f'{prefix} room {n}', room_type='private' if len(members) == 2 else 'group',
+            created_by_id=members[0],
+        )
+        for n, members in enumerate(plans)
+    ])
+    pairs = [Membership(chatroom_id=room.id, user_id=user_id) for room, members in zip(rooms, plans) for user_id in members]
+    Membership.objects.bulk_create(pairs, batch_size=MEMBERSHIP_BATCH)
+    return [(room.id, members) for room, members in zip(rooms, plans)]
+
+
+def synthetic_messages(rng, rooms, count, start, end, room_weights, file_ratio=0.0, read_ratio=0.0,
+                       receipts=1, content_bytes=96, block=10000):
+    """
+    count message tuples for load(): rooms drawn by room_weights, senders uniformly
+    from the room's members, timestamps evenly spaced from start to end (so they rise
+    with the id, as in real traffic) and random ciphertext-sized content.
+    """
+    cumulative = list(itertools.accumulate(room_weights))
+    step = (end - start) / max(count, 1)
+    for first in range(0, count, block):
+        picks = rng.choices(rooms, cum_weights=cumulative, k=min(block, count - first))
+        for offset, (room_id, members) in enumerate(picks):
+            n = first + offset
+            sender_id = rng.choice(members)
+            message_type, attachments = 'text', ()
+            if file_ratio and rng.random() < file_ratio:
+                message_type = rng.choice(FILE_TYPES)
+                file_name = f'seed-{n}.bin'
+                url = reverse('chat:serve_file', args=[room_id, file_name])
+                attachments = [(url, file_name, rng.randint(10_000, 5_000_000), 'application/octet-stream', '')]
+            read_by = ()
+            if read_ratio and rng.random() < read_ratio:
+                readers = rng.sample(members, min(receipts + 1, len(members)))
+                read_by = [user_id for user_id in readers if user_id != sender_id][:receipts]
+            yield (
+                room_id, sender_id, message_type, base64.b64encode(rng.randbytes(content_bytes)).decode(),
+                start + step * n, attachments, None, read_by,
+            )
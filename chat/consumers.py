@@ -1,21 +1,52 @@
 # chat/consumers.py
 
+import asyncio
 import json
+import os
+import time
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.utils import timezone
+from . import drain, edits, push, reactions, tasks
+from .attachments import as_event, signed_fields
 from .models import ChatRoom, Message
+from .retention import expiry_for, unexpired
+from private_chat_app import metrics, replicas
+from private_chat_app.profiling import track_queries
+from .throttling import OutboundQueue, QueueOverflow, connection_bucket, room_bucket
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    async def dispatch(self, message):
+        # Each event is a unit of work for replica routing, like an HTTP request. The
+        # handshake reads only from the primary: a lagging replay would skip messages
+        # the group delivered before this socket joined it
+        async with replicas.aunit_of_work(self.user_id, primary=message['type'] == 'websocket.connect'):
+            await super().dispatch(message)
+
+    def user_id(self):
+        user = self.scope.get('user')
+        return user.id if user is not None and user.is_authenticated else None
+
     async def connect(self):
+        with metrics.CONNECT_SECONDS.time():
+            await self.open_connection()
+
+    async def open_connection(self):
         self.room_id = self.scope['url_route']['kwargs']['room_id']
         self.room_group_name = f'chat_{self.room_id}'
         self.user = self.scope['user']
 
+        if drain.draining:
+            # Stragglers that reached this worker after it stopped listening
+            await self.close()
+            return
+
         print(f"========== WebSocket Connect Attempt ==========")
         print(f"Room ID: {self.room_id}")
         print(f"User: {self.user}")
@@ -31,7 +62,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
         # Add try-except to catch errors
         try:
             print(f"Checking if user is participant in room {self.room_id}...")
-            is_participant = await self.check_participant()
+            with metrics.AUTH_SECONDS.time():
+                is_participant = await self.check_participant()
             print(f"✅ Is participant: {is_participant}")
         except Exception as e:
             print(f"❌ ERROR checking participant: {e}")
@@ -45,6 +77,34 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
+        # Kept in sync with membership_update events so removals apply without a reconnect
+        self.is_member = True
+
+        # Inbound rate limits and the bounded outbound queue drained by a writer task
+        self.connection_bucket = connection_bucket()
+        self.room_bucket = room_bucket(self.room_id)
+        self.outbox = OutboundQueue(
+            settings.CHAT_OUTBOUND_QUEUE['max_size'],
+            settings.CHAT_OUTBOUND_QUEUE['policy'],
+            settings.CHAT_OUTBOUND_QUEUE['window']
+        )
+        self.last_delivered_id = None
+        self.resumed_through = 0
+        self.last_seq = None
+        self.synced_seq = 0
+        self.writer_task = None
+        self.heartbeat_task = None
+
+        # Idle timeout by client type (?client=mobile etc.); any inbound frame,
+        # including a pong, counts as a sign of life
+        query = parse_qs(self.scope['query_string'].decode())
+        self.client_type = query.get('client', ['web'])[0]
+        if self.client_type not in settings.CHAT_IDLE_TIMEOUTS:
+            self.client_type = 'web'
+        self.idle_timeout = settings.CHAT_IDLE_TIMEOUTS[self.client_type]
+        self.last_seen = time.monotonic()
+        self.frames_since_seen = 0
+
         print(f"Adding to group: {self.room_group_name}")
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -55,6 +115,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.accept()
         
         print("✅ WebSocket connection accepted!")
+        self.counted_socket = True
+        metrics.ACTIVE_SOCKETS.inc(pid=os.getpid())
+        # While any socket of this user is open in the room, new messages aren't pushed
+        await push.mark_present(self.room_id, self.user.id)
+        self.present = True
         
         await self.send(text_data=json.dumps({
             'type': 'connection',
@@ -62,25 +127,177 @@ class ChatConsumer(AsyncWebsocketConsumer):
         }))
         print("Sent connection confirmation message")
 
+        # A reconnecting client passes the last message id it saw; replay what it missed
+        resume_after = query.get('resume_after', [''])[0]
+        if resume_after.isdigit():
+            await self.replay_missed(int(resume_after))
+        # ...and the highest change seq it saw; edits and deletions since then follow
+        since_seq = query.get('since_seq', [''])[0]
+        if since_seq.isdigit():
+            await self.sync_changes(int(since_seq))
+
+        self.writer_task = asyncio.create_task(self.drain_outbox())
+        self.heartbeat_task = asyncio.create_task(self.heartbeat())
+        drain.register(self)
+
     async def disconnect(self, close_code):
+        drain.unregister(self)
+        if getattr(self, 'writer_task', None):
+            self.writer_task.cancel()
+        if getattr(self, 'heartbeat_task', None):
+            self.heartbeat_task.cancel()
+
+        if getattr(self, 'counted_socket', False):
+            metrics.ACTIVE_SOCKETS.dec(pid=os.getpid())
+        if getattr(self, 'present', False):
+            await push.mark_absent(self.room_id, self.user.id)
+
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+    async def drain_outbox(self):
+        """Write queued frames to the socket one at a time, as fast as the client reads them"""
+        while True:
+            frame = await self.outbox.get()
+            if frame['type'] == 'reconnect':
+                # Stamped at send time so it covers every frame flushed ahead of it
+                frame['resume_after'] = self.last_delivered_id
+                frame['since_seq'] = self.last_seq
+                await self.send(text_data=json.dumps(frame))
+                await self.close(code=4012)
+                return
+            await self.write(frame)
+            if frame['type'] == 'message':
+                self.last_delivered_id = frame['message_id']
+            elif frame.get('seq'):
+                self.last_seq = frame['seq']
+            if self.outbox.wants_ping():
+                # The pong confirms the client has read everything up to here
+                await self.write({'type': 'ping'})
+
+    async def write(self, frame):
+        await self.send(text_data=json.dumps(frame))
+        self.outbox.wrote(frame)
+        self.frames_since_seen += 1
+
+    async def heartbeat(self):
+        """Ping the client every CHAT_HEARTBEAT_INTERVAL and reap it once it goes quiet"""
+        while True:
+            await asyncio.sleep(settings.CHAT_HEARTBEAT_INTERVAL)
+            if time.monotonic() - self.last_seen > self.idle_timeout:
+                await self.reap()
+                return
+            await self.enqueue({'type': 'ping'}, coalesce_key='ping')
+            await push.refresh_presence(self.room_id, self.user.id)
+
+    async def reap(self):
+        """Drop a silent (likely half-open) socket from its room group, then close it"""
+        self.is_member = False
+        await self.channel_layer.group_discard(
+            self.room_group_name,
+            self.channel_name
+        )
+        metrics.REAPED_SOCKETS.inc(client=self.client_type)
+        # Everything written since the last inbound frame went to a socket nobody was reading
+        metrics.DEAD_SOCKET_FRAMES.inc(self.frames_since_seen, client=self.client_type)
+        await self.close(code=4001)
+
+    async def drain(self, retry_after_ms):
+        """Flush pending frames, then close with a reconnect hint (see chat.drain)"""
+        self.heartbeat_task.cancel()
+        await self.channel_layer.group_discard(
+            self.room_group_name,
+            self.channel_name
+        )
+        self.outbox.close({'type': 'reconnect', 'retry_after_ms': retry_after_ms})
+        await self.writer_task
+
+    async def replay_missed(self, after):
+        """Queue messages saved since `after`, or a resync if there are too many"""
+        missed = await self.get_missed_messages(after)
+        if len(missed) > settings.CHAT_RESUME_LIMIT:
+            await self.enqueue({'type': 'resync', 'after': after})
+            return
+        for event in missed:
+            await self.chat_message(event)
+        if missed:
+            # Live copies of these may already be waiting in the channel layer
+            self.resumed_through = missed[-1]['message_id']
+
+    async def sync_changes(self, since):
+        """Queue the room's edits and deletions after seq `since`, or a resync if there are too many"""
+        changes = await self.get_changes(since)
+        if changes is None:
+            await self.enqueue({'type': 'resync', 'after': self.last_delivered_id})
+            return
+        for frame in changes:
+            await self.enqueue(frame)
+        if changes:
+            # As with replayed messages, live copies may follow; older ones must not win
+            self.synced_seq = changes[-1]['seq']
+
+    async def enqueue(self, frame, coalesce_key=None):
+        """Queue a frame for the writer task, applying the overflow policy"""
+        try:
+            self.outbox.put(frame, coalesce_key=coalesce_key, resync_frame={
+                'type': 'resync',
+                'after': self.last_delivered_id
+            })
+        except QueueOverflow:
+            # Receiver is too slow: tell it where to resume and drop the socket
+            self.is_member = False
+            await self.send(text_data=json.dumps({
+                'type': 'overflow',
+                'resume_after': self.last_delivered_id,
+                'since_seq': self.last_seq
+            }))
+            await self.close(code=4008)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        self.last_seen = time.monotonic()
+        self.frames_since_seen = 0
+        if not self.is_member:
+            return
+
+        # Rejected before the rate limits, so garbage costs no tokens and raises nothing
+        try:
+            text_data_json = json.loads(text_data) if text_data is not None else None
+        except ValueError:
+            text_data_json = None
+        if not isinstance(text_data_json, dict):
+            await self.enqueue({'type': 'error', 'error': 'invalid_frame'}, coalesce_key='invalid_frame')
+            return
         message_type = text_data_json.get('type', 'text')
-        
+        if message_type == 'pong':
+            self.outbox.pong()
+            return
+
+        if not self.connection_bucket.consume():
+            metrics.FRAMES_THROTTLED.inc(scope='connection')
+            await self.enqueue({'type': 'error', 'error': 'rate_limited'}, coalesce_key='rate_limited')
+            return
+        if not self.room_bucket.consume():
+            metrics.FRAMES_THROTTLED.inc(scope='room')
+            await self.enqueue({'type': 'error', 'error': 'rate_limited'}, coalesce_key='rate_limited')
+            return
+
         if message_type == 'text':
             message = text_data_json.get('message', '')
             if not message.strip():
                 return
+            reply_to = text_data_json.get('reply_to')
+            if reply_to is not None and not isinstance(reply_to, int):
+                return
 
-            saved_message = await self.save_message(message, 'text')
+            with metrics.SAVE_MESSAGE_SECONDS.time():
+                saved_message = await self.save_message(message, 'text', text_data_json.get('ttl'), reply_to)
+            if saved_message is None:
+                await self.enqueue({'type': 'error', 'error': 'reply_rejected', 'target_id': reply_to})
+                return
             
-            await self.channel_layer.group_send(
-                self.room_group_name,
+            await self.group_send(
                 {
                     'type': 'chat_message',
                     'message': message,
@@ -88,9 +305,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     'sender': self.user.username,
                     'sender_id': self.user.id,
                     'timestamp': saved_message['timestamp'],
-                    'message_id': saved_message['id']
+                    'message_id': saved_message['id'],
+                    'reply_to': reply_to,
+                    'expires_at': saved_message['expires_at']
                 }
             )
+            await self.notify_offline(saved_message['id'])
         
         elif message_type == 'file':
             # File message (already saved by upload view)
@@ -98,23 +318,56 @@ class ChatConsumer(AsyncWebsocketConsumer):
             file_info = await self.get_file_message(message_id)
             
             if file_info:
-                await self.channel_layer.group_send(
-                    self.room_group_name,
+                await self.group_send(
                     {
                         'type': 'chat_message',
-                        'message': file_info['file_name'],
+                        'message': file_info['message'],
                         'message_type': file_info['message_type'],
                         'sender': self.user.username,
                         'sender_id': self.user.id,
                         'timestamp': file_info['timestamp'],
                         'message_id': file_info['id'],
-                        'file_url': file_info['file_url'],
-                        'file_name': file_info['file_name'],
-                        'file_size': file_info['file_size']
+                        'attachments': file_info['attachments'],
+                        'expires_at': file_info['expires_at']
                     }
                 )
+                await self.notify_offline(file_info['id'])
+
+        elif message_type in ('edit', 'delete'):
+            # Senders edit and delete their own messages; members get the delta, not the message
+            message_id = text_data_json.get('message_id')
+            if not isinstance(message_id, int):
+                return
+            if message_type == 'edit':
+                message = text_data_json.get('message', '')
+                if not message.strip():
+                    return
+                frame = await self.edit_message(message_id, message)
+            else:
+                frame = await self.delete_message(message_id)
+
+            if frame is None:
+                await self.enqueue({'type': 'error', 'error': f'{message_type}_rejected', 'target_id': message_id})
+                return
+            await self.group_send({'type': 'message_changed', 'frame': frame})
+
+        elif message_type == 'react':
+            # Counts reach the room from the debounced refresh (chat.reactions), not from here
+            message_id = text_data_json.get('message_id')
+            if not isinstance(message_id, int):
+                return
+            if not await self.react(message_id, text_data_json.get('emoji'), bool(text_data_json.get('remove'))):
+                await self.enqueue({'type': 'error', 'error': 'react_rejected', 'target_id': message_id})
+
+    async def group_send(self, event):
+        """Broadcast an event to the room group, timing the channel layer round trip"""
+        with metrics.GROUP_SEND_SECONDS.time():
+            await self.channel_layer.group_send(self.room_group_name, event)
 
     async def chat_message(self, event):
+        if event['message_id'] <= self.resumed_through:
+            return
+
         message_data = {
             'type': 'message',
             'message': event['message'],
@@ -122,50 +375,175 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'sender': event['sender'],
             'sender_id': event['sender_id'],
             'timestamp': event['timestamp'],
-            'message_id': event['message_id']
+            'message_id': event['message_id'],
+            'reply_to': event.get('reply_to'),
+            'reactions': event.get('reactions') or {},
+            'reply_count': event.get('reply_count', 0),
+            'expires_at': event.get('expires_at')
         }
         
         # Add file info if it's a file message
-        if event['message_type'] in ['file', 'image', 'video', 'audio']:
-            message_data['file_url'] = event.get('file_url')
-            message_data['file_name'] = event.get('file_name')
-            message_data['file_size'] = event.get('file_size')
+        if event.get('attachments'):
+            # Each recipient gets URLs signed for its own user
+            message_data.update(signed_fields(event['attachments'], event['message_id'], self.user.id))
         
-        await self.send(text_data=json.dumps(message_data))
+        await self.enqueue(message_data)
+
+    async def message_changed(self, event):
+        if event['frame']['seq'] <= self.synced_seq:
+            return
+        await self.enqueue(event['frame'])
+
+    async def message_counts(self, event):
+        # Already one per message per debounce window; a slow socket keeps only the latest
+        await self.enqueue({
+            'type': 'counts',
+            'message_id': event['message_id'],
+            'reactions': event['reactions'],
+            'reply_count': event['reply_count']
+        }, coalesce_key=f"counts:{event['message_id']}")
+
+    async def membership_update(self, event):
+        if self.user.id in event['removed']:
+            # Revoke authorization before anything else can be delivered to this socket
+            self.is_member = False
+            await self.channel_layer.group_discard(
+                self.room_group_name,
+                self.channel_name
+            )
+            await self.send(text_data=json.dumps({
+                'type': 'membership',
+                'removed_self': True
+            }))
+            await self.close(code=4403)
+            return
+
+        await self.enqueue({
+            'type': 'membership',
+            'added': event['added'],
+            'removed': event['removed']
+        })
+
+    async def messages_deleted(self, event):
+        # One frame per retention batch, however many messages it removed
+        await self.enqueue({'type': 'deleted', 'message_ids': event['message_ids']})
+
+    async def retention_update(self, event):
+        self.room_ttl = event['message_ttl_seconds']
+        await self.enqueue({
+            'type': 'retention',
+            'retention_seconds': event['retention_seconds'],
+            'message_ttl_seconds': event['message_ttl_seconds']
+        }, coalesce_key='retention')
+
+    async def key_update(self, event):
+        # Members fetch the new epoch's wrapped key from the key directory
+        await self.enqueue({'type': 'key_update', 'epoch': event['epoch']}, coalesce_key='key_update')
 
     @database_sync_to_async
+    @track_queries('check_participant')
     def check_participant(self):
-        try:
-            room = ChatRoom.objects.get(id=self.room_id)
-            return room.participants.filter(id=self.user.id).exists()
-        except ChatRoom.DoesNotExist:
+        # One indexed join on the through table, which also brings the room's message TTL
+        room = ChatRoom.objects.filter(
+            id=self.room_id,
+            participants=self.user.id
+        ).values('message_ttl_seconds').first()
+        if room is None:
             return False
+        self.room_ttl = room['message_ttl_seconds']
+        return True
 
     @database_sync_to_async
-    def save_message(self, message, message_type):
-        room = ChatRoom.objects.get(id=self.room_id)
+    @track_queries('save_message')
+    def save_message(self, message, message_type, ttl=None, reply_to=None):
+        # Membership was verified on connect, so the room row itself is not needed
+        if reply_to is not None and not reactions.reply_parent(self.room_id, reply_to):
+            return None
         msg = Message.objects.create(
-            chat_room=room,
+            chat_room_id=self.room_id,
             sender=self.user,
             encrypted_content=message,
-            message_type=message_type
+            message_type=message_type,
+            expires_at=expiry_for(ttl, self.room_ttl),
+            reply_to_id=reply_to
         )
+        if reply_to is not None:
+            reactions.schedule_refresh(reply_to)
         return {
             'id': msg.id,
-            'timestamp': msg.timestamp.isoformat()
+            'timestamp': msg.timestamp.isoformat(),
+            'expires_at': msg.expires_at.isoformat() if msg.expires_at else None
         }
     
     @database_sync_to_async
+    @track_queries('notify_offline')
+    def notify_offline(self, message_id):
+        # After the broadcast, and only queued: a worker works out who is offline
+        tasks.notify_offline.enqueue(room_id=int(self.room_id), message_id=message_id, sender_id=self.user.id)
+
+    @database_sync_to_async
+    @track_queries('edit_message')
+    def edit_message(self, message_id, message):
+        return edits.edit_message(self.room_id, self.user.id, message_id, message)
+
+    @database_sync_to_async
+    @track_queries('delete_message')
+    def delete_message(self, message_id):
+        return edits.delete_message(self.room_id, self.user.id, message_id)
+
+    @database_sync_to_async
+    @track_queries('react')
+    def react(self, message_id, emoji, remove):
+        return reactions.react(self.room_id, self.user.id, message_id, emoji, remove)
+
+    @database_sync_to_async
+    @track_queries('sync_changes')
+    def get_changes(self, since):
+        return edits.changes_since(self.room_id, since, settings.CHAT_SYNC_LIMIT)
+
+    @database_sync_to_async
+    @track_queries('get_file_message')
     def get_file_message(self, message_id):
         try:
-            msg = Message.objects.get(id=message_id, chat_room_id=self.room_id)
+            # Only the sender's own live message: never a deleted or expired one, or someone else's
+            msg = unexpired(Message.objects.filter(sender=self.user)).prefetch_related('attachments').get(
+                id=message_id, chat_room_id=self.room_id
+            )
+            attachments = [as_event(attachment) for attachment in msg.attachments.all()]
             return {
                 'id': msg.id,
+                'message': attachments[0]['name'] if attachments else msg.encrypted_content,
                 'message_type': msg.message_type,
-                'file_url': msg.file if msg.file else None,
-                'file_name': msg.file_name,
-                'file_size': msg.file_size,
-                'timestamp': msg.timestamp.isoformat()
+                'attachments': attachments,
+                'timestamp': msg.timestamp.isoformat(),
+                'expires_at': msg.expires_at.isoformat() if msg.expires_at else None
             }
         except Message.DoesNotExist:
             return None
+
+    @database_sync_to_async
+    @track_queries('missed_messages')
+    def get_missed_messages(self, after):
+        # One past the limit tells replay_missed the gap is too big to replay
+        messages = unexpired(Message.objects.filter(
+            chat_room_id=self.room_id,
+            id__gt=after
+        )).select_related('sender').prefetch_related('attachments').order_by('id')[:settings.CHAT_RESUME_LIMIT + 1]
+        missed = []
+        for msg in messages:
+            attachments = [as_event(attachment) for attachment in msg.attachments.all()]
+            missed.append({
+                'type': 'chat_message',
+                'message': attachments[0]['name'] if attachments else msg.encrypted_content,
+                'message_type': msg.message_type,
+                'sender': msg.sender.username,
+                'sender_id': msg.sender_id,
+                'timestamp': msg.timestamp.isoformat(),
+                'message_id': msg.id,
+                'attachments': attachments,
+                'reply_to': msg.reply_to_id,
+                'reactions': msg.reaction_counts,
+                'reply_count': msg.reply_count,
+                'expires_at': msg.expires_at.isoformat() if msg.expires_at else None
+            })
+        return missed
@@ -0,0 +1,91 @@
+# chat/drain.py
+# Graceful drain for a daphne worker on SIGTERM
+#
+# Daphne's own SIGTERM handling stops the reactor straight away and cancels every
+# consumer, so a deploy drops all sockets at the same instant and every client
+# reconnects at once. install() replaces that handler once the reactor is running:
+#   1. the worker stops listening (the shared socket stays open in the other
+#      workers and in `manage.py serve`, so new connections land there)
+#   2. /healthz reports 503 so load balancers stop routing to this worker
+#   3. every open ChatConsumer flushes its outbox, then gets a 'reconnect' frame
+#      with a jittered delay and the id of the last message it delivered,
+#      followed by a 4012 close (1012 "service restart" moved into the app range,
+#      since autobahn only lets servers send 1000 or 3000-4999)
+#   4. the reactor stops once all sockets are closed, or after DRAIN_TIMEOUT
+# A second SIGTERM skips the drain and stops immediately.
+
+import asyncio
+import logging
+import random
+import signal
+import sys
+import weakref
+from django.conf import settings
+from private_chat_app import metrics
+
+logger = logging.getLogger('chat.drain')
+
+draining = False
+_consumers = weakref.WeakSet()
+
+
+def register(consumer):
+    _consumers.add(consumer)
+
+
+def unregister(consumer):
+    _consumers.discard(consumer)
+
+
+def reconnect_delay_ms():
+    """Spread reconnects uniformly over DRAIN_RECONNECT_WINDOW instead of all at once"""
+    return int(random.uniform(0, settings.DRAIN_RECONNECT_WINDOW) * 1000)
+
+
+def install():
+    """Take over SIGTERM once daphne's reactor is running (no-op outside daphne)"""
+    reactor = sys.modules.get('twisted.internet.reactor')
+    if reactor is None or getattr(reactor, '_asyncioEventloop', None) is None:
+        return
+
+    def take_over_signal():
+        # Twisted installs its own handlers during startup; ours has to come after
+        signal.signal(signal.SIGTERM, lambda signum, frame: reactor.callFromThread(begin_drain, reactor))
+
+    reactor.callWhenRunning(take_over_signal)
+
+
+def begin_drain(reactor):
+    global draining
+    if draining:
+        logger.warning('Second SIGTERM while draining; stopping now')
+        reactor.stop()
+        return
+    draining = True
+
+    from twisted.internet.tcp import Port
+    for reader in list(reactor.getReaders()):
+        if isinstance(reader, Port):
+            reader.stopListening()
+
+    logger.info('Draining %d socket(s)', len(_consumers))
+    task = asyncio.ensure_future(drain_all(), loop=reactor._asyncioEventloop)
+    task.add_done_callback(lambda _: reactor.stop())
+
+
+async def drain_all():
+    """Drain every registered consumer, giving up after DRAIN_TIMEOUT seconds"""
+    consumers = list(_consumers)
+    if not consumers:
+        return
+    with metrics.DRAIN_SECONDS.time():
+        done, pending = await asyncio.wait(
+            [asyncio.ensure_future(consumer.drain(reconnect_delay_ms())) for consumer in consumers],
+            timeout=settings.DRAIN_TIMEOUT
+        )
+    metrics.DRAINED_SOCKETS.inc(len(done), outcome='drained')
+    if pending:
+        metrics.DRAINED_SOCKETS.inc(len(pending), outcome='timed_out')
+        logger.warning('%d socket(s) did not drain within %ss', len(pending), settings.DRAIN_TIMEOUT)
+        for task in pending:
+            task.cancel()
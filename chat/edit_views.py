@@ -0,0 +1,30 @@
+# chat/edit_views.py
+
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_safe
+from .edits import history
+from .models import ChatRoom, Message
+from .retention import unexpired
+
+
+@login_required
+@require_safe
+def message_history(request, room_id, message_id):
+    """Every version of a message, oldest first, for the room's participants"""
+    # Membership on the primary (ChatRoom is never routed), then the history itself
+    if not ChatRoom.objects.filter(id=room_id, participants=request.user).exists():
+        return JsonResponse({'error': 'Message not found'}, status=404)
+    message = unexpired(Message.objects.filter(
+        id=message_id, chat_room_id=room_id
+    )).only('id', 'encrypted_content', 'edited_at').first()
+    if message is None:
+        return JsonResponse({'error': 'Message not found'}, status=404)
+
+    return JsonResponse({
+        'message_id': message.id,
+        'versions': [
+            {'content': content, 'replaced_at': replaced_at.isoformat() if replaced_at else None}
+            for content, replaced_at in history(message)
+        ],
+    })
@@ -0,0 +1,119 @@
+# chat/edits.py
+# Message edits and deletions, and syncing them to clients
+#
+# Every change takes the next number in its room's change sequence
+# (ChatRoom.change_seq, bumped under the room row's lock) and is stored as a
+# MessageRevision holding only what the change replaced. The ciphertext is opaque
+# here, so an edit keeps the previous content whole rather than a diff. A deletion
+# clears the message to a tombstone (deleted_at) and drops its earlier revisions,
+# attachments and reactions, so nothing of it is left to read back. Its replies stay,
+# and a deleted reply drops out of its parent's reply count (chat.reactions).
+#
+# Sockets get small delta frames ('edited' with the new content, 'deleted' with the
+# id), each stamped with its seq. A reconnecting client passes the highest seq it
+# saw and is sent the changes after it, collapsed to one per message, instead of
+# re-reading history to find out what changed.
+
+from django.db import connection, transaction
+from django.utils import timezone
+from . import reactions, tasks
+from .models import Attachment, ChatRoom, Message, MessageRevision, Reaction
+
+
+def _next_seq(room_id):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {ChatRoom._meta.db_table} SET change_seq = change_seq + 1 WHERE id = %s RETURNING change_seq',
+            [room_id]
+        )
+        return cursor.fetchone()[0]
+
+
+def _own_message(room_id, user_id, message_id):
+    """Lock a live message of this sender in this room, or None"""
+    return (
+        Message.objects.select_for_update()
+        .filter(id=message_id, chat_room_id=room_id, sender_id=user_id, deleted_at__isnull=True)
+        .only('id', 'message_type', 'encrypted_content', 'reply_to_id')
+        .first()
+    )
+
+
+def edit_message(room_id, user_id, message_id, content):
+    """Replace the content of a sender's own text message; returns the 'edited' frame or None"""
+    with transaction.atomic():
+        message = _own_message(room_id, user_id, message_id)
+        if message is None or message.message_type != 'text':
+            return None
+        seq = _next_seq(room_id)
+        edited_at = timezone.now()
+        MessageRevision.objects.create(
+            message_id=message.id, chat_room_id=room_id, seq=seq, kind='edit',
+            previous_content=message.encrypted_content,
+        )
+        Message.objects.filter(id=message.id).update(encrypted_content=content, is_edited=True, edited_at=edited_at)
+    return edited_frame(message.id, content, edited_at, seq)
+
+
+def delete_message(room_id, user_id, message_id):
+    """Delete a sender's own message down to a tombstone; returns the 'deleted' frame or None"""
+    with transaction.atomic():
+        message = _own_message(room_id, user_id, message_id)
+        if message is None:
+            return None
+        seq = _next_seq(room_id)
+        MessageRevision.objects.filter(message_id=message.id).delete()
+        MessageRevision.objects.create(message_id=message.id, chat_room_id=room_id, seq=seq, kind='delete')
+        Message.objects.filter(id=message.id).update(encrypted_content='', deleted_at=timezone.now(), reaction_counts=None)
+        Reaction.objects.filter(message_id=message.id).delete()
+        if message.reply_to_id is not None:
+            reactions.schedule_refresh(message.reply_to_id)
+        attached = Attachment.objects.filter(message_id=message.id)
+        files = list(attached.values_list('url', flat=True))
+        if files:
+            attached.delete()
+            tasks.delete_files.enqueue(urls=files)
+    return deleted_frame([message.id], seq)
+
+
+def edited_frame(message_id, content, edited_at, seq):
+    return {
+        'type': 'edited',
+        'message_id': message_id,
+        'message': content,
+        'edited_at': edited_at.isoformat(),
+        'seq': seq,
+    }
+
+
+def deleted_frame(message_ids, seq):
+    return {'type': 'deleted', 'message_ids': message_ids, 'seq': seq}
+
+
+def changes_since(room_id, seq, limit):
+    """
+    Frames for the room's changes after seq, one per message (its latest), in seq
+    order. More than limit changes return None: the client should reload instead.
+    """
+    revisions = list(
+        MessageRevision.objects.filter(chat_room_id=room_id, seq__gt=seq)
+        .select_related('message').only('seq', 'kind', 'message__encrypted_content', 'message__edited_at')
+        .order_by('seq')[:limit + 1]
+    )
+    if len(revisions) > limit:
+        return None
+    latest = {revision.message_id: revision for revision in revisions}
+    frames = []
+    for revision in sorted(latest.values(), key=lambda revision: revision.seq):
+        if revision.kind == 'delete':
+            frames.append(deleted_frame([revision.message_id], revision.seq))
+        else:
+            message = revision.message
+            frames.append(edited_frame(revision.message_id, message.encrypted_content, message.edited_at, revision.seq))
+    return frames
+
+
+def history(message):
+    """Every version of a message, oldest first: (content, replaced_at or None for the current one)"""
+    revisions = message.revisions.filter(kind='edit').order_by('seq').values_list('previous_content', 'created_at')
+    return [*revisions, (message.encrypted_content, None)]
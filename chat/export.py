@@ -0,0 +1,271 @@
+# chat/export.py
+# Room history export: NDJSON, or a ZIP that also carries the attachments
+#
+# Messages are read through a server-side cursor (iterator(chunk_size=EXPORT_CHUNK_SIZE))
+# and written out one chunk at a time, so memory stays flat whatever the room size.
+# The streamed ZIP is written with data descriptors into a sink that is emptied after
+# every chunk; nothing is seeked or held whole.
+#
+# Very large exports run as RoomExport jobs, in the chat.tasks.run_exports task (or
+# `manage.py run_exports`). A job appends to its own work directory and checkpoints the
+# last message id and byte offset after every chunk, so a job whose process died is
+# picked up again and resumes there.
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from .models import Attachment, Message, RoomExport
+from .retention import unexpired
+from .storage import open_chat_file
+
+logger = logging.getLogger('chat.export')
+
+COPY_SIZE = 64 * 1024
+FIELDS = (
+    'id', 'sender_id', 'sender__username', 'message_type', 'encrypted_content', 'timestamp', 'edited_at', 'expires_at',
+    'reply_to_id', 'reaction_counts', 'reply_count',
+)
+ATTACHMENT_FIELDS = ('message_id', 'position', 'name', 'size', 'mime_type', 'sha256')
+
+
+def _rows(queryset, *fields):
+    return queryset.order_by('id').values_list(*fields).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def message_batches(room_id, after=0):
+    """Lists of up to EXPORT_CHUNK_SIZE message rows with id > after, oldest first"""
+    batch = []
+    for row in _rows(unexpired(Message.objects.filter(chat_room_id=room_id, id__gt=after)), *FIELDS):
+        batch.append(row)
+        if len(batch) >= settings.EXPORT_CHUNK_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def encode(rows):
+    """NDJSON lines for a batch of message rows (one query for their attachments)"""
+    files = {}
+    attached = Attachment.objects.filter(message_id__in=[row[0] for row in rows]).order_by('message_id', 'position')
+    for message_id, position, name, size, mime_type, sha256 in attached.values_list(*ATTACHMENT_FIELDS):
+        files.setdefault(message_id, []).append({
+            'name': name,
+            'size': size,
+            'mime_type': mime_type,
+            'sha256': sha256,
+            'path': media_name(message_id, position, name),
+        })
+
+    lines = []
+    for message_id, sender_id, sender, message_type, content, timestamp, edited_at, expires_at, \
+            reply_to, reactions, reply_count in rows:
+        attachments = files.get(message_id, [])
+        first = attachments[0] if attachments else {}
+        lines.append(json.dumps({
+            'id': message_id,
+            'sender_id': sender_id,
+            'sender': sender,
+            'type': message_type,
+            'content': content,
+            'timestamp': timestamp.isoformat(),
+            'edited_at': edited_at.isoformat() if edited_at else None,
+            'expires_at': expires_at.isoformat() if expires_at else None,
+            'reply_to': reply_to,
+            'reactions': reactions or {},
+            'reply_count': reply_count,
+            'attachments': attachments,
+            # The first attachment again, as exports written before multiple attachments had it
+            'file_name': first.get('name'),
+            'file_size': first.get('size'),
+            'attachment': first.get('path'),
+        }))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def media_name(message_id, position, file_name):
+    """Path of an attachment inside a ZIP export"""
+    suffix = f'{position}-' if position else ''
+    return f"media/{message_id}-{suffix}{get_valid_filename(file_name or 'file')}"
+
+
+def attachments(room_id):
+    """(message id, position, url, file name) of every attachment in the room, oldest first"""
+    messages = unexpired(Message.objects.filter(chat_room_id=room_id)).values('id')
+    return _rows(Attachment.objects.filter(message_id__in=messages), 'message_id', 'position', 'url', 'name')
+
+
+def ndjson_chunks(room_id):
+    for rows in message_batches(room_id):
+        yield encode(rows)
+
+
+class _Sink:
+    """Write-only stream for ZipFile; zipfile falls back to data descriptors when it can't seek"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def zip_chunks(room_id):
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open('messages.ndjson', 'w', force_zip64=True) as entry:
+            for rows in message_batches(room_id):
+                entry.write(encode(rows))
+                yield sink.drain()
+
+        for message_id, position, url, file_name in attachments(room_id):
+            info = zipfile.ZipInfo(media_name(message_id, position, file_name), timezone.now().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_STORED  # Media is already compressed
+            try:
+                source = open_chat_file(url)
+            except OSError as e:
+                logger.warning('Export of room %s skips attachment %s: %s', room_id, message_id, e)
+                continue
+            with source, archive.open(info, 'w', force_zip64=True) as entry:
+                while True:
+                    data = source.read(COPY_SIZE)
+                    if not data:
+                        break
+                    entry.write(data)
+                    yield sink.drain()
+    yield sink.drain()
+
+
+def _close(chunks):
+    chunks.close()
+    # The cursor and connection belong to this thread; hand the connection back
+    connections.close_all()
+
+
+async def aiter_chunks(chunks):
+    """
+    Drive a synchronous chunk generator from ASGI. A server-side cursor lives on one
+    connection and Django connections are per thread, so every step runs on the same
+    dedicated thread rather than whichever one sync_to_async picks.
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='export')
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            chunk = await loop.run_in_executor(executor, next, chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                yield chunk
+    finally:
+        await loop.run_in_executor(executor, _close, chunks)
+        executor.shutdown(wait=False)
+
+
+# -- Background jobs ----------------------------------------------------------
+
+def workdir(export):
+    return Path(settings.EXPORT_ROOT) / str(export.id)
+
+
+def claim_export():
+    """Take the oldest pending export, or one whose runner stopped checkpointing"""
+    stale = timezone.now() - timedelta(seconds=settings.EXPORT_STALE_AFTER)
+    with transaction.atomic():
+        export = RoomExport.objects.select_for_update(skip_locked=True).filter(
+            Q(status='pending') | Q(status='running', updated_at__lt=stale)
+        ).order_by('id').first()
+        if export is not None:
+            export.status = 'running'
+            export.attempts += 1
+            export.save(update_fields=['status', 'attempts', 'updated_at'])
+    return export
+
+
+def run_export(export):
+    """Run (or resume) an export job to completion"""
+    directory = workdir(export)
+    directory.mkdir(parents=True, exist_ok=True)
+    try:
+        _write_messages(export, directory)
+        if export.format == 'zip':
+            _fetch_attachments(export, directory)
+            _assemble_zip(directory)
+            export.artifact = 'export.zip'
+        else:
+            export.artifact = 'messages.ndjson'
+    except Exception as e:
+        logger.exception('Export %s failed', export.id)
+        if export.attempts >= settings.EXPORT_MAX_ATTEMPTS:
+            export.status = 'failed'
+        export.error = str(e)
+        export.save(update_fields=['status', 'error', 'updated_at'])
+        return
+
+    export.status = 'done'
+    export.finished_at = timezone.now()
+    export.save(update_fields=['status', 'artifact', 'finished_at', 'updated_at'])
+
+
+def _write_messages(export, directory):
+    with open(directory / 'messages.ndjson', 'ab') as out:
+        # Drop anything written after the last checkpoint, then carry on from it
+        out.truncate(export.bytes_written)
+        for rows in message_batches(export.chat_room_id, export.last_message_id):
+            out.write(encode(rows))
+            out.flush()
+            os.fsync(out.fileno())
+            export.last_message_id = rows[-1][0]
+            export.bytes_written = out.tell()
+            export.message_count += len(rows)
+            export.save(update_fields=['last_message_id', 'bytes_written', 'message_count', 'updated_at'])
+
+
+def _fetch_attachments(export, directory):
+    for message_id, position, url, file_name in attachments(export.chat_room_id):
+        target = directory / media_name(message_id, position, file_name)
+        if target.exists():
+            continue  # Fetched by an earlier attempt
+        target.parent.mkdir(exist_ok=True)
+        partial = target.with_name(target.name + '.part')
+        try:
+            with open_chat_file(url) as source, open(partial, 'wb') as out:
+                shutil.copyfileobj(source, out, COPY_SIZE)
+        except OSError as e:
+            logger.warning('Export %s skips attachment %s: %s', export.id, message_id, e)
+            continue
+        os.replace(partial, target)
+        # Also the runner's heartbeat: a job that stops touching updated_at is taken over
+        export.save(update_fields=['updated_at'])
+
+
+def _assemble_zip(directory):
+    partial = directory / 'export.zip.part'
+    with zipfile.ZipFile(partial, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        archive.write(directory / 'messages.ndjson', 'messages.ndjson')
+        media = directory / 'media'
+        if media.exists():
+            for path in sorted(media.iterdir()):
+                if not path.name.endswith('.part'):
+                    archive.write(path, f'media/{path.name}', compress_type=zipfile.ZIP_STORED)
+    os.replace(partial, directory / 'export.zip')
@@ -0,0 +1,102 @@
+# chat/export_views.py
+
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods, require_safe
+from .export import aiter_chunks, ndjson_chunks, workdir, zip_chunks
+from .media_views import _aiter_range, _iter_range
+from .models import ChatRoom, RoomExport
+from .tasks import run_exports
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'zip': 'application/zip',
+}
+
+
+def _exportable_room(request, room_id):
+    """Participants export their rooms; staff (compliance) can export any room"""
+    rooms = ChatRoom.objects.filter(id=room_id)
+    if not request.user.is_staff:
+        rooms = rooms.filter(participants=request.user)
+    return rooms.only('id').first()
+
+
+def _status(export):
+    data = {
+        'id': export.id,
+        'room_id': export.chat_room_id,
+        'format': export.format,
+        'status': export.status,
+        'message_count': export.message_count,
+        'bytes_written': export.bytes_written,
+        'error': export.error or None,
+    }
+    if export.status == 'done':
+        data['download_url'] = reverse('chat:export_status', args=[export.id]) + '?download=1'
+    return data
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def export_room(request, room_id):
+    """Stream a room export (GET), or queue it as a resumable background job (POST)"""
+    room = _exportable_room(request, room_id)
+    if room is None:
+        return JsonResponse({'error': 'Chat room not found'}, status=404)
+
+    export_format = (request.GET if request.method == 'GET' else request.POST).get('format', 'ndjson')
+    if export_format not in CONTENT_TYPES:
+        return JsonResponse({'error': f"Unknown format. Use one of: {', '.join(CONTENT_TYPES)}"}, status=400)
+
+    if request.method == 'POST':
+        with transaction.atomic():
+            export = RoomExport.objects.create(chat_room=room, requested_by=request.user, format=export_format)
+            # Keyed: one queued runner drains every pending export
+            run_exports.enqueue(key='chat.run_exports')
+        response = JsonResponse(_status(export), status=202)
+        response['Location'] = reverse('chat:export_status', args=[export.id])
+        return response
+
+    chunks = zip_chunks(room.id) if export_format == 'zip' else ndjson_chunks(room.id)
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[export_format])
+    filename = f"room-{room.id}-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
+@login_required
+@require_safe
+def export_status(request, export_id):
+    """Progress of a background export, or its file once done (?download=1)"""
+    exports = RoomExport.objects.filter(id=export_id)
+    if not request.user.is_staff:
+        exports = exports.filter(requested_by=request.user)
+    export = exports.first()
+    if export is None:
+        return JsonResponse({'error': 'Export not found'}, status=404)
+
+    if 'download' not in request.GET:
+        return JsonResponse(_status(export))
+    if export.status != 'done':
+        return JsonResponse({'error': 'Export is not finished'}, status=409)
+
+    path = workdir(export) / export.artifact
+    try:
+        handle = open(path, 'rb')
+    except FileNotFoundError:
+        raise Http404('Export file is gone')
+    size = path.stat().st_size
+    iterator = _aiter_range if isinstance(request, ASGIRequest) else _iter_range
+    response = StreamingHttpResponse(iterator(handle, 0, size), content_type=CONTENT_TYPES[export.format])
+    response['Content-Length'] = str(size)
+    response['Content-Disposition'] = f'attachment; filename="room-{export.chat_room_id}-export-{export.id}.{export.format}"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
@@ -0,0 +1,130 @@
+# chat/group_views.py
+
+import json
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+from .membership import add_participants, remove_participants, touch_room, broadcast_membership_change
+from .models import ChatRoom
+
+User = get_user_model()
+
+
+def _read_list(request, plural, singular):
+    """Read a list of values from a JSON body or form data"""
+    if request.content_type == 'application/json':
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        values = payload.get(plural)
+        if values is None and payload.get(singular) is not None:
+            values = [payload[singular]]
+        values = values or []
+        if not isinstance(values, list):
+            return None
+    else:
+        values = request.POST.getlist(plural) or request.POST.getlist(singular)
+    return values
+
+
+def _get_group(request, room_id):
+    """Fetch a group room the current user belongs to"""
+    return ChatRoom.objects.filter(
+        id=room_id,
+        room_type='group',
+        is_active=True,
+        participants=request.user
+    ).first()
+
+
+@login_required
+@require_POST
+def invite_members(request, room_id):
+    """Add a batch of users (by email) to a group chat"""
+    room = _get_group(request, room_id)
+    if room is None:
+        return JsonResponse({'error': 'Group not found'}, status=404)
+
+    emails = _read_list(request, 'emails', 'email')
+    if emails is None:
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
+
+    emails = {str(email).strip() for email in emails if str(email).strip()}
+    if not emails:
+        return JsonResponse({'error': 'No users provided'}, status=400)
+    if len(emails) > settings.MAX_MEMBERSHIP_BATCH:
+        return JsonResponse({
+            'error': f'Too many users in one request. Max: {settings.MAX_MEMBERSHIP_BATCH}'
+        }, status=400)
+
+    users = {user.id: user for user in User.objects.filter(email__in=emails).only('id', 'email', 'username')}
+
+    with transaction.atomic():
+        added_ids = add_participants(room, users.keys())
+        if added_ids:
+            touch_room(room)
+            broadcast_membership_change(room, added=[users[user_id] for user_id in added_ids])
+
+    found = {user.email for user in users.values()}
+    return JsonResponse({
+        'success': True,
+        'added': added_ids,
+        'not_found': sorted(emails - found),
+    })
+
+
+@login_required
+@require_POST
+def remove_members(request, room_id):
+    """Remove a batch of users (by id) from a group chat - creator only"""
+    room = _get_group(request, room_id)
+    if room is None:
+        return JsonResponse({'error': 'Group not found'}, status=404)
+
+    if room.created_by_id != request.user.id:
+        return JsonResponse({'error': 'Only the group creator can remove members'}, status=403)
+
+    user_ids = _read_list(request, 'user_ids', 'user_id')
+    if user_ids is None:
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
+
+    try:
+        user_ids = {int(user_id) for user_id in user_ids}
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Invalid user id'}, status=400)
+
+    user_ids.discard(room.created_by_id)
+    if not user_ids:
+        return JsonResponse({'error': 'No users provided'}, status=400)
+    if len(user_ids) > settings.MAX_MEMBERSHIP_BATCH:
+        return JsonResponse({
+            'error': f'Too many users in one request. Max: {settings.MAX_MEMBERSHIP_BATCH}'
+        }, status=400)
+
+    with transaction.atomic():
+        removed_ids = remove_participants(room, user_ids)
+        if removed_ids:
+            touch_room(room)
+            broadcast_membership_change(room, removed=removed_ids)
+
+    return JsonResponse({'success': True, 'removed': removed_ids})
+
+
+@login_required
+@require_POST
+def leave_group(request, room_id):
+    """Remove the current user from a group chat"""
+    room = _get_group(request, room_id)
+    if room is None:
+        return JsonResponse({'error': 'Group not found'}, status=404)
+
+    with transaction.atomic():
+        remove_participants(room, [request.user.id])
+        touch_room(room)
+        broadcast_membership_change(room, removed=[request.user.id])
+
+    return JsonResponse({'success': True})
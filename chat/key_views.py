@@ -0,0 +1,105 @@
+# chat/key_views.py
+
+import hashlib
+import json
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import JsonResponse, HttpResponseNotModified
+from django.views.decorators.http import require_http_methods
+from .keys import get_key_directory
+from .membership import Membership, room_group_name
+from .models import ChatRoom, RoomKey
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def room_keys(request, room_id):
+    """Key directory for a room (GET) and bulk upload of wrapped room keys (POST)"""
+    room = ChatRoom.objects.filter(id=room_id, participants=request.user).only('id', 'key_epoch').first()
+    if room is None:
+        return JsonResponse({'error': 'Chat room not found'}, status=404)
+
+    if request.method == 'POST':
+        return _upload_wrapped_keys(request, room)
+
+    directory = get_key_directory(room.id)
+    wrapped_key = RoomKey.objects.filter(
+        chat_room_id=room.id,
+        recipient=request.user,
+        epoch=room.key_epoch
+    ).values_list('wrapped_key', flat=True).first()
+
+    # One round trip per join: public keys of every member plus our own wrapped room key
+    wrapped_hash = hashlib.sha256((wrapped_key or '').encode()).hexdigest()[:8]
+    etag = f'"{directory["version"]}-{room.key_epoch}-{wrapped_hash}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse({
+            'version': directory['version'],
+            'epoch': room.key_epoch,
+            'keys': directory['keys'],
+            'wrapped_key': wrapped_key,
+        })
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _upload_wrapped_keys(request, room):
+    """Store wrapped keys for many members at once, optionally rotating to a new epoch"""
+    try:
+        payload = json.loads(request.body or b'{}')
+        epoch = int(payload['epoch'])
+        keys = {int(user_id): str(wrapped) for user_id, wrapped in payload['keys'].items()}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
+
+    if not keys:
+        return JsonResponse({'error': 'No keys provided'}, status=400)
+    if len(keys) > settings.MAX_MEMBERSHIP_BATCH:
+        return JsonResponse({
+            'error': f'Too many keys in one request. Max: {settings.MAX_MEMBERSHIP_BATCH}'
+        }, status=400)
+
+    with transaction.atomic():
+        # Lock the room row so concurrent rotations cannot both claim the same epoch
+        current_epoch = ChatRoom.objects.select_for_update().values_list('key_epoch', flat=True).get(id=room.id)
+        if epoch not in (current_epoch, current_epoch + 1):
+            return JsonResponse({
+                'error': 'Stale or invalid epoch',
+                'epoch': current_epoch
+            }, status=409)
+
+        members = set(
+            Membership.objects.filter(chatroom_id=room.id, user_id__in=keys.keys())
+            .values_list('user_id', flat=True)
+        )
+        unknown = sorted(set(keys) - members)
+        if unknown:
+            return JsonResponse({'error': 'Not room participants', 'user_ids': unknown}, status=400)
+
+        # Existing keys for an epoch are immutable; re-uploads are ignored
+        RoomKey.objects.bulk_create([
+            RoomKey(
+                chat_room_id=room.id,
+                recipient_id=user_id,
+                epoch=epoch,
+                wrapped_key=wrapped,
+                created_by=request.user
+            )
+            for user_id, wrapped in keys.items()
+        ], ignore_conflicts=True)
+
+        if epoch != current_epoch:
+            ChatRoom.objects.filter(id=room.id).update(key_epoch=epoch)
+            channel_layer = get_channel_layer()
+            transaction.on_commit(lambda: async_to_sync(channel_layer.group_send)(
+                room_group_name(room.id),
+                {'type': 'key_update', 'epoch': epoch}
+            ))
+
+    return JsonResponse({'success': True, 'epoch': epoch, 'stored': len(keys)})
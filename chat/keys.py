@@ -0,0 +1,43 @@
+# chat/keys.py
+# Public-key directory for rooms, cached per room and versioned by content hash
+
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from .models import ChatRoom
+
+
+def _cache():
+    return caches[settings.KEY_DIRECTORY_CACHE]
+
+
+def _cache_key(room_id):
+    return f'keydir:{room_id}'
+
+
+def get_key_directory(room_id):
+    """Return {'version', 'keys'} for every participant of a room (one query on a miss)"""
+    directory = _cache().get(_cache_key(room_id))
+    if directory is None:
+        keys = list(
+            ChatRoom.participants.through.objects.filter(chatroom_id=room_id)
+            .order_by('user_id')
+            .values_list('user_id', 'user__username', 'user__public_key')
+        )
+        keys = [
+            {'user_id': user_id, 'username': username, 'public_key': public_key}
+            for user_id, username, public_key in keys
+        ]
+        version = hashlib.sha256(json.dumps(keys, sort_keys=True).encode()).hexdigest()[:16]
+        directory = {'version': version, 'keys': keys}
+        _cache().set(_cache_key(room_id), directory, settings.KEY_DIRECTORY_CACHE_TTL)
+    return directory
+
+
+def invalidate_key_directory(room_ids):
+    """Drop cached directories after membership or public-key changes, once they commit"""
+    keys = [_cache_key(room_id) for room_id in room_ids]
+    # Dropped any earlier, a concurrent read could cache the old membership again
+    transaction.on_commit(lambda: _cache().delete_many(keys))
@@ -0,0 +1,69 @@
+# chat/management/commands/bench_message_heap.py
+
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from chat.models import Message
+
+
+def _mb(size):
+    return f'{size / 2 ** 20:,.1f} MB'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the message heap: size on disk, bytes per row and sequential scan speed. '
+        'Rows are copied into a temporary table first, so the figures show the current '
+        'column layout freshly written, as after a rewrite, and the live table is only read.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Copy at most this many messages (lowest ids first)')
+        parser.add_argument('--runs', type=int, default=5, help='Timed scans; the best and the median are reported')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('bench_message_heap needs PostgreSQL')
+        table = Message._meta.db_table
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_relation_size(%s), pg_total_relation_size(%s) - pg_relation_size(%s) - pg_indexes_size(%s), '
+                'pg_indexes_size(%s), (SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass)',
+                [table] * 6,
+            )
+            heap, toast, indexes, estimate = cursor.fetchone()
+            self.stdout.write(
+                f'{table}: ~{estimate:,} rows, heap {_mb(heap)}, TOAST {_mb(toast)}, indexes {_mb(indexes)} '
+                '(dropped columns keep their bytes here until rows are rewritten)'
+            )
+
+            cursor.execute('SET LOCAL max_parallel_workers_per_gather = 0')
+            cursor.execute(f'CREATE TEMP TABLE bench_message ON COMMIT DROP AS SELECT * FROM {table} ORDER BY id LIMIT %s',
+                           [options['rows']])
+            cursor.execute(
+                "SELECT count(*), pg_relation_size('bench_message'), COALESCE(avg(pg_column_size(b.*)), 0), "
+                "(SELECT count(*) FROM information_schema.columns WHERE table_name = 'bench_message') "
+                'FROM bench_message b'
+            )
+            rows, size, width, columns = cursor.fetchone()
+            if not rows:
+                raise CommandError('There are no messages to measure')
+            self.stdout.write(
+                f'Rewritten: {rows:,} rows x {columns} columns, heap {_mb(size)} '
+                f'({size / rows:,.1f} bytes/row on disk, {width:,.1f} bytes/tuple)'
+            )
+
+            # Filtering on the last column makes every tuple be deformed in full
+            timings = []
+            for _ in range(options['runs']):
+                start = time.perf_counter()
+                cursor.execute('SELECT count(*) FROM bench_message WHERE expires_at IS NOT NULL')
+                cursor.fetchone()
+                timings.append(time.perf_counter() - start)
+            best, median = min(timings), statistics.median(timings)
+            self.stdout.write(self.style.SUCCESS(
+                f'Sequential scan: best {best * 1000:,.1f} ms, median {median * 1000:,.1f} ms '
+                f'({rows / best / 1e6:,.2f}M rows/s, {size / best / 2 ** 20:,.0f} MB/s)'
+            ))
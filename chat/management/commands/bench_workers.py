@@ -0,0 +1,112 @@
+# chat/management/commands/bench_workers.py
+
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _client(port, path, stop_at, latencies):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    request = f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode()
+    try:
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            writer.write(request)
+            headers = await reader.readuntil(b'\r\n\r\n')
+            length = 0
+            for line in headers.split(b'\r\n'):
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':', 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+def _load(port, path, concurrency, duration):
+    """Keep-alive HTTP load from one client process; returns request latencies"""
+    async def run():
+        latencies = []
+        stop_at = time.perf_counter() + duration
+        await asyncio.gather(*(_client(port, path, stop_at, latencies) for _ in range(concurrency)))
+        return latencies
+    return asyncio.run(run())
+
+
+class Command(BaseCommand):
+    help = 'Measure how HTTP throughput scales with the number of `serve` workers on this box'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,2,4', help='Comma-separated worker counts to compare')
+        parser.add_argument('--path', default='/accounts/login/')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per worker count')
+        parser.add_argument('--concurrency', type=int, default=32, help='Keep-alive connections per client process')
+        parser.add_argument('--client-processes', type=int, default=max(os.cpu_count() // 2, 1))
+
+    def handle(self, *args, **options):
+        counts = [int(count) for count in options['workers'].split(',')]
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        self.stdout.write(
+            f"{os.cpu_count()} CPU(s); {options['client_processes']} client process(es) x "
+            f"{options['concurrency']} connections on {options['path']} for {options['duration']:.0f}s each "
+            '(clients share the box, so leave cores free for them)'
+        )
+
+        results = []
+        for count in counts:
+            port = _free_port()
+            server = subprocess.Popen(
+                [sys.executable, 'manage.py', 'serve', '--workers', str(count),
+                 '--bind', f'127.0.0.1:{port}', '--allow-inmemory-layer'],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                self.wait_for_workers(port, count)
+                with multiprocessing.Pool(options['client_processes']) as pool:
+                    batches = pool.starmap(_load, [
+                        (port, options['path'], options['concurrency'], options['duration'])
+                    ] * options['client_processes'])
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait()
+
+            latencies = sorted(latency for batch in batches for latency in batch)
+            if not latencies:
+                raise CommandError(f'No requests completed with {count} worker(s)')
+            rate = len(latencies) / options['duration']
+            p99 = latencies[int(len(latencies) * 0.99) - 1]
+            results.append((count, rate, statistics.median(latencies), p99))
+
+        base_rate = results[0][1]
+        self.stdout.write(f"\n{'workers':>8} {'req/s':>10} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        for count, rate, p50, p99 in results:
+            self.stdout.write(f'{count:>8} {rate:>10.0f} {rate / base_rate:>7.2f}x {p50 * 1000:>8.1f} {p99 * 1000:>8.1f}')
+
+    def wait_for_workers(self, port, count, timeout=120):
+        """Poll /healthz until every worker has answered at least once"""
+        pids = set()
+        deadline = time.monotonic() + timeout
+        while len(pids) < count:
+            if time.monotonic() > deadline:
+                raise CommandError(f'Only {len(pids)} of {count} workers came up')
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/healthz', timeout=2) as response:
+                    pids.add(json.load(response)['pid'])
+            except OSError:
+                time.sleep(0.2)
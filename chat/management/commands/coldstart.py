@@ -0,0 +1,123 @@
+# chat/management/commands/coldstart.py
+
+import base64
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from chat.models import ChatRoom
+
+User = get_user_model()
+
+POLL_INTERVAL = 0.005
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_listen(port, process, deadline):
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'daphne exited with status {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(POLL_INTERVAL)
+    raise CommandError('daphne did not start listening in time')
+
+
+def _request(port, request):
+    """Send a raw HTTP request and return the status line"""
+    with socket.create_connection(('127.0.0.1', port), timeout=30) as sock:
+        sock.sendall(request.encode())
+        response = b''
+        while b'\r\n' not in response:
+            data = sock.recv(4096)
+            if not data:
+                break
+            response += data
+    return response.split(b'\r\n', 1)[0].decode()
+
+
+class Command(BaseCommand):
+    help = 'Measure time from process spawn to the first accepted WebSocket of a fresh daphne worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='Participant to connect as (default: first user in a room)')
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--timeout', type=float, default=60.0)
+        parser.add_argument('--no-warmup', action='store_true', help='Start workers with WARMUP_ON_STARTUP=False')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(email=options['email']) if options['email'] else User.objects.filter(chat_rooms__isnull=False)
+        user = users.first()
+        if user is None:
+            raise CommandError('No user with a chat room to connect as')
+        room = ChatRoom.objects.filter(participants=user).order_by('id').first()
+        if room is None:
+            raise CommandError(f'{user.email} is not in any room')
+
+        client = Client()
+        client.force_login(user)
+        session_id = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        if options['no_warmup']:
+            env['WARMUP_ON_STARTUP'] = 'False'
+
+        results = []
+        for run in range(options['runs']):
+            port = _free_port()
+            key = base64.b64encode(os.urandom(16)).decode()
+            handshake = (
+                f'GET /ws/chat/{room.id}/ HTTP/1.1\r\n'
+                f'Host: 127.0.0.1:{port}\r\n'
+                f'Origin: http://127.0.0.1:{port}\r\n'
+                'Upgrade: websocket\r\n'
+                'Connection: Upgrade\r\n'
+                f'Sec-WebSocket-Key: {key}\r\n'
+                'Sec-WebSocket-Version: 13\r\n'
+                f'Cookie: {settings.SESSION_COOKIE_NAME}={session_id}\r\n\r\n'
+            )
+
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port), 'private_chat_app.asgi:application'],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                _wait_for_listen(port, process, start + options['timeout'])
+                listening = time.perf_counter() - start
+
+                status = _request(port, handshake)
+                if ' 101 ' not in f'{status} ':
+                    raise CommandError(f'WebSocket was not accepted: {status}')
+                first_socket = time.perf_counter() - start
+
+                _request(port, f'GET /accounts/login/ HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nConnection: close\r\n\r\n')
+                first_http = time.perf_counter() - start
+            finally:
+                process.terminate()
+                process.wait()
+
+            results.append((listening, first_socket, first_http))
+            self.stdout.write(
+                f'run {run + 1}: listening {listening * 1000:.0f}ms, '
+                f'first socket accepted {first_socket * 1000:.0f}ms, first HTTP response {first_http * 1000:.0f}ms'
+            )
+
+        listening, first_socket, first_http = (statistics.median(column) for column in zip(*results))
+        self.stdout.write(self.style.SUCCESS(
+            f'median: listening {listening * 1000:.0f}ms, '
+            f'time-to-first-accepted-socket {first_socket * 1000:.0f}ms, first HTTP response {first_http * 1000:.0f}ms'
+        ))
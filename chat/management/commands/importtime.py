@@ -0,0 +1,51 @@
+# chat/management/commands/importtime.py
+
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Report what a cold worker spends importing (python -X importtime)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', default='private_chat_app.asgi', help='Module a worker imports on startup')
+        parser.add_argument('--urlconf', action='store_true', help='Also import ROOT_URLCONF, as the first HTTP request does')
+        parser.add_argument('--top', type=int, default=20, help='Rows per table')
+
+    def handle(self, *args, **options):
+        code = f'import {options["target"]}'
+        if options['urlconf']:
+            code += f'; import {settings.ROOT_URLCONF}'
+
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE, WARMUP_ON_STARTUP='False')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+
+        modules = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+            modules.append((name.strip(), int(self_us), int(cumulative_us)))
+
+        packages = defaultdict(int)
+        for name, self_us, _ in modules:
+            packages[name.split('.')[0]] += self_us
+        total = sum(packages.values())
+
+        self.stdout.write(f'{len(modules)} modules imported in {total / 1000:.1f}ms ({code})\n')
+        self.stdout.write('By top-level package (self time):')
+        for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {self_us / 1000:8.1f}ms  {package}')
+
+        self.stdout.write('\nSlowest modules (self time):')
+        for name, self_us, cumulative_us in sorted(modules, key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {self_us / 1000:8.1f}ms  {name} (cumulative {cumulative_us / 1000:.1f}ms)')
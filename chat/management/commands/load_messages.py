@@ -0,0 +1,96 @@
+# chat/management/commands/load_messages.py
+
+import random
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from chat.bulkload import (
+    create_seed_rooms, create_seed_users, load, ndjson_messages, open_input, synthetic_messages, weights,
+)
+
+DISTRIBUTIONS = ['uniform', 'zipf']
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load message history from NDJSON, or seed synthetic rooms and messages, through Postgres COPY'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--ndjson', metavar='PATH', help="NDJSON file to import ('-' for stdin, .gz accepted)")
+        source.add_argument('--generate', type=int, metavar='N', help='Seed N synthetic messages')
+
+        parser.add_argument('--room', type=int, help='NDJSON: load every line into this existing room')
+        parser.add_argument('--users', type=int, default=1000, help='Synthetic users to create')
+        parser.add_argument('--rooms', type=int, default=100, help='Synthetic rooms to create')
+        parser.add_argument('--room-size', type=int, default=8, help='Largest room; sizes are drawn from 2..N')
+        parser.add_argument('--room-dist', choices=DISTRIBUTIONS, default='zipf', help='How messages spread over rooms')
+        parser.add_argument('--user-dist', choices=DISTRIBUTIONS, default='uniform', help='How users spread over rooms')
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent')
+        parser.add_argument('--days', type=float, default=365, help='History spans this many days up to now')
+        parser.add_argument('--file-ratio', type=float, default=0.0, help='Share of messages with an attachment')
+        parser.add_argument('--read-ratio', type=float, default=0.5, help='Share of messages with read receipts')
+        parser.add_argument('--receipts', type=int, default=1, help='Receipts per read message')
+        parser.add_argument('--content-bytes', type=int, default=96, help='Random ciphertext bytes per message')
+        parser.add_argument('--seed', type=int, help='Random seed, for repeatable data sets')
+
+        parser.add_argument('--batch-size', type=int, default=50000, help='Messages per COPY')
+        parser.add_argument('--keep-indexes', action='store_true',
+                            help='Maintain indexes during the load instead of rebuilding them after (slower, but readers are not blocked)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('load_messages needs PostgreSQL (it loads through COPY)')
+
+        def progress(messages, receipts, seconds):
+            self.stdout.write(f'  {messages:,} messages, {receipts:,} receipts ({(messages + receipts) / seconds:,.0f} rows/s)')
+            self.stdout.flush()
+
+        try:
+            with transaction.atomic():
+                if options['ndjson']:
+                    with open_input(options['ndjson']) as lines:
+                        stats = load(
+                            ndjson_messages(lines, options['room']),
+                            options['batch_size'], not options['keep_indexes'], progress,
+                        )
+                else:
+                    stats = self.seed(options, progress)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        rows = stats['messages'] + stats['attachments'] + stats['receipts']
+        self.stdout.write(
+            f"Copied {stats['messages']:,} messages, {stats['attachments']:,} attachments and {stats['receipts']:,} receipts "
+            f"into {stats['rooms']:,} room(s) "
+            f"in {stats['load_seconds']:.1f}s ({rows / max(stats['load_seconds'], 1e-9):,.0f} rows/s)"
+        )
+        if not options['keep_indexes']:
+            self.stdout.write(f"Rebuilt indexes and foreign keys in {stats['rebuild_seconds']:.1f}s")
+        self.stdout.write(f"Memberships, sequences and statistics in {stats['finish_seconds']:.1f}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"{rows:,} rows in {stats['total_seconds']:.1f}s ({rows / max(stats['total_seconds'], 1e-9):,.0f} rows/s end to end)"
+        ))
+
+    def seed(self, options, progress):
+        if options['users'] < 2 or options['rooms'] < 1:
+            raise CommandError('Seeding needs at least 2 users and 1 room')
+        rng = random.Random(options['seed'])
+        prefix = f'seed{int(time.time()):x}'
+
+        start = time.perf_counter()
+        user_ids = create_seed_users(options['users'], prefix)
+        user_weights = weights(len(user_ids), options['user_dist'], options['skew'])
+        rooms = create_seed_rooms(rng, user_ids, options['rooms'], options['room_size'], user_weights, prefix)
+        self.stdout.write(
+            f'Created {len(user_ids):,} users and {len(rooms):,} rooms ({prefix}-*) in {time.perf_counter() - start:.1f}s'
+        )
+
+        end = timezone.now()
+        messages = synthetic_messages(
+            rng, rooms, options['generate'], end - timedelta(days=options['days']), end,
+            weights(len(rooms), options['room_dist'], options['skew']),
+            options['file_ratio'], options['read_ratio'], options['receipts'], options['content_bytes'],
+        )
+        return load(messages, options['batch_size'], not options['keep_indexes'], progress)
@@ -0,0 +1,150 @@
+# chat/management/commands/perfcheck.py
+
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+
+LARGE_UPLOAD_IN_MEMORY = 10 * 1024 * 1024
+DRAIN_KILL_AFTER = 30  # `serve --graceful-timeout` default
+
+
+class Command(BaseCommand):
+    help = 'Flag performance-hostile settings in the active configuration'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fail-on-warning', action='store_true',
+            help='Exit non-zero on warnings as well as errors'
+        )
+
+    def handle(self, *args, **options):
+        self.errors = []
+        self.warnings = []
+
+        self.check_debug()
+        self.check_databases()
+        self.check_caches()
+        self.check_sessions()
+        self.check_templates()
+        self.check_static_files()
+        self.check_channel_layers()
+        self.check_websockets()
+        self.check_uploads()
+        self.check_profiling()
+        self.check_imports()
+
+        self.stdout.write(f'Settings module: {settings.SETTINGS_MODULE}')
+        for message in self.errors:
+            self.stdout.write(self.style.ERROR(f'ERROR    {message}'))
+        for message in self.warnings:
+            self.stdout.write(self.style.WARNING(f'WARNING  {message}'))
+
+        if not self.errors and not self.warnings:
+            self.stdout.write(self.style.SUCCESS('No performance issues found'))
+            return
+
+        summary = f'{len(self.errors)} error(s), {len(self.warnings)} warning(s)'
+        if self.errors or options['fail_on_warning']:
+            raise CommandError(summary)
+        self.stdout.write(summary)
+
+    def check_debug(self):
+        if settings.DEBUG:
+            self.errors.append('DEBUG is on: every query is kept in memory and error pages leak settings')
+
+    def check_databases(self):
+        for alias, db in settings.DATABASES.items():
+            max_age = db.get('CONN_MAX_AGE', 0)
+            pooled = db.get('ENGINE') == 'private_chat_app.db'
+            if pooled and max_age != 0:
+                self.warnings.append(f"DATABASES['{alias}']: CONN_MAX_AGE={max_age} keeps pooled connections pinned to request threads")
+            elif not pooled and max_age == 0:
+                self.warnings.append(f"DATABASES['{alias}']: CONN_MAX_AGE=0 without the private_chat_app.db pool opens a connection per request")
+            elif max_age != 0 and not db.get('CONN_HEALTH_CHECKS'):
+                self.warnings.append(f"DATABASES['{alias}']: persistent connections without CONN_HEALTH_CHECKS")
+            if pooled and settings.DB_POOL_SIZE <= 0:
+                self.warnings.append('DB_POOL_SIZE=0: the connection pool is disabled')
+        if settings.REPLICA_DATABASES:
+            if settings.REPLICA_PIN_SECONDS <= settings.REPLICA_MAX_LAG:
+                self.errors.append(
+                    f'REPLICA_PIN_SECONDS={settings.REPLICA_PIN_SECONDS}s is not above REPLICA_MAX_LAG: '
+                    'users may not see their own writes'
+                )
+            pin_backend = settings.CACHES.get(settings.REPLICA_PIN_CACHE, {}).get('BACKEND', '')
+            if not pin_backend.endswith('RedisCache'):
+                self.warnings.append('REPLICA_PIN_CACHE is not shared between workers: a write on one worker does not pin reads on another')
+
+    def check_caches(self):
+        backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+        if backend.endswith('DummyCache'):
+            self.errors.append('default cache is DummyCache: nothing is cached')
+        elif backend.endswith('LocMemCache'):
+            self.warnings.append('default cache is LocMemCache: each worker has its own copy and invalidation does not reach the others')
+        key_backend = settings.CACHES.get(settings.KEY_DIRECTORY_CACHE, {}).get('BACKEND', '')
+        if key_backend == 'private_chat_app.cache.TieredCache':
+            self.warnings.append('KEY_DIRECTORY_CACHE uses a tiered cache: other workers may serve a stale key directory')
+        presence_backend = settings.CACHES.get(settings.PRESENCE_CACHE, {}).get('BACKEND', '')
+        if not presence_backend.endswith('RedisCache'):
+            self.warnings.append('PRESENCE_CACHE is not shared between workers: users connected to another worker get pushed anyway')
+
+    def check_sessions(self):
+        engine = settings.SESSION_ENGINE
+        alias_backend = settings.CACHES.get(settings.SESSION_CACHE_ALIAS, {}).get('BACKEND', '')
+        if engine == 'django.contrib.sessions.backends.db':
+            self.warnings.append('SESSION_ENGINE=db: a session query on every authenticated request')
+        elif engine.endswith(('.cache', '.cached_db')) and not alias_backend.endswith('RedisCache'):
+            problem = 'sessions are lost' if engine.endswith('.cache') else 'logouts do not propagate'
+            self.warnings.append(f"SESSION_CACHE_ALIAS '{settings.SESSION_CACHE_ALIAS}' is not shared between workers: {problem}")
+
+    def check_templates(self):
+        for engine in engines.all():
+            if not isinstance(engine, DjangoTemplates):
+                continue
+            loaders = engine.engine.loaders
+            cached = any(
+                (loader[0] if isinstance(loader, (list, tuple)) else loader) == 'django.template.loaders.cached.Loader'
+                for loader in loaders
+            )
+            if not cached:
+                self.warnings.append(f"template engine '{engine.name}' does not use the cached loader")
+            if engine.engine.debug:
+                self.warnings.append(f"template engine '{engine.name}' runs in debug mode")
+
+    def check_static_files(self):
+        storage = getattr(settings, 'STATICFILES_STORAGE', '')
+        if 'Manifest' not in storage:
+            self.warnings.append('STATICFILES_STORAGE is not a manifest storage: static files cannot be cached forever')
+        elif 'Compressed' not in storage:
+            self.warnings.append('STATICFILES_STORAGE does not pre-compress static files')
+
+    def check_channel_layers(self):
+        backend = settings.CHANNEL_LAYERS.get('default', {}).get('BACKEND', '')
+        if backend.endswith('InMemoryChannelLayer'):
+            self.errors.append('InMemoryChannelLayer: messages never reach sockets held by other workers')
+
+    def check_websockets(self):
+        for client, timeout in settings.CHAT_IDLE_TIMEOUTS.items():
+            if timeout <= settings.CHAT_HEARTBEAT_INTERVAL:
+                self.errors.append(f"CHAT_IDLE_TIMEOUTS['{client}']={timeout}s is not above CHAT_HEARTBEAT_INTERVAL: healthy sockets get reaped")
+        if settings.PRESENCE_TTL <= settings.CHAT_HEARTBEAT_INTERVAL:
+            self.errors.append(f'PRESENCE_TTL={settings.PRESENCE_TTL}s is not above CHAT_HEARTBEAT_INTERVAL: connected users look offline and get pushed')
+        if settings.DRAIN_TIMEOUT >= DRAIN_KILL_AFTER:
+            self.warnings.append(f'DRAIN_TIMEOUT={settings.DRAIN_TIMEOUT:g}s: `serve` kills draining workers after {DRAIN_KILL_AFTER}s')
+
+    def check_uploads(self):
+        if settings.FILE_UPLOAD_MAX_MEMORY_SIZE > LARGE_UPLOAD_IN_MEMORY:
+            size = settings.FILE_UPLOAD_MAX_MEMORY_SIZE // (1024 * 1024)
+            self.warnings.append(f'FILE_UPLOAD_MAX_MEMORY_SIZE={size}MB: uploads are held in worker memory instead of spooled to disk')
+
+    def check_profiling(self):
+        if not settings.DEBUG and settings.QUERY_BUDGET_MODE != 'log':
+            self.warnings.append(f"QUERY_BUDGET_MODE='{settings.QUERY_BUDGET_MODE}' outside development; use 'log'")
+        db_logger = settings.LOGGING.get('loggers', {}).get('django.db.backends', {}) if getattr(settings, 'LOGGING', None) else {}
+        if db_logger.get('level') == 'DEBUG':
+            self.warnings.append('django.db.backends logs at DEBUG: every query is formatted and written out')
+
+    def check_imports(self):
+        if 'cloudinary.uploader' in sys.modules and settings.CHAT_FILE_BACKEND != 'cloudinary':
+            self.warnings.append('cloudinary.uploader is imported at startup although CHAT_FILE_BACKEND is not cloudinary')
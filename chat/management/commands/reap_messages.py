@@ -0,0 +1,29 @@
+# chat/management/commands/reap_messages.py
+
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chat.retention import reap
+
+
+class Command(BaseCommand):
+    help = 'Delete messages past their TTL or their room retention window, in throttled batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Messages per delete (default: RETENTION_BATCH_SIZE)')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches per sweep')
+        parser.add_argument('--pause', type=float, help='Seconds between batches (default: RETENTION_BATCH_PAUSE)')
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping every RETENTION_INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            result = reap(options['batch_size'], options['max_batches'], options['pause'])
+            self.stdout.write(
+                f"Deleted {result['expired']} expired and {result['retention']} retained-out message(s) "
+                f'in {time.perf_counter() - start:.1f}s'
+            )
+            self.stdout.flush()
+            if not options['loop']:
+                return
+            time.sleep(settings.RETENTION_INTERVAL)
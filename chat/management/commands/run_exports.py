@@ -0,0 +1,31 @@
+# chat/management/commands/run_exports.py
+
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chat.export import claim_export, run_export
+
+
+class Command(BaseCommand):
+    help = 'Run queued room exports, resuming any whose runner died mid-way'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new exports')
+
+    def handle(self, *args, **options):
+        while True:
+            export = claim_export()
+            if export is not None:
+                resumed = f' (resuming after message {export.last_message_id})' if export.last_message_id else ''
+                self.stdout.write(f'Export {export.id}: {export.format} of room {export.chat_room_id}{resumed}')
+                start = time.perf_counter()
+                run_export(export)
+                self.stdout.write(
+                    f'Export {export.id}: {export.status}, {export.message_count} message(s), '
+                    f'{export.bytes_written} bytes in {time.perf_counter() - start:.1f}s'
+                )
+                self.stdout.flush()
+                continue
+            if not options['loop']:
+                return
+            time.sleep(settings.EXPORT_POLL_INTERVAL)
@@ -0,0 +1,25 @@
+# chat/management/commands/send_push.py
+
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chat.push import deliver
+
+
+class Command(BaseCommand):
+    help = 'Deliver due offline push notifications in provider batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping every PUSH_POLL_INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            sent = deliver()
+            if sent:
+                self.stdout.write(f'Sent {sent} notification(s) in {time.perf_counter() - start:.2f}s')
+                self.stdout.flush()
+                continue  # More may be due already
+            if not options['loop']:
+                return
+            time.sleep(settings.PUSH_POLL_INTERVAL)
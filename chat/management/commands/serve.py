@@ -0,0 +1,240 @@
+# chat/management/commands/serve.py
+
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+TICK = 0.5
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _default_workers():
+    """WEB_CONCURRENCY, else the container's CPU quota, else the CPUs this process may run on"""
+    if os.environ.get('WEB_CONCURRENCY'):
+        return int(os.environ['WEB_CONCURRENCY'])
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as handle:
+            quota, period = handle.read().split()
+        if quota != 'max':
+            return max(-(-int(quota) // int(period)), 1)
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+
+
+class Worker:
+    def __init__(self, slot, process, health_port):
+        self.slot = slot
+        self.process = process
+        self.health_port = health_port
+        self.started_at = time.monotonic()
+        self.healthy = False
+        self.failures = 0
+        self.next_check = self.started_at
+        self.retiring_since = None
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def check(self):
+        """One health probe against the worker's private endpoint"""
+        connection = http.client.HTTPConnection('127.0.0.1', self.health_port, timeout=2)
+        try:
+            connection.request('GET', '/healthz', headers={'Host': 'localhost'})
+            return connection.getresponse().status == 200
+        except OSError:
+            return False
+        finally:
+            connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Run N daphne workers on one shared listening socket, with health checks and graceful restarts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default=f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+        parser.add_argument('--workers', type=int, help='Default: WEB_CONCURRENCY, else the CPU quota')
+        parser.add_argument('--health-interval', type=float, default=5.0, help='Seconds between probes of each worker')
+        parser.add_argument('--health-failures', type=int, default=3, help='Failed probes in a row before a worker is replaced')
+        parser.add_argument('--boot-timeout', type=float, default=60.0, help='Seconds a new worker has to pass its first probe')
+        parser.add_argument('--graceful-timeout', type=float, default=30.0, help='Seconds a stopping worker has to drain before SIGKILL')
+        parser.add_argument(
+            '--allow-inmemory-layer', action='store_true',
+            help='Allow several workers with InMemoryChannelLayer (no cross-worker fan-out; benchmarks only)'
+        )
+
+    def log(self, message):
+        self.stdout.write(f'[serve {os.getpid()}] {message}')
+        self.stdout.flush()
+
+    def handle(self, *args, **options):
+        self.options = options
+        in_memory = settings.CHANNEL_LAYERS.get('default', {}).get('BACKEND', '').endswith('InMemoryChannelLayer')
+        if options['workers'] is None:
+            options['workers'] = 1 if in_memory and not options['allow_inmemory_layer'] else _default_workers()
+        if options['workers'] > 1 and in_memory and not options['allow_inmemory_layer']:
+            raise CommandError(
+                'InMemoryChannelLayer only delivers group messages inside one process. '
+                'Set REDIS_URL so every worker shares the Redis channel layer, or run --workers 1.'
+            )
+
+        host, port = options['bind'].rsplit(':', 1)
+        if ':' in host:
+            # daphne adopts the socket through Twisted's fd endpoint, which only
+            # takes AF_INET sockets from the command line
+            raise CommandError(f"Cannot bind {options['bind']}: workers can only share an IPv4 socket. Bind 0.0.0.0 instead.")
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, int(port)))
+        self.listener.listen(2048)
+        self.listener.set_inheritable(True)
+
+        self.env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        if not settings.METRICS_DIR:
+            # /metrics is served by whichever worker accepts the scrape; a shared
+            # snapshot directory lets it report every worker
+            self.env['METRICS_DIR'] = tempfile.mkdtemp(prefix='chat-metrics-')
+
+        self.stopping = False
+        self.reload_requested = False
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGHUP, self.request_reload)
+
+        self.workers = {}
+        self.retiring = []
+        self.crashes = {}
+        self.restart_at = {}
+        for slot in range(options['workers']):
+            self.workers[slot] = self.spawn(slot)
+        self.log(f"Listening on {options['bind']} with {options['workers']} worker(s); SIGHUP for a rolling restart")
+
+        while not self.stopping:
+            self.supervise()
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_restart()
+            time.sleep(TICK)
+
+        self.shutdown()
+
+    def request_stop(self, signum, frame):
+        self.stopping = True
+
+    def request_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def spawn(self, slot):
+        health_port = _free_port()
+        fd = self.listener.fileno()
+        process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'daphne',
+                '--fd', str(fd),
+                '-e', f'tcp:port={health_port}:interface=127.0.0.1',
+                'private_chat_app.asgi:application',
+            ],
+            env=self.env, pass_fds=(fd,)
+        )
+        self.log(f'Worker {slot} started (pid {process.pid}, health port {health_port})')
+        return Worker(slot, process, health_port)
+
+    def supervise(self):
+        now = time.monotonic()
+        for slot, worker in list(self.workers.items()):
+            if worker is None:
+                if now >= self.restart_at.get(slot, 0):
+                    self.workers[slot] = self.spawn(slot)
+                continue
+
+            if worker.process.poll() is not None:
+                # Crash-looping workers back off exponentially, up to 30s
+                self.crashes[slot] = self.crashes.get(slot, 0) + 1
+                delay = min(2 ** (self.crashes[slot] - 1), 30)
+                self.log(f'Worker {slot} (pid {worker.pid}) exited with {worker.process.returncode}; restarting in {delay}s')
+                self.workers[slot] = None
+                self.restart_at[slot] = now + delay
+                continue
+
+            if now < worker.next_check:
+                continue
+            worker.next_check = now + self.options['health_interval']
+            if worker.check():
+                if not worker.healthy:
+                    self.log(f'Worker {slot} (pid {worker.pid}) healthy after {now - worker.started_at:.1f}s')
+                worker.healthy = True
+                worker.failures = 0
+                self.crashes[slot] = 0
+            elif worker.healthy or now - worker.started_at > self.options['boot_timeout']:
+                worker.failures += 1
+                self.log(f'Worker {slot} (pid {worker.pid}) failed health check ({worker.failures}/{self.options["health_failures"]})')
+                if worker.failures >= self.options['health_failures'] or not worker.healthy:
+                    self.log(f'Replacing worker {slot} (pid {worker.pid})')
+                    self.retire(worker)
+                    self.workers[slot] = self.spawn(slot)
+
+        self.reap_retiring()
+
+    def retire(self, worker):
+        """SIGTERM a worker so it drains, and SIGKILL it after the graceful timeout"""
+        if worker.process.poll() is None:
+            worker.process.terminate()
+        worker.retiring_since = time.monotonic()
+        self.retiring.append(worker)
+
+    def reap_retiring(self):
+        for worker in list(self.retiring):
+            if worker.process.poll() is not None:
+                self.retiring.remove(worker)
+            elif time.monotonic() - worker.retiring_since > self.options['graceful_timeout']:
+                self.log(f'Worker pid {worker.pid} did not drain in time; killing it')
+                worker.process.kill()
+                worker.process.wait()
+                self.retiring.remove(worker)
+
+    def rolling_restart(self):
+        """Replace workers one at a time, retiring each only once its successor is healthy"""
+        self.log('Rolling restart')
+        for slot in list(self.workers):
+            old = self.workers[slot]
+            new = self.spawn(slot)
+            deadline = time.monotonic() + self.options['boot_timeout']
+            while not self.stopping and time.monotonic() < deadline and new.process.poll() is None:
+                if new.check():
+                    new.healthy = True
+                    break
+                time.sleep(TICK)
+                self.reap_retiring()
+
+            if not new.healthy:
+                self.log(f'Replacement for worker {slot} never became healthy; keeping the old workers')
+                self.retire(new)
+                return
+            self.workers[slot] = new
+            if old is not None:
+                self.retire(old)
+        self.log('Rolling restart complete')
+
+    def shutdown(self):
+        self.log('Stopping workers')
+        for worker in self.workers.values():
+            if worker is not None:
+                self.retire(worker)
+        while self.retiring:
+            self.reap_retiring()
+            time.sleep(0.1)
+        self.listener.close()
+        self.log('All workers stopped')
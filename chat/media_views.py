@@ -0,0 +1,154 @@
+# chat/media_views.py
+
+import mimetypes
+import re
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+from .membership import Membership
+from .signing import verify_media_request
+from .storage import chat_storage, storage_name
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _parse_range(header, size):
+    """Return (start, end) for a single satisfiable byte range, None for no range, or False"""
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None  # Malformed or multi-range: serve the whole file
+
+    first, last = match.groups()
+    if first == '':
+        if last == '':
+            return None
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        return None  # Not a valid range at all (RFC 9110 14.1.1), so the header is ignored
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        return False
+    return start, end
+
+
+async def _aiter_range(handle, start, length):
+    """Read a byte range off the event loop so ASGI responses never buffer the file"""
+    try:
+        await sync_to_async(handle.seek, thread_sensitive=False)(start)
+        remaining = length
+        while remaining > 0:
+            data = await sync_to_async(handle.read, thread_sensitive=False)(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        handle.close()
+
+
+def _iter_range(handle, start, length):
+    try:
+        handle.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = handle.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        handle.close()
+
+
+def _accel_response(name, content_type):
+    """Hand the transfer to the front proxy (it handles Range itself)"""
+    response = HttpResponse(content_type=content_type)
+    if settings.CHAT_FILE_ACCEL == 'nginx':
+        response['X-Accel-Redirect'] = settings.CHAT_FILE_ACCEL_PREFIX + name
+    else:
+        response['X-Sendfile'] = chat_storage.path(name)
+    return response
+
+
+def file_response(request, name):
+    """Serve a stored chat file with Range/If-Range support"""
+    if not chat_storage.exists(name):
+        raise Http404('File not found')
+
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if settings.CHAT_FILE_ACCEL:
+        return _accel_response(name, content_type)
+
+    size = chat_storage.size(name)
+    modified = chat_storage.get_modified_time(name).timestamp()
+    etag = f'"{size:x}-{int(modified):x}"'
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if range_header:
+        # If-Range: only honour the range when the client's copy is still current
+        if_range = request.headers.get('If-Range')
+        if if_range:
+            if_range_date = parse_http_date_safe(if_range)
+            current = if_range == etag or (if_range_date is not None and if_range_date >= int(modified))
+        else:
+            current = True
+        if current:
+            byte_range = _parse_range(range_header, size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    handle = chat_storage.open(name, 'rb')
+    if byte_range is None:
+        if isinstance(request, ASGIRequest):
+            response = StreamingHttpResponse(_aiter_range(handle, 0, size), content_type=content_type)
+            response['Content-Length'] = str(size)
+        else:
+            # Under WSGI, FileResponse goes through wsgi.file_wrapper (os.sendfile)
+            response = FileResponse(handle, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        iterator = _aiter_range if isinstance(request, ASGIRequest) else _iter_range
+        response = StreamingHttpResponse(iterator(handle, start, length), status=206, content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified)
+    return response
+
+
+@require_safe
+def serve_file(request, room_id, name):
+    """Serve a locally stored chat file to room participants"""
+    remaining = verify_media_request(request)
+    if remaining is not None:
+        # Signed URL: authorised by the HMAC alone, no session or membership query
+        response = file_response(request, storage_name(room_id, name))
+        response['Cache-Control'] = f'public, max-age={remaining}, immutable'
+        return response
+
+    # Unsigned (or expired) URL: fall back to a session and membership check
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    if not Membership.objects.filter(chatroom_id=room_id, user_id=request.user.id).exists():
+        raise Http404('File not found')
+
+    response = file_response(request, storage_name(room_id, name))
+    response['Cache-Control'] = 'private, no-cache'
+    return response
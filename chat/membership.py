@@ -0,0 +1,83 @@
+# chat/membership.py
+# Bulk membership changes for chat rooms and the matching group events
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import connection, transaction
+from django.utils import timezone
+from .keys import invalidate_key_directory
+from .models import ChatRoom
+
+# Auto-created through model for ChatRoom.participants
+Membership = ChatRoom.participants.through
+
+
+def room_group_name(room_id):
+    """Channel layer group used by ChatConsumer for a room"""
+    return f'chat_{room_id}'
+
+
+def add_participants(room, user_ids):
+    """Insert memberships in one statement and return the ids that were new"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return []
+
+    # A concurrent invite for the same user conflicts and is skipped, so RETURNING
+    # lists exactly the rows this call inserted
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {connection.ops.quote_name(Membership._meta.db_table)} (chatroom_id, user_id)
+            SELECT %s, unnest(%s::bigint[])
+            ON CONFLICT (chatroom_id, user_id) DO NOTHING
+            RETURNING user_id
+        """, [room.id, sorted(user_ids)])
+        new_ids = sorted(user_id for user_id, in cursor.fetchall())
+
+    if new_ids:
+        invalidate_key_directory([room.id])
+    return new_ids
+
+
+def remove_participants(room, user_ids):
+    """Delete memberships in one statement and return the ids that were removed"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return []
+
+    # A concurrent removal of the same user finds its row gone, so RETURNING lists
+    # exactly the rows this call deleted
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            DELETE FROM {connection.ops.quote_name(Membership._meta.db_table)}
+            WHERE chatroom_id = %s AND user_id = ANY(%s)
+            RETURNING user_id
+        """, [room.id, sorted(user_ids)])
+        removed_ids = sorted(user_id for user_id, in cursor.fetchall())
+
+    if removed_ids:
+        invalidate_key_directory([room.id])
+    return removed_ids
+
+
+def touch_room(room):
+    """Bump updated_at without going through save() and its signals"""
+    ChatRoom.objects.filter(id=room.id).update(updated_at=timezone.now())
+
+
+def broadcast_membership_change(room, added=(), removed=()):
+    """Send a single membership delta to the room once the transaction commits"""
+    added = [{'id': user.id, 'username': user.username} for user in added]
+    removed = list(removed)
+    if not added and not removed:
+        return
+
+    event = {
+        'type': 'membership_update',
+        'added': added,
+        'removed': removed,
+    }
+    channel_layer = get_channel_layer()
+    transaction.on_commit(
+        lambda: async_to_sync(channel_layer.group_send)(room_group_name(room.id), event)
+    )
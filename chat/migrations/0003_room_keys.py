@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0002_alter_message_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='key_epoch',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        # Instances still on the old code during a rolling deploy insert rooms without it
+        migrations.RunSQL(
+            'ALTER TABLE chat_chatroom ALTER COLUMN key_epoch SET DEFAULT 0',
+            'ALTER TABLE chat_chatroom ALTER COLUMN key_epoch DROP DEFAULT',
+        ),
+        migrations.CreateModel(
+            name='RoomKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epoch', models.PositiveIntegerField()),
+                ('wrapped_key', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chat_room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wrapped_keys', to='chat.chatroom')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wrapped_room_keys', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Room Key',
+                'verbose_name_plural': 'Room Keys',
+                'unique_together': {('chat_room', 'recipient', 'epoch')},
+            },
+        ),
+    ]
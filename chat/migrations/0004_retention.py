@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_room_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='message_ttl_seconds',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='retention_seconds',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat_room', 'timestamp'], name='chat_msg_room_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('expires_at__isnull', False)), fields=['expires_at'], name='chat_msg_expires_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0004_retention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomExport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('ndjson', 'NDJSON'), ('zip', 'ZIP with attachments')], default='ndjson', max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('last_message_id', models.BigIntegerField(default=0)),
+                ('bytes_written', models.BigIntegerField(default=0)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('artifact', models.CharField(blank=True, max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('chat_room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exports', to='chat.chatroom')),
+                ('requested_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='room_exports', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Room Export',
+                'verbose_name_plural': 'Room Exports',
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='chat_export_queue_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 20:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_push_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Attachment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('url', models.URLField(max_length=500)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('mime_type', models.CharField(blank=True, max_length=100)),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('message', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='chat.message')),
+            ],
+            options={
+                'verbose_name': 'Attachment',
+                'verbose_name_plural': 'Attachments',
+                'ordering': ['message', 'position'],
+                'unique_together': {('message', 'position')},
+            },
+        ),
+    ]
@@ -0,0 +1,77 @@
+# chat/migrations/0008_copy_attachments.py
+# Copy every message's file into an Attachment row, online
+#
+# Not atomic: each batch of BATCH_SIZE message ids is found through the primary key
+# and committed on its own, with a pause in between, so the copy holds no lock that
+# blocks writers and never builds one long transaction on a multi-million-row table.
+# Re-running it is safe (existing attachments are skipped). Messages saved by
+# processes still on the old code while it runs are picked up by 0009, and again
+# before the old columns are dropped in the release after it.
+
+import mimetypes
+import time
+from django.db import migrations, transaction
+
+BATCH_SIZE = 10000
+PAUSE = 0.05  # seconds between batches
+
+
+def copy_attachments(apps, schema_editor, start=0, pause=PAUSE):
+    """Copy the files of messages with id > start; returns the newest id there was when it began"""
+    Message = apps.get_model('chat', 'Message')
+    Attachment = apps.get_model('chat', 'Attachment')
+    alias = schema_editor.connection.alias
+    last = Message.objects.using(alias).order_by('-id').values_list('id', flat=True).first() or 0
+    while start < last:
+        with transaction.atomic(using=alias):
+            rows = (
+                Message.objects.using(alias)
+                .filter(id__gt=start, id__lte=start + BATCH_SIZE, file__isnull=False)
+                .exclude(file='')
+                .order_by()
+                .values_list('id', 'file', 'file_name', 'file_size')
+            )
+            Attachment.objects.using(alias).bulk_create([
+                Attachment(
+                    message_id=message_id, position=0, url=url, name=name or 'file', size=size or 0,
+                    mime_type=mimetypes.guess_type(name or '')[0] or 'application/octet-stream',
+                )
+                for message_id, url, name, size in rows
+            ], ignore_conflicts=True)
+        start += BATCH_SIZE
+        time.sleep(pause)
+    return last
+
+
+def copy_back(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    Attachment = apps.get_model('chat', 'Attachment')
+    alias = schema_editor.connection.alias
+    last = Message.objects.using(alias).order_by('-id').values_list('id', flat=True).first() or 0
+    start = 0
+    with schema_editor.connection.cursor() as cursor:
+        while start < last:
+            # Only the first attachment fits in the old columns
+            cursor.execute(
+                f"""
+                UPDATE {Message._meta.db_table} m SET file = a.url, file_name = a.name, file_size = a.size
+                FROM {Attachment._meta.db_table} a
+                WHERE a.message_id = m.id AND a.position = 0 AND m.id > %s AND m.id <= %s
+                """,
+                [start, start + BATCH_SIZE],
+            )
+            start += BATCH_SIZE
+            time.sleep(PAUSE)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('chat', '0007_attachment'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_attachments, copy_back, elidable=True),
+    ]
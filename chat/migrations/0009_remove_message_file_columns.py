@@ -0,0 +1,55 @@
+# chat/migrations/0009_remove_message_file_columns.py
+# Stop using the attachment and read-state columns of chat_message
+#
+# The columns stay in the database for this release: migrate runs as instances start,
+# so during a rolling deploy processes on the old code still insert into them. Only
+# the migration state drops the fields, and is_read gets a database default so new
+# code can insert without it (the other four are nullable already). Files of messages
+# saved by old code since 0008 ran are copied here, without blocking anyone, starting
+# at the oldest message with a file and no attachment: new code may already have
+# given later messages attachments.
+#
+# The columns are dropped by a migration in the following release, once no process
+# runs this code's predecessor: it repeats the catch-up with writers held off and
+# then drops them.
+
+import importlib
+from django.db import migrations
+
+copy_attachments = importlib.import_module('chat.migrations.0008_copy_attachments').copy_attachments
+
+FIELDS = ['file', 'file_name', 'file_size', 'is_read', 'read_at']
+
+
+def catch_up(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    alias = schema_editor.connection.alias
+    missing = (
+        Message.objects.using(alias).filter(file__gt='', attachments__isnull=True)
+        .order_by('id').values_list('id', flat=True).first()
+    )
+    if missing is not None:
+        copy_attachments(apps, schema_editor, start=missing - 1, pause=0)
+
+
+class Migration(migrations.Migration):
+
+    # Each catch-up batch commits on its own, as in 0008
+    atomic = False
+
+    dependencies = [
+        ('chat', '0008_copy_attachments'),
+    ]
+
+    operations = [
+        migrations.RunPython(catch_up, migrations.RunPython.noop, elidable=True),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'ALTER TABLE chat_message ALTER COLUMN is_read SET DEFAULT false',
+                    'ALTER TABLE chat_message ALTER COLUMN is_read DROP DEFAULT',
+                ),
+            ],
+            state_operations=[migrations.RemoveField(model_name='message', name=name) for name in FIELDS],
+        ),
+    ]
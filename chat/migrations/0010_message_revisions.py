@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-19 20:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_remove_message_file_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='change_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        # Instances still on the old code during a rolling deploy insert rooms without it
+        migrations.RunSQL(
+            'ALTER TABLE chat_chatroom ALTER COLUMN change_seq SET DEFAULT 0',
+            'ALTER TABLE chat_chatroom ALTER COLUMN change_seq DROP DEFAULT',
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='MessageRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('edit', 'Edit'), ('delete', 'Delete')], max_length=6)),
+                ('previous_content', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chat_room', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chat.chatroom')),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='chat.message')),
+            ],
+            options={
+                'verbose_name': 'Message Revision',
+                'verbose_name_plural': 'Message Revisions',
+                'unique_together': {('chat_room', 'seq')},
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-19 20:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0010_message_revisions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('emoji', models.CharField(max_length=32)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Reaction',
+                'verbose_name_plural': 'Reactions',
+            },
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='reaction_counts',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        # Instances still on the old code during a rolling deploy insert messages without it
+        migrations.RunSQL(
+            'ALTER TABLE chat_message ALTER COLUMN reply_count SET DEFAULT 0',
+            'ALTER TABLE chat_message ALTER COLUMN reply_count DROP DEFAULT',
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='reply_to',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='replies', to='chat.message'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('reply_to__isnull', False)), fields=['reply_to', 'id'], name='chat_msg_reply_idx'),
+        ),
+        migrations.AddField(
+            model_name='reaction',
+            name='message',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='reactions', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='reaction',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_reactions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='reaction',
+            unique_together={('message', 'user', 'emoji')},
+        ),
+    ]
@@ -22,6 +22,13 @@ class ChatRoom(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    key_epoch = models.PositiveIntegerField(default=0)
+    # Retention policies, enforced by chat.retention: messages older than
+    # retention_seconds are deleted, and new messages expire after message_ttl_seconds
+    retention_seconds = models.PositiveIntegerField(blank=True, null=True)
+    message_ttl_seconds = models.PositiveIntegerField(blank=True, null=True)
+    # Numbers the room's edits and deletions (chat.edits) so clients can sync them
+    change_seq = models.BigIntegerField(default=0)
     
     class Meta:
         verbose_name = 'Chat Room'
@@ -52,33 +59,116 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     message_type = models.CharField(max_length=10, choices=MESSAGE_TYPES, default='text')
     encrypted_content = models.TextField()
-    file = models.URLField(max_length=500, blank=True, null=True)
-    file_name = models.CharField(max_length=255, blank=True, null=True)
-    file_size = models.BigIntegerField(blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     is_edited = models.BooleanField(default=False)
     edited_at = models.DateTimeField(blank=True, null=True)
-    is_read = models.BooleanField(default=False)
-    read_at = models.DateTimeField(blank=True, null=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)  # Tombstone; the content is cleared
+    expires_at = models.DateTimeField(blank=True, null=True)
+    # Threads: replies point at the message they answer. The index behind thread reads
+    # is partial (below), since most messages are not replies
+    reply_to = models.ForeignKey('self', on_delete=models.SET_NULL, related_name='replies', blank=True, null=True, db_index=False)
+    # Materialized aggregates, refreshed by chat.reactions so history pages never count:
+    # {emoji: count} (null until the first reaction) and live replies
+    reaction_counts = models.JSONField(blank=True, null=True)
+    reply_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         verbose_name = 'Message'
         verbose_name_plural = 'Messages'
         ordering = ['timestamp']
+        indexes = [
+            # Room history and room retention sweeps
+            models.Index(fields=['chat_room', 'timestamp'], name='chat_msg_room_ts_idx'),
+            # Only disappearing messages are indexed for the TTL sweep
+            models.Index(fields=['expires_at'], name='chat_msg_expires_idx', condition=models.Q(expires_at__isnull=False)),
+            # Thread reads and reply counts; only replies are indexed
+            models.Index(fields=['reply_to', 'id'], name='chat_msg_reply_idx', condition=models.Q(reply_to__isnull=False)),
+        ]
 
     def __str__(self):
         return f"{self.sender.username} in {self.chat_room.name} - {self.message_type}"
     
-    def get_file_size_display(self):
+
+
+class Attachment(models.Model):
+    """File attached to a message; a message may carry several, in position order"""
+    
+    # Looked up through the unique (message, position) index; a separate one would be redundant
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='attachments', db_index=False)
+    position = models.PositiveSmallIntegerField(default=0)
+    url = models.URLField(max_length=500)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField(default=0)
+    # Derived from the stored file by chat.tasks.describe_attachment after upload
+    mime_type = models.CharField(max_length=100, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
+    width = models.PositiveIntegerField(blank=True, null=True)
+    height = models.PositiveIntegerField(blank=True, null=True)
+    duration = models.FloatField(blank=True, null=True)  # Seconds, for audio and video
+    
+    class Meta:
+        verbose_name = 'Attachment'
+        verbose_name_plural = 'Attachments'
+        ordering = ['message', 'position']
+        unique_together = ['message', 'position']
+    
+    def __str__(self):
+        return f"{self.name} on message {self.message_id}"
+    
+    def get_size_display(self):
         """Convert file size to human-readable format"""
-        if not self.file_size:
+        size = self.size
+        if not size:
             return "N/A"
         
         for unit in ['B', 'KB', 'MB', 'GB']:
-            if self.file_size < 1024.0:
-                return f"{self.file_size:.1f} {unit}"
-            self.file_size /= 1024.0
-        return f"{self.file_size:.1f} TB"
+            if size < 1024.0:
+                return f"{size:.1f} {unit}"
+            size /= 1024.0
+        return f"{size:.1f} TB"
+
+
+class MessageRevision(models.Model):
+    """One edit or deletion of a message, numbered in its room's change sequence (chat.edits)"""
+    
+    KINDS = [
+        ('edit', 'Edit'),
+        ('delete', 'Delete'),
+    ]
+    
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='revisions')
+    # Covered by the unique (chat_room, seq) index, which is what sync reads
+    chat_room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='+', db_index=False)
+    seq = models.BigIntegerField()
+    kind = models.CharField(max_length=6, choices=KINDS)
+    previous_content = models.TextField(blank=True)  # What an edit replaced; empty for deletions
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Message Revision'
+        verbose_name_plural = 'Message Revisions'
+        unique_together = ['chat_room', 'seq']
+    
+    def __str__(self):
+        return f"{self.kind} #{self.seq} of message {self.message_id}"
+
+
+class Reaction(models.Model):
+    """One user's emoji reaction to a message; tallied into Message.reaction_counts"""
+    
+    # Looked up through the unique (message, user, emoji) index
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='reactions', db_index=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='message_reactions')
+    emoji = models.CharField(max_length=32)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Reaction'
+        verbose_name_plural = 'Reactions'
+        unique_together = ['message', 'user', 'emoji']
+    
+    def __str__(self):
+        return f"{self.emoji} by {self.user_id} on message {self.message_id}"
 
 
 class MessageReadReceipt(models.Model):
@@ -94,4 +184,110 @@ class MessageReadReceipt(models.Model):
         unique_together = ['message', 'user']
     
     def __str__(self):
-        return f"{self.user.username} read message {self.message.id}"
\ No newline at end of file
+        return f"{self.user.username} read message {self.message.id}"
+
+
+class RoomKey(models.Model):
+    """Room key wrapped with one participant's public key for a key-rotation epoch"""
+    
+    chat_room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='wrapped_keys')
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='wrapped_room_keys')
+    epoch = models.PositiveIntegerField()
+    wrapped_key = models.TextField()
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Room Key'
+        verbose_name_plural = 'Room Keys'
+        unique_together = ['chat_room', 'recipient', 'epoch']
+    
+    def __str__(self):
+        return f"Key for {self.recipient_id} in room {self.chat_room_id} (epoch {self.epoch})"
+
+
+class RoomExport(models.Model):
+    """Background export of a room's history (chat.export.run_export); resumable from its checkpoint"""
+    
+    FORMATS = [
+        ('ndjson', 'NDJSON'),
+        ('zip', 'ZIP with attachments'),
+    ]
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    chat_room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='exports')
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='room_exports')
+    format = models.CharField(max_length=10, choices=FORMATS, default='ndjson')
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    # Checkpoint: messages up to last_message_id are in the first bytes_written bytes
+    last_message_id = models.BigIntegerField(default=0)
+    bytes_written = models.BigIntegerField(default=0)
+    message_count = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    artifact = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        verbose_name = 'Room Export'
+        verbose_name_plural = 'Room Exports'
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='chat_export_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.format} export of room {self.chat_room_id} ({self.status})"
+
+
+class PushDevice(models.Model):
+    """Push token of one app install, registered by the mobile app"""
+    
+    PLATFORMS = [
+        ('fcm', 'Firebase Cloud Messaging'),
+        ('apns', 'Apple Push Notification service'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='push_devices')
+    platform = models.CharField(max_length=10, choices=PLATFORMS, default='fcm')
+    token = models.CharField(max_length=255, unique=True)
+    is_active = models.BooleanField(default=True)  # Cleared when the provider rejects the token
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Push Device'
+        verbose_name_plural = 'Push Devices'
+    
+    def __str__(self):
+        return f"{self.platform} device of user {self.user_id}"
+
+
+class PushNotification(models.Model):
+    """Offline push state for one user in one room (chat.push); a burst of messages collapses into one row"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='push_notifications')
+    chat_room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='push_notifications')
+    pending = models.PositiveIntegerField(default=0)  # Messages since the last send
+    last_message_id = models.BigIntegerField(default=0)
+    last_sender = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    due_at = models.DateTimeField(blank=True, null=True)  # Next send; null while nothing is pending
+    last_sent_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        verbose_name = 'Push Notification'
+        verbose_name_plural = 'Push Notifications'
+        unique_together = ['user', 'chat_room']
+        indexes = [
+            # Only rows waiting to be sent are indexed for the sender's sweep
+            models.Index(fields=['due_at'], name='chat_push_due_idx', condition=models.Q(due_at__isnull=False)),
+        ]
+    
+    def __str__(self):
+        return f"Push for user {self.user_id} in room {self.chat_room_id} ({self.pending} pending)"
@@ -0,0 +1,378 @@
+# chat/push.py
+# Offline push notifications
+#
+# Every open socket counts itself into a presence counter per (room, user) in
+# PRESENCE_CACHE, refreshed by its heartbeat so a crashed worker's sockets lapse after
+# PRESENCE_TTL. When a message is sent, the consumer queues a chat.tasks.notify_offline
+# task, and the worker gives the room's participants (from the cached key directory)
+# minus the sender and anyone present one upsert into PushNotification, which holds a
+# single row per recipient and room. The first message is due at once; later ones
+# within PUSH_COLLAPSE_WINDOW of the last send only bump the row's count, so a burst in
+# a busy group becomes one notification per recipient.
+#
+# The scheduled chat.tasks.deliver_push task (or `manage.py send_push`) claims due rows
+# with SKIP LOCKED, merges a user's rooms into one notification per device and hands
+# them to the platform's transport (PUSH_TRANSPORTS) in batches of up to
+# PUSH_BATCH_SIZE. A notification the transport could not deliver is sent again later
+# to its own device alone, up to PUSH_RETRY_ATTEMPTS times. Message bodies are
+# end-to-end encrypted, so notifications carry the room, the sender and a count, never text.
+
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+from private_chat_app import metrics
+from . import tasks
+from .keys import get_key_directory
+from .models import ChatRoom, PushDevice, PushNotification
+
+logger = logging.getLogger('chat.push')
+User = get_user_model()
+
+
+# -- Presence -----------------------------------------------------------------
+
+def _presence():
+    return caches[settings.PRESENCE_CACHE]
+
+
+def _presence_key(room_id, user_id):
+    return f'presence:{room_id}:{user_id}'
+
+
+async def mark_present(room_id, user_id):
+    """Count a newly opened socket"""
+    key = _presence_key(room_id, user_id)
+    await _presence().aadd(key, 0, settings.PRESENCE_TTL)
+    try:
+        await _presence().aincr(key)
+    except ValueError:  # Lapsed between the two calls
+        await _presence().aset(key, 1, settings.PRESENCE_TTL)
+
+
+async def refresh_presence(room_id, user_id):
+    """Extend an open socket's presence; called on every heartbeat"""
+    key = _presence_key(room_id, user_id)
+    if not await _presence().atouch(key, settings.PRESENCE_TTL):
+        await _presence().aadd(key, 1, settings.PRESENCE_TTL)
+
+
+async def mark_absent(room_id, user_id):
+    """Uncount a closed socket; the key is left to expire so a concurrent connect can't be lost"""
+    try:
+        await _presence().adecr(_presence_key(room_id, user_id))
+    except ValueError:
+        pass
+
+
+def offline_recipients(room_id, sender_id):
+    """Participants other than the sender with no open socket in the room"""
+    user_ids = [entry['user_id'] for entry in get_key_directory(room_id)['keys'] if entry['user_id'] != sender_id]
+    present = _presence().get_many([_presence_key(room_id, user_id) for user_id in user_ids])
+    return [user_id for user_id in user_ids if not present.get(_presence_key(room_id, user_id))]
+
+
+# -- Queueing -----------------------------------------------------------------
+
+def notify_offline(room_id, message_id, sender_id):
+    """Queue (or collapse into) a push for every offline participant with a device"""
+    user_ids = offline_recipients(room_id, sender_id)
+    if not user_ids:
+        return 0
+
+    table = PushNotification._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {table} AS p (user_id, chat_room_id, pending, last_message_id, last_sender_id, due_at)
+            SELECT DISTINCT d.user_id, %(room)s, 1, %(message)s, %(sender)s, now()
+            FROM {PushDevice._meta.db_table} d
+            WHERE d.user_id = ANY(%(users)s) AND d.is_active
+            ON CONFLICT (user_id, chat_room_id) DO UPDATE SET
+                pending = p.pending + 1,
+                last_message_id = EXCLUDED.last_message_id,
+                last_sender_id = EXCLUDED.last_sender_id,
+                due_at = COALESCE(p.due_at, GREATEST(
+                    now(), p.last_sent_at + make_interval(secs => %(window)s)
+                ))
+            RETURNING p.pending
+        """, {
+            'room': int(room_id), 'message': message_id, 'sender': sender_id,
+            'users': user_ids, 'window': settings.PUSH_COLLAPSE_WINDOW,
+        })
+        pending = [row[0] for row in cursor.fetchall()]
+
+    collapsed = sum(1 for count in pending if count > 1)
+    metrics.PUSH_QUEUED.inc(len(pending) - collapsed, outcome='new')
+    metrics.PUSH_QUEUED.inc(collapsed, outcome='collapsed')
+    return len(pending)
+
+
+def claim_due(limit):
+    """Take up to limit due rows, marking them sent; returns what each had pending"""
+    table = PushNotification._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"""
+            WITH due AS (
+                SELECT id, pending, last_message_id, last_sender_id FROM {table}
+                WHERE due_at <= now()
+                ORDER BY due_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE {table} p SET pending = 0, due_at = NULL, last_sent_at = now()
+            FROM due WHERE p.id = due.id
+            RETURNING p.id, p.user_id, p.chat_room_id, due.pending, due.last_message_id, due.last_sender_id
+        """, [limit])
+        columns = ('id', 'user_id', 'room_id', 'pending', 'message_id', 'sender_id')
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+# -- Delivery -----------------------------------------------------------------
+
+def build_notifications(rows):
+    """
+    One notification per device of every user in rows. A user with several rooms due
+    gets a single summary; otherwise it names the room and the latest sender.
+    """
+    by_user = defaultdict(list)
+    for row in rows:
+        by_user[row['user_id']].append(row)
+    rooms = dict(ChatRoom.objects.filter(id__in={row['room_id'] for row in rows}).values_list('id', 'name'))
+    senders = dict(User.objects.filter(id__in={row['sender_id'] for row in rows}).values_list('id', 'username'))
+    devices = PushDevice.objects.filter(user_id__in=by_user, is_active=True).values_list('id', 'user_id', 'platform', 'token')
+
+    notifications = []
+    for device_id, user_id, platform, token in devices:
+        user_rows = by_user[user_id]
+        total = sum(row['pending'] for row in user_rows)
+        messages = f"{total} new message{'s' if total != 1 else ''}"
+        if len(user_rows) == 1:
+            row = user_rows[0]
+            sender = senders.get(row['sender_id'])
+            notification = {
+                'title': rooms.get(row['room_id'], 'Private Chat'),
+                'body': f'New message from {sender}' if sender and total == 1 else messages,
+                'collapse_key': f"room-{row['room_id']}",  # Replaces the room's previous notification
+                'data': {
+                    'room_id': str(row['room_id']),
+                    'message_id': str(row['message_id']),
+                    'url': reverse('chat:chat_room', args=[row['room_id']]),
+                },
+            }
+        else:
+            notification = {
+                'title': 'Private Chat',
+                'body': f'{messages} in {len(user_rows)} chats',
+                'collapse_key': 'chats',
+                'data': {'url': reverse('chat:chat_list')},
+            }
+        notification.update(device_id=device_id, user_id=user_id, platform=platform, token=token)
+        notifications.append(notification)
+    return notifications
+
+
+_transports = {}
+
+
+def get_transport(platform):
+    if platform not in _transports:
+        _transports[platform] = import_string(settings.PUSH_TRANSPORTS[platform])()
+    return _transports[platform]
+
+
+def send(notifications):
+    """Hand notifications to their platforms' transports; returns (sent, the ones to retry)"""
+    by_platform = defaultdict(list)
+    for notification in notifications:
+        by_platform[notification['platform']].append(notification)
+
+    sent, invalid, retry = 0, [], []
+    for platform, notifications in by_platform.items():
+        transport = get_transport(platform)
+        for offset in range(0, len(notifications), settings.PUSH_BATCH_SIZE):
+            batch = notifications[offset:offset + settings.PUSH_BATCH_SIZE]
+            start = time.perf_counter()
+            try:
+                outcomes = transport.send(batch)
+            except Exception:
+                logger.exception('Push transport for %s failed on a batch of %d', platform, len(batch))
+                outcomes = ['retry'] * len(batch)
+            metrics.PUSH_BATCH_SECONDS.observe(time.perf_counter() - start, platform=platform)
+            for notification, outcome in zip(batch, outcomes):
+                metrics.PUSH_SENT.inc(platform=platform, outcome=outcome)
+                if outcome == 'sent':
+                    sent += 1
+                elif outcome == 'invalid':
+                    invalid.append(notification['device_id'])
+                elif outcome == 'retry':
+                    retry.append(notification)
+                # 'failed': the provider rejected this notification itself; it is dropped
+
+    if invalid:
+        # Uninstalled apps and expired tokens: stop sending to them
+        PushDevice.objects.filter(id__in=invalid).update(is_active=False)
+    return sent, retry
+
+
+def schedule_retry(notifications, attempt=1):
+    """
+    Send these notifications again later, to their own devices only: the rows they were
+    built from are already marked sent, so devices that got them are not sent them twice
+    """
+    if attempt > settings.PUSH_RETRY_ATTEMPTS:
+        logger.warning('Giving up on %d push notification(s) after %d attempts', len(notifications), attempt - 1)
+        return
+    # Tokens stay in PushDevice; resend() looks them up again, skipping deactivated devices
+    notifications = [
+        {key: value for key, value in notification.items() if key not in ('platform', 'token')}
+        for notification in notifications
+    ]
+    tasks.resend_push.enqueue(
+        delay=settings.PUSH_RETRY_DELAY * 2 ** (attempt - 1), notifications=notifications, attempt=attempt
+    )
+
+
+def deliver(limit=None):
+    """Send everything that is due; returns the number of notifications sent"""
+    rows = claim_due(limit or settings.PUSH_CLAIM_SIZE)
+    if not rows:
+        return 0
+    sent, retry = send(build_notifications(rows))
+    if retry:
+        schedule_retry(retry)
+    return sent
+
+
+def resend(notifications, attempt):
+    """Retry notifications that could not be delivered; returns how many were sent this time"""
+    devices = PushDevice.objects.filter(
+        id__in=[notification['device_id'] for notification in notifications], is_active=True
+    ).values_list('id', 'platform', 'token')
+    devices = {device_id: {'platform': platform, 'token': token} for device_id, platform, token in devices}
+    notifications = [
+        {**notification, **devices[notification['device_id']]}
+        for notification in notifications if notification['device_id'] in devices
+    ]
+    sent, retry = send(notifications)
+    if retry:
+        schedule_retry(retry, attempt + 1)
+    return sent
+
+
+# -- Transports ---------------------------------------------------------------
+
+class Transport:
+    """Sends a batch of notifications for one platform; returns one outcome per notification"""
+
+    def send(self, notifications):
+        """-> ['sent' | 'invalid' (drop the token) | 'retry' | 'failed' (drop the notification), ...]"""
+        raise NotImplementedError
+
+
+class LocalTransport(Transport):
+    """
+    Stand-in for FCM/APNs in development and tests: logs each notification and, with
+    PUSH_LOCAL_OUTBOX set, appends it there as NDJSON. Tokens starting with 'invalid'
+    are rejected the way a provider rejects an uninstalled app's token.
+    """
+
+    lock = threading.Lock()
+
+    def send(self, notifications):
+        outcomes = ['invalid' if n['token'].startswith('invalid') else 'sent' for n in notifications]
+        for notification, outcome in zip(notifications, outcomes):
+            logger.info('push %s to device %s: %s - %s', outcome, notification['device_id'], notification['title'], notification['body'])
+        if settings.PUSH_LOCAL_OUTBOX:
+            lines = ''.join(
+                json.dumps({**n, 'outcome': outcome}) + '\n' for n, outcome in zip(notifications, outcomes)
+            )
+            with self.lock, open(settings.PUSH_LOCAL_OUTBOX, 'a') as outbox:
+                outbox.write(lines)
+        return outcomes
+
+
+class FCMTransport(Transport):
+    """
+    Firebase Cloud Messaging HTTP v1 API (Android, and iOS through Firebase). The v1
+    API takes one message per request, so a batch goes out over PUSH_FCM_CONCURRENCY
+    kept-alive connections. Needs the google-auth and requests packages and a service
+    account (PUSH_FCM_CREDENTIALS).
+    """
+
+    scope = 'https://www.googleapis.com/auth/firebase.messaging'
+
+    @cached_property
+    def session(self):
+        # Imported on first use, like the Cloudinary SDK: only push workers need them
+        from google.auth.transport.requests import AuthorizedSession
+        from google.oauth2 import service_account
+        credentials = service_account.Credentials.from_service_account_file(
+            settings.PUSH_FCM_CREDENTIALS, scopes=[self.scope]
+        )
+        return AuthorizedSession(credentials)
+
+    @cached_property
+    def executor(self):
+        return ThreadPoolExecutor(max_workers=settings.PUSH_FCM_CONCURRENCY, thread_name_prefix='fcm')
+
+    @property
+    def url(self):
+        return f'https://fcm.googleapis.com/v1/projects/{settings.PUSH_FCM_PROJECT_ID}/messages:send'
+
+    def send(self, notifications):
+        return list(self.executor.map(self.send_one, notifications))
+
+    def send_one(self, notification):
+        message = {
+            'token': notification['token'],
+            'notification': {'title': notification['title'], 'body': notification['body']},
+            'data': notification['data'],
+            'android': {'collapse_key': notification['collapse_key'], 'notification': {'tag': notification['collapse_key']}},
+            'apns': {'headers': {'apns-collapse-id': notification['collapse_key']}},
+        }
+        try:
+            response = self.session.post(self.url, json={'message': message}, timeout=10)
+        except OSError as e:
+            logger.warning('FCM request failed: %s', e)
+            return 'retry'
+        if response.status_code == 200:
+            return 'sent'
+        if response.status_code == 429 or response.status_code >= 500:
+            return 'retry'
+        if self.token_rejected(response):
+            return 'invalid'
+        # Anything else (a bad payload, auth or quota setup) is no fault of the device,
+        # and sending the same message again would fail the same way
+        logger.error('FCM rejected a notification for device %s: %s %s',
+                     notification['device_id'], response.status_code, response.text[:500])
+        return 'failed'
+
+    @staticmethod
+    def token_rejected(response):
+        """Whether FCM says the token itself will never work again"""
+        try:
+            error = response.json().get('error', {})
+        except ValueError:
+            return False
+        details = error.get('details') or []
+        codes = {detail.get('errorCode') for detail in details}
+        if 'UNREGISTERED' in codes:
+            # The app was uninstalled (a bare 404 may just be a wrong project URL)
+            return True
+        if 'INVALID_ARGUMENT' in codes or error.get('status') == 'INVALID_ARGUMENT':
+            # Only when the field at fault is the token, not something in the payload
+            violations = [
+                violation for detail in details for violation in detail.get('fieldViolations') or []
+            ]
+            return any(violation.get('field') == 'message.token' for violation in violations) \
+                or 'registration token' in error.get('message', '').lower()
+        return False
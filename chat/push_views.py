@@ -0,0 +1,36 @@
+# chat/push_views.py
+
+import json
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+from .models import PushDevice
+
+PLATFORMS = dict(PushDevice.PLATFORMS)
+
+
+@login_required
+@require_http_methods(['POST', 'DELETE'])
+def push_devices(request):
+    """Register (POST) or unregister (DELETE) this app install's push token"""
+    try:
+        payload = json.loads(request.body or b'{}')
+        token = str(payload['token']).strip()
+        platform = payload.get('platform', 'fcm')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
+    if not token or len(token) > PushDevice._meta.get_field('token').max_length:
+        return JsonResponse({'error': 'Invalid token'}, status=400)
+
+    if request.method == 'DELETE':
+        PushDevice.objects.filter(token=token, user=request.user).delete()
+        return JsonResponse({'success': True})
+
+    if platform not in PLATFORMS:
+        return JsonResponse({'error': f"Unknown platform. Use one of: {', '.join(PLATFORMS)}"}, status=400)
+    # A token belongs to one install; after a re-login it moves to the new user
+    device, created = PushDevice.objects.update_or_create(
+        token=token,
+        defaults={'user': request.user, 'platform': platform, 'is_active': True},
+    )
+    return JsonResponse({'success': True, 'id': device.id}, status=201 if created else 200)
@@ -0,0 +1,106 @@
+# chat/reactions.py
+# Reactions, reply threads and their materialized counts
+#
+# A message carries its reaction tally (Message.reaction_counts, {emoji: count}) and
+# its number of live replies (Message.reply_count), so history pages and thread
+# listings read counts straight off the rows. Reacting or replying only writes its own
+# row (a Reaction, or the reply message) and asks for a refresh of the message it
+# touched: a chat.tasks.refresh_counts task keyed by that message and due
+# REACTION_DEBOUNCE seconds later. Every further change in the window collapses into
+# the same pending task, so a burst on a popular message costs one UPDATE of its row
+# and one 'message_counts' event to the room group, instead of one of each per click.
+#
+# The refresh recounts the one message from its own rows, through the unique
+# (message, user, emoji) index and chat_msg_reply_idx, rather than adding deltas, so a
+# lost or retried task can never leave a count drifting.
+
+import json
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from . import tasks
+from .membership import room_group_name
+from .models import Message, Reaction
+from .retention import unexpired
+
+EMOJI_MAX_LENGTH = Reaction._meta.get_field('emoji').max_length
+
+
+def schedule_refresh(message_id):
+    """Refresh a message's counts at the end of the current debounce window"""
+    tasks.refresh_counts.enqueue(
+        key=f'chat.refresh_counts:{message_id}', delay=settings.REACTION_DEBOUNCE, message_id=message_id
+    )
+
+
+def react(room_id, user_id, message_id, emoji, remove=False):
+    """Add (or remove) a user's reaction to a message in the room; returns whether it was accepted"""
+    if not isinstance(emoji, str) or not emoji.strip() or len(emoji.strip()) > EMOJI_MAX_LENGTH:
+        return False
+    emoji = emoji.strip()
+    # Gates a write, so it reads the primary: a replica may not have the message yet
+    message = unexpired(
+        Message.objects.using('default').filter(id=message_id, chat_room_id=room_id)
+    ).values('reaction_counts').first()
+    if message is None:
+        return False
+    counts = message['reaction_counts'] or {}
+
+    if remove:
+        removed, _ = Reaction.objects.filter(message_id=message_id, user_id=user_id, emoji=emoji).delete()
+        if not removed:
+            return True
+    else:
+        # Checked against the tally, which may trail by one debounce window
+        if emoji not in counts and len(counts) >= settings.REACTION_MAX_KINDS:
+            return False
+        try:
+            with transaction.atomic():
+                Reaction.objects.bulk_create(
+                    [Reaction(message_id=message_id, user_id=user_id, emoji=emoji)], ignore_conflicts=True
+                )
+        except IntegrityError:
+            # The message was deleted in the meantime
+            return False
+    schedule_refresh(message_id)
+    return True
+
+
+def reply_parent(room_id, message_id):
+    """Whether a new message may reply to message_id: a live message in the same room (on the primary)"""
+    return unexpired(Message.objects.using('default').filter(id=message_id, chat_room_id=room_id)).exists()
+
+
+def refresh_counts(message_id):
+    """Recount a message's reactions and live replies, and send the result to its room"""
+    table = connection.ops.quote_name(Message._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {table} m SET
+                reaction_counts = (
+                    SELECT jsonb_object_agg(r.emoji, r.count) FROM (
+                        SELECT emoji, count(*) AS count FROM {connection.ops.quote_name(Reaction._meta.db_table)}
+                        WHERE message_id = m.id GROUP BY emoji
+                    ) r
+                ),
+                reply_count = (
+                    SELECT count(*) FROM {table} c WHERE c.reply_to_id = m.id AND c.deleted_at IS NULL
+                )
+            WHERE m.id = %s
+            RETURNING m.chat_room_id, m.reaction_counts, m.reply_count
+        """, [message_id])
+        row = cursor.fetchone()
+    if row is None:
+        # Reaped before the window closed; retention has told the room already
+        return False
+
+    room_id, reactions, reply_count = row
+    async_to_sync(get_channel_layer().group_send)(room_group_name(room_id), {
+        'type': 'message_counts',
+        'message_id': message_id,
+        # Django has psycopg2 hand jsonb over undecoded
+        'reactions': json.loads(reactions) if reactions else {},
+        'reply_count': reply_count,
+    })
+    return True
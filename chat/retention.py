@@ -0,0 +1,191 @@
+# chat/retention.py
+# Message retention: per-room retention windows and per-message TTLs
+#
+# reap() deletes expired messages in bounded batches. Each batch locks at most
+# RETENTION_BATCH_SIZE ids found through an index (chat_msg_expires_idx for TTLs,
+# chat_msg_room_ts_idx for room retention) with SELECT ... LIMIT n FOR UPDATE SKIP
+# LOCKED, deletes their read receipts, attachments, revisions and reactions, detaches
+# their replies and then deletes the messages by id, and commits. Attached media is
+# removed after the commit, and every affected room gets the whole batch in a single
+# 'messages_deleted' event, plus the new reply count of every surviving message that
+# lost replies in it (recounted in the batch, as chat.reactions would).
+# Between batches the reaper pauses for RETENTION_BATCH_PAUSE and waits while any
+# replica lags by more than RETENTION_MAX_REPLICA_LAG seconds, so a large backlog
+# never floods the WAL.
+
+import json
+import logging
+import time
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from private_chat_app import metrics
+from .membership import room_group_name
+from .models import Attachment, ChatRoom, Message, MessageReadReceipt, MessageRevision, Reaction
+from .storage import delete_chat_files
+
+logger = logging.getLogger('chat.retention')
+
+
+def expiry_for(ttl=None, room_ttl=None):
+    """Expiry of a new message: its own TTL in seconds if valid, else the room's"""
+    try:
+        ttl = int(ttl) if ttl not in (None, '') else None
+    except (TypeError, ValueError):
+        ttl = None
+    if not ttl or ttl <= 0:
+        ttl = room_ttl
+    if not ttl:
+        return None
+    return timezone.now() + timedelta(seconds=min(ttl, settings.MAX_MESSAGE_TTL))
+
+
+def unexpired(queryset):
+    """Hide messages that are past their TTL but not reaped yet, and deleted ones (chat.edits)"""
+    return queryset.exclude(expires_at__lte=timezone.now()).filter(deleted_at__isnull=True)
+
+
+def replica_lag():
+    """Worst replay lag in seconds across streaming replicas (0 without any, or off Postgres)"""
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COALESCE(EXTRACT(EPOCH FROM MAX(replay_lag)), 0) FROM pg_stat_replication')
+        return float(cursor.fetchone()[0])
+
+
+def _wait_for_replicas(pause):
+    while True:
+        lag = replica_lag()
+        if lag <= settings.RETENTION_MAX_REPLICA_LAG:
+            return
+        logger.info('Replicas are %.1fs behind; pausing deletes', lag)
+        time.sleep(max(pause, 1.0))
+
+
+def delete_batch(queryset, batch_size):
+    """Delete up to batch_size messages matched by queryset; returns how many went"""
+    with transaction.atomic():
+        rows = list(
+            queryset.select_for_update(skip_locked=True)
+            .values_list('id', 'chat_room_id')[:batch_size]
+        )
+        if not rows:
+            return 0
+        ids = [row[0] for row in rows]
+
+        # The raw DELETE of the messages skips Django's cascade, so dependent rows go first
+        receipts, _ = MessageReadReceipt.objects.filter(message_id__in=ids).delete()
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {Attachment._meta.db_table} WHERE message_id IN ({placeholders}) RETURNING url",
+                ids
+            )
+            files = [url for url, in cursor.fetchall()]
+            cursor.execute(
+                f"DELETE FROM {MessageRevision._meta.db_table} WHERE message_id IN ({placeholders})",
+                ids
+            )
+            cursor.execute(
+                f"DELETE FROM {Reaction._meta.db_table} WHERE message_id IN ({placeholders})",
+                ids
+            )
+            reaction_count = cursor.rowcount
+            # Replies outlive the messages they answer
+            cursor.execute(
+                f"UPDATE {Message._meta.db_table} SET reply_to_id = NULL WHERE reply_to_id IN ({placeholders})",
+                ids
+            )
+            cursor.execute(
+                f"DELETE FROM {Message._meta.db_table} WHERE id IN ({placeholders}) RETURNING reply_to_id",
+                ids
+            )
+            threads = list({parent_id for parent_id, in cursor.fetchall() if parent_id is not None})
+            counts = []
+            if threads:
+                cursor.execute(f"""
+                    UPDATE {Message._meta.db_table} m SET reply_count = (
+                        SELECT count(*) FROM {Message._meta.db_table} c WHERE c.reply_to_id = m.id AND c.deleted_at IS NULL
+                    )
+                    WHERE m.id = ANY(%s)
+                    RETURNING m.id, m.chat_room_id, m.reaction_counts, m.reply_count
+                """, [threads])
+                counts = cursor.fetchall()
+
+        by_room = {}
+        for message_id, room_id in rows:
+            by_room.setdefault(room_id, []).append(message_id)
+        transaction.on_commit(lambda: _after_delete(by_room, files, counts))
+
+    metrics.RETENTION_DELETED.inc(len(ids), kind='messages')
+    metrics.RETENTION_DELETED.inc(receipts, kind='receipts')
+    metrics.RETENTION_DELETED.inc(len(files), kind='attachments')
+    metrics.RETENTION_DELETED.inc(reaction_count, kind='reactions')
+    return len(ids)
+
+
+def _after_delete(by_room, files, counts):
+    if files:
+        deleted = delete_chat_files(files)
+        metrics.RETENTION_DELETED.inc(deleted, kind='files')
+
+    channel_layer = get_channel_layer()
+    for room_id, message_ids in by_room.items():
+        async_to_sync(channel_layer.group_send)(room_group_name(room_id), {
+            'type': 'messages_deleted',
+            'message_ids': message_ids,
+        })
+    for message_id, room_id, reactions, reply_count in counts:
+        async_to_sync(channel_layer.group_send)(room_group_name(room_id), {
+            'type': 'message_counts',
+            'message_id': message_id,
+            'reactions': json.loads(reactions) if reactions else {},
+            'reply_count': reply_count,
+        })
+
+
+def _drain(queryset, batch_size, pause, budget):
+    deleted = 0
+    while budget is None or budget > 0:
+        with metrics.RETENTION_BATCH_SECONDS.time():
+            count = delete_batch(queryset, batch_size)
+        deleted += count
+        if budget is not None:
+            budget -= 1
+        if count < batch_size:
+            break
+        time.sleep(pause)
+        _wait_for_replicas(pause)
+    return deleted, budget
+
+
+def reap(batch_size=None, max_batches=None, pause=None):
+    """Delete every message past its TTL or its room's retention window"""
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    pause = settings.RETENTION_BATCH_PAUSE if pause is None else pause
+    now = timezone.now()
+
+    expired, budget = _drain(
+        Message.objects.filter(expires_at__lte=now).order_by('expires_at'),
+        batch_size, pause, max_batches
+    )
+
+    retained = 0
+    rooms = ChatRoom.objects.filter(retention_seconds__isnull=False).values_list('id', 'retention_seconds')
+    for room_id, retention in rooms.iterator():
+        if budget is not None and budget <= 0:
+            break
+        count, budget = _drain(
+            Message.objects.filter(
+                chat_room_id=room_id,
+                timestamp__lt=now - timedelta(seconds=retention)
+            ).order_by('timestamp'),
+            batch_size, pause, budget
+        )
+        retained += count
+
+    return {'expired': expired, 'retention': retained}
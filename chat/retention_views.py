@@ -0,0 +1,66 @@
+# chat/retention_views.py
+
+import json
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+from .membership import room_group_name
+from .models import ChatRoom
+
+MIN_POLICY_SECONDS = 60
+POLICY_FIELDS = ('retention_seconds', 'message_ttl_seconds')
+
+
+def _policy(room):
+    return {field: getattr(room, field) for field in POLICY_FIELDS}
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def room_retention(request, room_id):
+    """Read (GET) or change (POST) a room's retention window and disappearing-message TTL"""
+    room = ChatRoom.objects.filter(id=room_id, participants=request.user).only(
+        'id', 'room_type', 'created_by_id', *POLICY_FIELDS
+    ).first()
+    if room is None:
+        return JsonResponse({'error': 'Chat room not found'}, status=404)
+    if request.method == 'GET':
+        return JsonResponse(_policy(room))
+
+    # The reaper deletes the whole room's history on this policy, so in a group only
+    # the creator may set it; a private room's two participants both can
+    if room.room_type == 'group' and room.created_by_id != request.user.id:
+        return JsonResponse({'error': 'Only the group creator can change retention'}, status=403)
+
+    try:
+        payload = json.loads(request.body or b'{}')
+        changes = {}
+        for field in POLICY_FIELDS:
+            if field in payload:
+                changes[field] = None if payload[field] is None else int(payload[field])
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
+
+    for field, seconds in changes.items():
+        if seconds is not None and not MIN_POLICY_SECONDS <= seconds <= settings.MAX_MESSAGE_TTL:
+            return JsonResponse({
+                'error': f'{field} must be between {MIN_POLICY_SECONDS} and {settings.MAX_MESSAGE_TTL} seconds'
+            }, status=400)
+    if not changes:
+        return JsonResponse(_policy(room))
+
+    for field, seconds in changes.items():
+        setattr(room, field, seconds)
+    with transaction.atomic():
+        room.save(update_fields=list(changes))
+        # Connected sockets pick up the new TTL for the messages they send next
+        event = {'type': 'retention_update', **_policy(room)}
+        transaction.on_commit(
+            lambda: async_to_sync(get_channel_layer().group_send)(room_group_name(room.id), event)
+        )
+
+    return JsonResponse({'success': True, **_policy(room)})
@@ -0,0 +1,118 @@
+# chat/storage.py
+# Storage backends for chat attachments
+#
+# CHAT_FILE_BACKEND = 'cloudinary' keeps the hosted setup. 'local' stores files
+# through any Django storage class (CHAT_FILE_STORAGE: the filesystem by default,
+# or an S3-compatible backend) and serves them from chat:serve_file, which checks
+# room membership and supports Range requests.
+
+import logging
+import re
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.urls import Resolver404, resolve, reverse
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('chat.storage')
+
+# .../<resource_type>/upload/[v<version>/]<public_id>[.<ext>]
+CLOUDINARY_DELIVERY_PATH = re.compile(r'/(image|video|raw)/upload/(?:v\d+/)?(.+)$')
+CLOUDINARY_DELETE_BATCH = 100  # public ids per Admin API call
+
+
+def _build_storage():
+    storage_class = import_string(settings.CHAT_FILE_STORAGE)
+    if issubclass(storage_class, FileSystemStorage):
+        return storage_class(location=settings.CHAT_FILE_ROOT)
+    return storage_class()
+
+
+chat_storage = SimpleLazyObject(_build_storage)
+
+
+def storage_name(room_id, name):
+    """Path of a chat file inside chat_storage"""
+    return f'{room_id}/{name}'
+
+
+def store_chat_file(file, room_id, unique_name, resource_type):
+    """Persist an uploaded file and return the URL stored on its attachment"""
+    if settings.CHAT_FILE_BACKEND == 'local':
+        chat_storage.save(storage_name(room_id, unique_name), file)
+        return reverse('chat:serve_file', args=[room_id, unique_name])
+
+    # Imported on first use: the SDK (and urllib3) add ~25ms to every worker's cold start
+    import cloudinary.uploader
+
+    upload_result = cloudinary.uploader.upload(
+        file,
+        folder=f"chat_files/{room_id}",
+        public_id=unique_name.rsplit('.', 1)[0],  # Remove extension from public_id
+        resource_type=resource_type
+    )
+    return upload_result['secure_url']
+
+
+def _local_name(url):
+    """Storage name behind a chat:serve_file URL, or None"""
+    try:
+        match = resolve(urlsplit(url).path)
+    except Resolver404:
+        return None
+    if match.view_name != 'chat:serve_file':
+        return None
+    return storage_name(match.kwargs['room_id'], match.kwargs['name'])
+
+
+def open_chat_file(url):
+    """Open a stored attachment for streaming reads, wherever it is hosted"""
+    if url.startswith('/'):
+        name = _local_name(url)
+        if name is None:
+            raise FileNotFoundError(url)
+        return chat_storage.open(name, 'rb')
+
+    from urllib.request import urlopen
+
+    return urlopen(url, timeout=30)
+
+
+def delete_chat_files(urls):
+    """Delete stored attachments given their URLs; returns how many went"""
+    local = []
+    hosted = {}
+    for url in urls:
+        if url.startswith('/'):
+            name = _local_name(url)
+            if name:
+                local.append(name)
+            continue
+        found = CLOUDINARY_DELIVERY_PATH.search(urlsplit(url).path)
+        if found:
+            resource_type, public_id = found.groups()
+            if resource_type != 'raw':
+                public_id = public_id.rsplit('.', 1)[0]  # Delivery format, not part of the id
+            hosted.setdefault(resource_type, []).append(public_id)
+
+    deleted = 0
+    for name in local:
+        try:
+            chat_storage.delete(name)
+            deleted += 1
+        except OSError as e:
+            logger.warning('Could not delete %s: %s', name, e)
+
+    if hosted:
+        import cloudinary.api
+
+        for resource_type, public_ids in hosted.items():
+            for start in range(0, len(public_ids), CLOUDINARY_DELETE_BATCH):
+                batch = public_ids[start:start + CLOUDINARY_DELETE_BATCH]
+                try:
+                    cloudinary.api.delete_resources(batch, resource_type=resource_type)
+                    deleted += len(batch)
+                except Exception as e:
+                    logger.warning('Could not delete %d Cloudinary %s file(s): %s', len(batch), resource_type, e)
+    return deleted
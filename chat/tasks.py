@@ -0,0 +1,61 @@
+# chat/tasks.py
+# Background tasks (tasks.queue) for chat: run by `manage.py run_tasks`, never in daphne
+
+from django.conf import settings
+from tasks.queue import PRIORITY_HIGH, PRIORITY_LOW, task
+from . import attachments, push, reactions
+from .export import claim_export, run_export
+from .retention import reap
+from .storage import delete_chat_files
+
+
+@task(priority=PRIORITY_HIGH, max_attempts=2, retry_delay=5)
+def notify_offline(room_id, message_id, sender_id):
+    """Queue pushes for the offline participants of a new message"""
+    if push.notify_offline(room_id, message_id, sender_id):
+        # Deliver now rather than at the next scheduled sweep; a burst shares one run
+        deliver_push.enqueue(key='chat.deliver_push')
+
+
+@task(max_attempts=1)
+def deliver_push():
+    """Send one claim of due push notifications, and come straight back if there were more"""
+    if push.deliver() >= settings.PUSH_CLAIM_SIZE:
+        deliver_push.enqueue(key='chat.deliver_push')
+
+
+@task(max_attempts=1)
+def resend_push(notifications, attempt):
+    """Retry push notifications a transport could not deliver (chat.push.schedule_retry)"""
+    push.resend(notifications, attempt)
+
+
+@task(priority=PRIORITY_LOW, retry_delay=30, timeout=600)
+def describe_attachments(message_id):
+    """Hash and inspect the attachments of a new message (chat.attachments)"""
+    attachments.describe_message(message_id)
+
+
+@task(max_attempts=3, retry_delay=5)
+def refresh_counts(message_id):
+    """Recount a message's reactions and replies and send them to its room (chat.reactions)"""
+    reactions.refresh_counts(message_id)
+
+
+@task(retry_delay=60)
+def delete_files(urls):
+    """Remove stored attachments whose rows are already gone"""
+    delete_chat_files(urls)
+
+
+@task(queue='bulk', priority=PRIORITY_LOW, max_attempts=1, timeout=6 * 3600)
+def reap_messages():
+    """One retention sweep, throttled batch by batch (chat.retention)"""
+    reap()
+
+
+@task(queue='bulk', max_attempts=1, timeout=24 * 3600)
+def run_exports():
+    """Run queued room exports (and resume abandoned ones) until none is left"""
+    while (export := claim_export()) is not None:
+        run_export(export)
@@ -1,3 +1,354 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import json
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from tasks.models import Task
+from . import push, retention
+from .keys import get_key_directory
+from .media_views import _parse_range
+from .membership import add_participants, remove_participants
+from .models import Attachment, ChatRoom, Message, MessageReadReceipt, PushDevice, PushNotification, Reaction
+from .storage import _local_name, storage_name
+from .throttling import OutboundQueue, QueueOverflow
 
-# Create your tests here.
+User = get_user_model()
+
+
+def make_user(name):
+    return User.objects.create_user(username=name, email=f'{name}@example.com', password='x')
+
+
+class ScriptedTransport(push.Transport):
+    """Answers by token prefix ('retry', 'invalid', else 'sent') and records what it was sent"""
+    sent = []
+
+    def send(self, notifications):
+        outcomes = []
+        for notification in notifications:
+            outcome = next((prefix for prefix in ('retry', 'invalid') if notification['token'].startswith(prefix)), 'sent')
+            if outcome == 'sent':
+                self.sent.append(notification['device_id'])
+            outcomes.append(outcome)
+        return outcomes
+
+
+class RoomRetentionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = make_user('creator')
+        cls.member = make_user('member')
+        cls.room = ChatRoom.objects.create(name='group', room_type='group', created_by=cls.creator)
+        cls.room.participants.add(cls.creator, cls.member)
+        cls.url = reverse('chat:room_retention', args=[cls.room.id])
+
+    def post(self, user, body):
+        self.client.force_login(user)
+        return self.client.post(self.url, json.dumps(body), content_type='application/json')
+
+    def test_member_reads_policy(self):
+        self.client.force_login(self.member)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'retention_seconds': None, 'message_ttl_seconds': None})
+
+    def test_non_creator_cannot_change_group_policy(self):
+        response = self.post(self.member, {'retention_seconds': 60})
+        self.assertEqual(response.status_code, 403)
+        self.room.refresh_from_db()
+        self.assertIsNone(self.room.retention_seconds)
+
+    def test_creator_changes_group_policy(self):
+        response = self.post(self.creator, {'retention_seconds': 3600})
+        self.assertEqual(response.status_code, 200)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.retention_seconds, 3600)
+
+    def test_either_participant_changes_private_policy(self):
+        room = ChatRoom.objects.create(name='dm', room_type='private', created_by=self.creator)
+        room.participants.add(self.creator, self.member)
+        self.client.force_login(self.member)
+        response = self.client.post(
+            reverse('chat:room_retention', args=[room.id]), json.dumps({'message_ttl_seconds': 600}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        room.refresh_from_db()
+        self.assertEqual(room.message_ttl_seconds, 600)
+
+
+class DeleteBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        cls.room = ChatRoom.objects.create(name='group', room_type='group', created_by=cls.user)
+
+    def message(self, expired=False, **kwargs):
+        expires_at = timezone.now() - timedelta(seconds=5) if expired else None
+        return Message.objects.create(chat_room=self.room, sender=self.user, encrypted_content='x', expires_at=expires_at, **kwargs)
+
+    def delete_batch(self, batch_size):
+        with self.captureOnCommitCallbacks() as callbacks:
+            count = retention.delete_batch(Message.objects.filter(expires_at__lte=timezone.now()).order_by('expires_at'), batch_size)
+        self.assertEqual(len(callbacks), 1 if count else 0)
+        return count
+
+    def test_batches_are_bounded(self):
+        for _ in range(3):
+            self.message(expired=True)
+        self.message()
+        self.assertEqual([self.delete_batch(2), self.delete_batch(2), self.delete_batch(2)], [2, 1, 0])
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_dependent_rows_go_and_replies_survive(self):
+        parent = self.message(reply_count=2)
+        self.message(expired=True, reply_to=parent)
+        live_reply = self.message(reply_to=parent)
+        expired = self.message(expired=True)
+        orphan = self.message(reply_to=expired)
+        Attachment.objects.create(message=expired, url='https://example.com/f', name='f')
+        MessageReadReceipt.objects.create(message=expired, user=self.user)
+        Reaction.objects.create(message=expired, user=self.user, emoji='+1')
+
+        self.assertEqual(self.delete_batch(10), 2)
+        self.assertEqual(sorted(Message.objects.values_list('id', flat=True)), sorted([parent.id, live_reply.id, orphan.id]))
+        self.assertFalse(Attachment.objects.exists())
+        self.assertFalse(MessageReadReceipt.objects.exists())
+        self.assertFalse(Reaction.objects.exists())
+        orphan.refresh_from_db()
+        self.assertIsNone(orphan.reply_to_id)
+        parent.refresh_from_db()
+        self.assertEqual(parent.reply_count, 1)
+
+
+class MembershipTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = make_user('owner')
+        cls.users = [make_user(f'user{n}') for n in range(3)]
+        cls.room = ChatRoom.objects.create(name='group', room_type='group', created_by=cls.creator)
+        cls.room.participants.add(cls.creator)
+
+    def setUp(self):
+        # The room keeps its id across tests, and the cache is not rolled back
+        caches[settings.KEY_DIRECTORY_CACHE].clear()
+
+    def member_ids(self):
+        return sorted(self.room.participants.values_list('id', flat=True))
+
+    def test_add_reports_only_inserted_rows(self):
+        first, second, third = [user.id for user in self.users]
+        self.assertEqual(add_participants(self.room, [first, second]), [first, second])
+        self.assertEqual(add_participants(self.room, [self.creator.id, second, third]), [third])
+        self.assertEqual(add_participants(self.room, [first]), [])
+        self.assertEqual(self.member_ids(), sorted([self.creator.id, first, second, third]))
+
+    def test_remove_reports_only_deleted_rows(self):
+        first, second, third = [user.id for user in self.users]
+        add_participants(self.room, [first, second])
+        self.assertEqual(remove_participants(self.room, [first, third]), [first])
+        self.assertEqual(remove_participants(self.room, [first]), [])
+        self.assertEqual(self.member_ids(), sorted([self.creator.id, second]))
+
+    def test_empty_batches_touch_nothing(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(add_participants(self.room, []), [])
+            self.assertEqual(remove_participants(self.room, []), [])
+
+    def test_changes_drop_the_key_directory_on_commit(self):
+        user = self.users[0]
+        self.assertNotIn(user.id, [key['user_id'] for key in get_key_directory(self.room.id)['keys']])
+        with self.captureOnCommitCallbacks(execute=True):
+            add_participants(self.room, [user.id])
+        self.assertIn(user.id, [key['user_id'] for key in get_key_directory(self.room.id)['keys']])
+        with self.captureOnCommitCallbacks(execute=True):
+            remove_participants(self.room, [user.id])
+        self.assertNotIn(user.id, [key['user_id'] for key in get_key_directory(self.room.id)['keys']])
+
+
+@override_settings(PUSH_TRANSPORTS={'fcm': 'chat.tests.ScriptedTransport'})
+class PushTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender, cls.alice, cls.bob, cls.carol = [make_user(name) for name in ('sender', 'alice', 'bob', 'carol')]
+        cls.room = ChatRoom.objects.create(name='group', room_type='group', created_by=cls.sender)
+        cls.room.participants.add(cls.sender, cls.alice, cls.bob, cls.carol)
+        cls.alice_ok = PushDevice.objects.create(user=cls.alice, token='ok-alice')
+        cls.alice_flaky = PushDevice.objects.create(user=cls.alice, token='retry-alice')
+        cls.bob_gone = PushDevice.objects.create(user=cls.bob, token='invalid-bob')
+        # carol has no device and is never queued
+
+    def setUp(self):
+        caches[settings.KEY_DIRECTORY_CACHE].clear()
+        caches[settings.PRESENCE_CACHE].clear()
+        push._transports.clear()
+        self.addCleanup(push._transports.clear)
+        ScriptedTransport.sent = []
+
+    def notify(self, message_id):
+        return push.notify_offline(self.room.id, message_id, self.sender.id)
+
+    def pending(self):
+        return dict(PushNotification.objects.values_list('user_id', 'pending'))
+
+    def test_burst_collapses_into_one_row_per_recipient(self):
+        self.assertEqual(self.notify(1), 2)
+        self.assertEqual(self.notify(2), 2)
+        self.assertEqual(self.pending(), {self.alice.id: 2, self.bob.id: 2})
+        self.assertEqual(set(PushNotification.objects.values_list('last_message_id', flat=True)), {2})
+
+    def test_present_participants_are_skipped(self):
+        async_to_sync(push.mark_present)(self.room.id, self.alice.id)
+        self.notify(1)
+        self.assertEqual(self.pending(), {self.bob.id: 1})
+
+    def test_claim_takes_due_rows_once_and_later_messages_wait_for_the_window(self):
+        self.notify(1)
+        self.notify(2)
+        claimed = push.claim_due(10)
+        self.assertEqual(sorted((row['user_id'], row['pending'], row['message_id']) for row in claimed), [
+            (self.alice.id, 2, 2), (self.bob.id, 2, 2),
+        ])
+        self.assertEqual(push.claim_due(10), [])
+
+        self.notify(3)
+        self.assertEqual(self.pending(), {self.alice.id: 1, self.bob.id: 1})
+        self.assertEqual(push.claim_due(10), [])
+
+    def test_deliver_retries_only_the_devices_that_failed(self):
+        self.notify(1)
+        self.assertEqual(push.deliver(), 1)
+        self.assertEqual(ScriptedTransport.sent, [self.alice_ok.id])
+        self.bob_gone.refresh_from_db()
+        self.assertFalse(self.bob_gone.is_active)
+
+        retry = Task.objects.get(name='chat.tasks.resend_push')
+        self.assertEqual(retry.kwargs['attempt'], 1)
+        self.assertEqual([n['device_id'] for n in retry.kwargs['notifications']], [self.alice_flaky.id])
+        self.assertNotIn('token', retry.kwargs['notifications'][0])
+
+        # Still failing: queued once more; then the device's new token gets through
+        self.assertEqual(push.resend(retry.kwargs['notifications'], 1), 0)
+        self.assertEqual(Task.objects.filter(name='chat.tasks.resend_push').latest('id').kwargs['attempt'], 2)
+        PushDevice.objects.filter(id=self.alice_flaky.id).update(token='ok-alice-2')
+        self.assertEqual(push.resend(retry.kwargs['notifications'], 2), 1)
+        self.assertEqual(ScriptedTransport.sent, [self.alice_ok.id, self.alice_flaky.id])
+
+
+class AttachmentCopyTests(TestCase):
+    """0008 and 0009 against the old file columns, which stay in the database until the next release"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.apps = MigrationExecutor(connection).loader.project_state(('chat', '0008_copy_attachments')).apps
+        cls.user = make_user('sender')
+        cls.room = ChatRoom.objects.create(name='group', room_type='group', created_by=cls.user)
+
+    def message(self, file=None, name=None, size=None):
+        message = Message.objects.create(chat_room=self.room, sender=self.user, encrypted_content='x')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE chat_message SET file = %s, file_name = %s, file_size = %s WHERE id = %s',
+                [file, name, size, message.id]
+            )
+        return message
+
+    def run_migration(self, module, function, **kwargs):
+        migration = importlib.import_module(f'chat.migrations.{module}')
+        with connection.schema_editor() as schema_editor:
+            return getattr(migration, function)(self.apps, schema_editor, **kwargs)
+
+    def attachments(self):
+        return list(Attachment.objects.order_by('message_id').values_list('message_id', 'position', 'url', 'name', 'size', 'mime_type'))
+
+    def test_copy_moves_every_file_once(self):
+        photo = self.message('https://example.com/a.png', 'a.png', 10)
+        self.message()
+        self.message('')
+        unnamed = self.message('https://example.com/b')
+        self.assertEqual(self.run_migration('0008_copy_attachments', 'copy_attachments', pause=0), unnamed.id)
+        self.run_migration('0008_copy_attachments', 'copy_attachments', pause=0)
+        self.assertEqual(self.attachments(), [
+            (photo.id, 0, 'https://example.com/a.png', 'a.png', 10, 'image/png'),
+            (unnamed.id, 0, 'https://example.com/b', 'file', 0, 'application/octet-stream'),
+        ])
+
+    def test_catch_up_copies_files_saved_since_the_copy(self):
+        copied = self.message('https://example.com/a.txt', 'a.txt', 1)
+        self.run_migration('0008_copy_attachments', 'copy_attachments', pause=0)
+        late = self.message('https://example.com/b.txt', 'b.txt', 2)
+        self.run_migration('0009_remove_message_file_columns', 'catch_up')
+        self.assertEqual([row[:2] for row in self.attachments()], [(copied.id, 0), (late.id, 0)])
+
+    def test_new_code_can_insert_without_the_old_columns(self):
+        message = Message.objects.create(chat_room=self.room, sender=self.user, encrypted_content='x')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT is_read, file FROM chat_message WHERE id = %s', [message.id])
+            self.assertEqual(cursor.fetchone(), (False, None))
+
+
+class OutboundQueueTests(SimpleTestCase):
+    def write_all(self, queue):
+        async def drain():
+            written = []
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), 0.01)
+                except asyncio.TimeoutError:
+                    return written
+                queue.wrote(frame)
+                written.append(frame['n'])
+        return asyncio.run(drain())
+
+    def test_unconfirmed_frames_hold_the_writer_until_a_pong(self):
+        queue = OutboundQueue(max_size=10, policy='drop_oldest', window=4)
+        for n in range(3):
+            queue.put({'type': 'message', 'n': n})
+        queue.put({'type': 'ping', 'n': 'ping'})
+        for n in range(3, 6):
+            queue.put({'type': 'message', 'n': n})
+        self.assertEqual(self.write_all(queue), [0, 1, 2, 'ping'])
+        self.assertFalse(queue.wants_ping())
+        queue.pong()
+        self.assertEqual(self.write_all(queue), [3, 4, 5])
+        self.assertTrue(queue.wants_ping())
+
+    def test_a_stalled_writer_lets_the_queue_overflow(self):
+        queue = OutboundQueue(max_size=2, policy='coalesce', window=1)
+        queue.put({'type': 'message', 'n': 0})
+        self.assertEqual(self.write_all(queue), [0])
+        queue.put({'type': 'message', 'n': 1})
+        queue.put({'type': 'message', 'n': 2})
+        queue.put({'type': 'message', 'n': 3}, resync_frame={'type': 'resync', 'n': 'resync'})
+        self.assertEqual(len(queue), 1)
+
+        queue = OutboundQueue(max_size=1, policy='disconnect', window=1)
+        queue.put({'type': 'message', 'n': 0})
+        with self.assertRaises(QueueOverflow):
+            queue.put({'type': 'message', 'n': 1})
+
+
+class StoredFileTests(SimpleTestCase):
+    def test_parse_range(self):
+        self.assertEqual(_parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(_parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(_parse_range('bytes=90-500', 100), (90, 99))
+        self.assertEqual(_parse_range('bytes=-10', 100), (90, 99))
+        self.assertIsNone(_parse_range('bytes=5-3', 100))
+        self.assertIsNone(_parse_range('bytes=0-1,5-6', 100))
+        self.assertIs(_parse_range('bytes=100-', 100), False)
+        self.assertIs(_parse_range('bytes=-0', 100), False)
+
+    def test_local_name_only_for_served_files(self):
+        url = reverse('chat:serve_file', args=[4, 'a.png'])
+        self.assertEqual(_local_name(url), storage_name(4, 'a.png'))
+        self.assertIsNone(_local_name(reverse('chat:room_retention', args=[4])))
+        self.assertIsNone(_local_name('/no/such/path'))
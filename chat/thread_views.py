@@ -0,0 +1,54 @@
+# chat/thread_views.py
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_safe
+from .models import ChatRoom, Message
+from .retention import unexpired
+
+
+@login_required
+@require_safe
+def message_replies(request, room_id, message_id):
+    """A page of replies to a message, oldest first, for the room's participants"""
+    # Membership on the primary (ChatRoom is never routed), then the thread itself
+    if not ChatRoom.objects.filter(id=room_id, participants=request.user).exists():
+        return JsonResponse({'error': 'Message not found'}, status=404)
+    parent = unexpired(Message.objects.filter(
+        id=message_id, chat_room_id=room_id
+    )).only('id', 'reply_count').first()
+    if parent is None:
+        return JsonResponse({'error': 'Message not found'}, status=404)
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid after'}, status=400)
+
+    # chat_msg_reply_idx walks the thread in id order; counts come off the rows
+    replies = list(
+        unexpired(Message.objects.filter(reply_to_id=parent.id, id__gt=after))
+        .select_related('sender').prefetch_related('attachments')
+        .order_by('id')[:settings.THREAD_PAGE_SIZE + 1]
+    )
+    more = len(replies) > settings.THREAD_PAGE_SIZE
+    replies = replies[:settings.THREAD_PAGE_SIZE]
+
+    return JsonResponse({
+        'message_id': parent.id,
+        'reply_count': parent.reply_count,
+        'replies': [
+            {
+                'message_id': reply.id,
+                'message': reply.attachments.all()[0].name if reply.attachments.all() else reply.encrypted_content,
+                'message_type': reply.message_type,
+                'sender': reply.sender.username,
+                'sender_id': reply.sender_id,
+                'timestamp': reply.timestamp.isoformat(),
+                'reactions': reply.reaction_counts or {},
+                'reply_count': reply.reply_count,
+            }
+            for reply in replies
+        ],
+        'next': replies[-1].id if more else None,
+    })
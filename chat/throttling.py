@@ -0,0 +1,149 @@
+# chat/throttling.py
+# Inbound rate limiting and outbound backpressure for ChatConsumer
+
+import asyncio
+import time
+import weakref
+from collections import OrderedDict, deque
+from django.conf import settings
+from private_chat_app.metrics import OUTBOUND_FRAMES, OUTBOUND_DISCONNECTS
+
+# One bucket per room per process; buckets go away with the last consumer holding them
+_room_buckets = weakref.WeakValueDictionary()
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `burst` stored"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def consume(self, tokens=1):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+
+def connection_bucket():
+    """Bucket limiting frames from a single socket"""
+    limits = settings.CHAT_RATE_LIMITS['connection']
+    return TokenBucket(limits['rate'], limits['burst'])
+
+
+def room_bucket(room_id):
+    """Bucket shared by every socket in a room on this process"""
+    bucket = _room_buckets.get(room_id)
+    if bucket is None:
+        limits = settings.CHAT_RATE_LIMITS['room']
+        bucket = TokenBucket(limits['rate'], limits['burst'])
+        _room_buckets[room_id] = bucket
+    return bucket
+
+
+class QueueOverflow(Exception):
+    """Raised when the outbound queue is full under the 'disconnect' policy"""
+
+
+class OutboundQueue:
+    """
+    Bounded per-consumer queue of frames waiting to be written to the socket.
+
+    Frames enqueued with a coalesce key replace any queued frame with the same key.
+    When the queue is full the policy decides what happens:
+      - 'coalesce':    the backlog collapses into a single resync frame
+      - 'drop_oldest': the oldest frame is discarded
+      - 'disconnect':  QueueOverflow is raised so the consumer can close with a resume hint
+
+    The queue only fills if the writer stops taking frames, and writing to the socket
+    never blocks: the server buffers whatever the client does not read. So the writer
+    reports every frame it writes (wrote()) and every pong (pong()); a pong confirms
+    all frames written up to its ping, which travelled behind them. get() holds frames
+    back while `window` written frames are unconfirmed.
+
+    close() queues one last frame behind everything already waiting (regardless of
+    max_size) and drops anything put after it, so a draining socket is flushed in order.
+    """
+
+    POLICIES = ('coalesce', 'drop_oldest', 'disconnect')
+
+    def __init__(self, max_size, policy, window):
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unknown outbound queue policy: {policy}')
+        self.max_size = max_size
+        self.policy = policy
+        self.window = window
+        self._items = OrderedDict()
+        self._seq = 0
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.written = 0
+        self.confirmed = 0
+        self._pings = deque()  # self.written as of each ping still waiting for its pong
+        self._confirmed = asyncio.Event()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, frame, coalesce_key=None, resync_frame=None):
+        if self.closed:
+            return
+
+        if coalesce_key is not None and coalesce_key in self._items:
+            self._items[coalesce_key] = frame
+            OUTBOUND_FRAMES.inc(outcome='coalesced')
+            return
+
+        if len(self._items) >= self.max_size:
+            if self.policy == 'disconnect':
+                OUTBOUND_DISCONNECTS.inc()
+                raise QueueOverflow()
+            if self.policy == 'coalesce' and resync_frame is not None:
+                OUTBOUND_FRAMES.inc(len(self._items), outcome='coalesced')
+                self._items.clear()
+                self._items['resync'] = resync_frame
+                self._ready.set()
+                return
+            self._items.popitem(last=False)
+            OUTBOUND_FRAMES.inc(outcome='dropped')
+
+        if coalesce_key is None:
+            self._seq += 1
+            coalesce_key = ('frame', self._seq)
+        self._items[coalesce_key] = frame
+        self._ready.set()
+
+    def close(self, final_frame):
+        self.closed = True
+        self._items['final'] = final_frame
+        self._ready.set()
+
+    async def get(self):
+        while self.written - self.confirmed >= self.window:
+            self._confirmed.clear()
+            await self._confirmed.wait()
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._items.popitem(last=False)[1]
+
+    def wrote(self, frame):
+        self.written += 1
+        if frame['type'] == 'ping':
+            self._pings.append(self.written)
+
+    def pong(self):
+        if self._pings:
+            self.confirmed = self._pings.popleft()
+            self._confirmed.set()
+
+    def wants_ping(self):
+        """Whether to ask for a confirmation now, well before the window fills up"""
+        return not self._pings and self.written - self.confirmed >= self.window // 2
@@ -4,8 +4,13 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
-from .models import ChatRoom, Message
-import cloudinary.uploader
+from django.db import transaction
+from private_chat_app import metrics
+from . import tasks
+from .attachments import as_event, guess_mime_type, signed_fields
+from .models import Attachment, ChatRoom, Message
+from .retention import expiry_for
+from .storage import delete_chat_files, store_chat_file
 import uuid
 
 @login_required
@@ -18,73 +23,82 @@ def upload_file(request, room_id):
     except ChatRoom.DoesNotExist:
         return JsonResponse({'error': 'Chat room not found'}, status=404)
     
-    if 'file' not in request.FILES:
+    files = request.FILES.getlist('file')
+    if not files:
         return JsonResponse({'error': 'No file provided'}, status=400)
-    
-    file = request.FILES['file']
-    
-    # Validate file size
-    if file.size > settings.MAX_FILE_SIZE:
+    if len(files) > settings.MAX_ATTACHMENTS:
         return JsonResponse({
-            'error': f'File too large. Max size: {settings.MAX_FILE_SIZE / (1024*1024)}MB'
+            'error': f'Too many files. Max per message: {settings.MAX_ATTACHMENTS}'
         }, status=400)
     
-    # Validate file extension
-    ext = file.name.split('.')[-1].lower()
-    if ext not in settings.ALLOWED_FILE_EXTENSIONS:
-        return JsonResponse({
-            'error': f'File type not allowed. Allowed: {", ".join(settings.ALLOWED_FILE_EXTENSIONS)}'
-        }, status=400)
-    
-    # Determine message type and Cloudinary resource type
-    message_type = 'file'
-    resource_type = 'raw'  # Default for documents/files
-    
-    if ext in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-        message_type = 'image'
-        resource_type = 'image'
-    elif ext in ['mp4', 'mov', 'avi']:
-        message_type = 'video'
-        resource_type = 'video'
-    elif ext in ['mp3', 'wav']:
-        message_type = 'audio'
-        resource_type = 'raw'
+    uploads = []
+    for file in files:
+        # Validate file size
+        if file.size > settings.MAX_FILE_SIZE:
+            return JsonResponse({
+                'error': f'File too large. Max size: {settings.MAX_FILE_SIZE / (1024*1024)}MB'
+            }, status=400)
+        
+        # Validate file extension
+        ext = file.name.split('.')[-1].lower()
+        if ext not in settings.ALLOWED_FILE_EXTENSIONS:
+            return JsonResponse({
+                'error': f'File type not allowed. Allowed: {", ".join(settings.ALLOWED_FILE_EXTENSIONS)}'
+            }, status=400)
+        uploads.append((file, ext) + _file_types(ext))
     
-    # Generate unique filename
-    unique_name = f"{uuid.uuid4()}.{ext}"
+    # A message of several files is an image (or video...) message only if they all are
+    kinds = {message_type for _, _, message_type, _ in uploads}
+    message_type = kinds.pop() if len(kinds) == 1 else 'file'
     
+    stored = []
     try:
-        # Upload to Cloudinary with correct resource_type
-        upload_result = cloudinary.uploader.upload(
-            file,
-            folder=f"chat_files/{room_id}",
-            public_id=unique_name.rsplit('.', 1)[0],  # Remove extension from public_id
-            resource_type=resource_type
-        )
-        
-        file_url = upload_result['secure_url']
+        for file, ext, file_type, resource_type in uploads:
+            # Generate unique filename
+            unique_name = f"{uuid.uuid4()}.{ext}"
+            # Store via the configured backend (Cloudinary or local/object storage)
+            with metrics.UPLOAD_SECONDS.time(message_type=file_type):
+                stored.append(store_chat_file(file, room_id, unique_name, resource_type))
+            metrics.UPLOAD_BYTES.inc(file.size, message_type=file_type)
 
     except Exception as e:
+        delete_chat_files(stored)
         return JsonResponse({
             'error': f'Upload failed: {str(e)}'
         }, status=500)
     
-    # Create message (store Cloudinary URL in file field)
-    message = Message.objects.create(
-        chat_room=room,
-        sender=request.user,
-        message_type=message_type,
-        encrypted_content=file.name,
-        file=file_url,  # Store Cloudinary URL
-        file_name=file.name,
-        file_size=file.size
-    )
+    with transaction.atomic():
+        message = Message.objects.create(
+            chat_room=room,
+            sender=request.user,
+            message_type=message_type,
+            encrypted_content=', '.join(file.name for file, *_ in uploads),
+            expires_at=expiry_for(request.POST.get('ttl'), room.message_ttl_seconds)
+        )
+        attachments = Attachment.objects.bulk_create([
+            Attachment(
+                message=message, position=position, url=url, name=file.name, size=file.size,
+                mime_type=guess_mime_type(file.name),
+            )
+            for position, (url, (file, *_)) in enumerate(zip(stored, uploads))
+        ])
+        # Hash, dimensions and duration are worked out by a worker, off the request
+        tasks.describe_attachments.enqueue(message_id=message.id)
     
     return JsonResponse({
         'success': True,
         'message_id': message.id,
-        'file_url': file_url,
-        'file_name': message.file_name,
-        'file_size': message.file_size,
-        'message_type': message_type
+        'message_type': message_type,
+        **signed_fields([as_event(attachment) for attachment in attachments], message.id, request.user.id),
     })
+
+
+def _file_types(ext):
+    """(message type, Cloudinary resource type) for a file extension"""
+    if ext in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
+        return 'image', 'image'
+    if ext in ['mp4', 'mov', 'avi']:
+        return 'video', 'video'
+    if ext in ['mp3', 'wav']:
+        return 'audio', 'raw'
+    return 'file', 'raw'  # Default for documents/files
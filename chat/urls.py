@@ -2,7 +2,7 @@
 # Location: C:\private_chat_app\private_chat_app\chat\urls.py
 
 from django.urls import path
-from . import views, upload_views
+from . import views, upload_views, group_views, key_views, media_views, retention_views, export_views, push_views, edit_views, thread_views
 
 app_name = 'chat'
 
@@ -11,4 +11,15 @@ urlpatterns = [
     path('room/<int:room_id>/', views.chat_room, name='chat_room'),
     path('create-room/', views.create_room, name='create_room'),
     path('upload/<int:room_id>/', upload_views.upload_file, name='upload_file'),  # New
+    path('files/<int:room_id>/<str:name>', media_views.serve_file, name='serve_file'),
+    path('room/<int:room_id>/keys/', key_views.room_keys, name='room_keys'),
+    path('room/<int:room_id>/retention/', retention_views.room_retention, name='room_retention'),
+    path('room/<int:room_id>/messages/<int:message_id>/history/', edit_views.message_history, name='message_history'),
+    path('room/<int:room_id>/messages/<int:message_id>/replies/', thread_views.message_replies, name='message_replies'),
+    path('room/<int:room_id>/export/', export_views.export_room, name='export_room'),
+    path('exports/<int:export_id>/', export_views.export_status, name='export_status'),
+    path('push/devices/', push_views.push_devices, name='push_devices'),
+    path('groups/<int:room_id>/invite/', group_views.invite_members, name='invite_members'),
+    path('groups/<int:room_id>/remove/', group_views.remove_members, name='remove_members'),
+    path('groups/<int:room_id>/leave/', group_views.leave_group, name='leave_group'),
 ]
\ No newline at end of file
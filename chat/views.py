@@ -5,8 +5,12 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth import get_user_model
-from .models import ChatRoom, Message
-from django.db.models import Q
+from django.db import router, transaction
+from .membership import Membership
+from .models import ChatRoom, Message, Reaction
+from .retention import unexpired
+from .signing import sign_messages
+from django.db.models import Count, OuterRef, Q, Subquery
 
 User = get_user_model()
 
@@ -17,6 +21,13 @@ def chat_list(request):
     chat_rooms = ChatRoom.objects.filter(
         participants=request.user,
         is_active=True
+    ).annotate(
+        # Counted in the same query instead of once per card in the template. A
+        # subquery of its own, since the filter's join only holds the current user
+        participant_count=Subquery(
+            Membership.objects.filter(chatroom_id=OuterRef('pk'))
+            .values('chatroom_id').annotate(count=Count('*')).values('count')
+        )
     ).order_by('-updated_at')
     
     return render(request, 'chat/chat_list.html', {
@@ -29,8 +40,28 @@ def chat_room(request, room_id):
     """Display a specific chat room with messages"""
     room = get_object_or_404(ChatRoom, id=room_id, participants=request.user)
     
-    # Get all messages in this room
-    messages_list = Message.objects.filter(chat_room=room).select_related('sender')
+    # History may be read from a replica. The room's change seq is read from the same
+    # one, before the messages, so it never covers an edit the page doesn't show yet;
+    # the client syncs from it on connect
+    alias = router.db_for_read(Message)
+    change_seq = ChatRoom.objects.using(alias).filter(id=room.id).values_list('change_seq', flat=True).first() or 0
+    
+    # Get all messages in this room, with media URLs signed for this user in one pass
+    messages_list = sign_messages(
+        list(
+            unexpired(Message.objects.using(alias).filter(chat_room=room))
+            .select_related('sender').prefetch_related('attachments')
+        ),
+        request.user.id
+    )
+    
+    # Reaction and reply counts are on the rows; only which reactions are this user's
+    # own takes a query, one for the whole room
+    mine = {}
+    for message_id, emoji in Reaction.objects.filter(user=request.user, message__chat_room=room).values_list('message_id', 'emoji'):
+        mine.setdefault(message_id, set()).add(emoji)
+    for message in messages_list:
+        message.my_reactions = mine.get(message.id, ())
     
     # Get other participants
     other_participants = room.participants.exclude(id=request.user.id)
@@ -38,6 +69,7 @@ def chat_room(request, room_id):
     return render(request, 'chat/chat_room.html', {
         'room': room,
         'messages': messages_list,
+        'change_seq': change_seq,
         'other_participants': other_participants,
     })
 
@@ -50,30 +82,32 @@ def create_room(request):
         room_type = request.POST.get('room_type', 'private')
         participant_emails = request.POST.getlist('participants')
         
-        # Create the room
-        room = ChatRoom.objects.create(
-            name=room_name,
-            room_type=room_type,
-            created_by=request.user
-        )
+        # Normalise and de-duplicate the submitted emails
+        participant_emails = {email.strip() for email in participant_emails if email.strip()}
         
-        # Add creator as participant
-        room.participants.add(request.user)
+        with transaction.atomic():
+            room = ChatRoom.objects.create(
+                name=room_name,
+                room_type=room_type,
+                created_by=request.user
+            )
+            
+            # Resolve every participant with a single email__in lookup
+            users = list(User.objects.filter(email__in=participant_emails).only('id', 'email'))
+            
+            # Creator plus resolved participants in one bulk insert on the through table
+            member_ids = {request.user.id} | {user.id for user in users}
+            ChatRoom.participants.through.objects.bulk_create([
+                ChatRoom.participants.through(chatroom_id=room.id, user_id=user_id)
+                for user_id in member_ids
+            ])
         
-        # Add other participants
-        for email in participant_emails:
-            try:
-                user = User.objects.get(email=email)
-                room.participants.add(user)
-            except User.DoesNotExist:
-                messages.warning(request, f'User with email {email} not found.')
+        found_emails = {user.email for user in users}
+        for email in sorted(participant_emails - found_emails):
+            messages.warning(request, f'User with email {email} not found.')
         
         messages.success(request, f'Chat room "{room_name}" created successfully!')
         return redirect('chat:chat_room', room_id=room.id)
     
-    # Get all users except current user for the participant list
-    users = User.objects.exclude(id=request.user.id)
-    
-    return render(request, 'chat/create_room.html', {
-        'users': users
-    })
\ No newline at end of file
+    # Participants are picked through the accounts:user_search autocomplete endpoint
+    return render(request, 'chat/create_room.html')
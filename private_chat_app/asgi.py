@@ -12,8 +12,18 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'private_chat_app.settings')
 django_asgi_app = get_asgi_application()
 
 # Import routing AFTER get_asgi_application()
+from django.conf import settings
 from chat.routing import websocket_urlpatterns
 
+# Daphne only starts listening once this module is imported
+if settings.WARMUP_ON_STARTUP:
+    from private_chat_app.warmup import warmup
+    warmup()
+
+# Drain sockets on SIGTERM instead of dropping them
+from chat import drain
+drain.install()
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
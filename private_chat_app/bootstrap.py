@@ -0,0 +1,221 @@
+# private_chat_app/bootstrap.py
+# Connection bootstrap: cached DNS, happy-eyeballs address selection and
+# pre-established DB / channel-layer connections
+#
+# Every phase is timed into the connection_phase_seconds histogram (dns, tcp_race,
+# db_connect, channel_layer) and the latest value per phase is kept in `timings`,
+# so both /metrics and the warmup log show where a cold connection spends its time.
+
+import asyncio
+import errno
+import ipaddress
+import logging
+import selectors
+import socket
+import sys
+import threading
+import time
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger('private_chat_app.bootstrap')
+
+timings = {}
+
+_dns_cache = {}
+_preferred = {}
+_lock = threading.Lock()
+
+
+def _record(phase, seconds):
+    timings[phase] = seconds
+    metrics.CONNECT_PHASE_SECONDS.observe(seconds, phase=phase)
+
+
+def _is_ip(host):
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def _interleave(addresses):
+    """Order addresses IPv6-first, alternating families (RFC 8305 section 4)"""
+    v6 = [address for address in addresses if address[0] == socket.AF_INET6]
+    v4 = [address for address in addresses if address[0] != socket.AF_INET6]
+    ordered = []
+    for pair in zip(v6, v4):
+        ordered.extend(pair)
+    longer = v6 if len(v6) > len(v4) else v4
+    return ordered + longer[min(len(v6), len(v4)):]
+
+
+def resolve(host, port):
+    """
+    Return [(family, sockaddr)] for host:port, cached for DNS_CACHE_TTL seconds.
+    If a refresh fails, the stale entry keeps being served until DNS recovers.
+    """
+    key = (host, port)
+    now = time.monotonic()
+    with _lock:
+        cached = _dns_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    start = time.perf_counter()
+    try:
+        infos = socket.getaddrinfo(host, port, socket.AF_UNSPEC, socket.SOCK_STREAM)
+    except OSError:
+        if cached:
+            logger.warning('DNS refresh for %s failed, serving cached addresses', host)
+            return cached[1]
+        raise
+    _record('dns', time.perf_counter() - start)
+
+    addresses = []
+    for family, _, _, _, sockaddr in infos:
+        if (family, sockaddr) not in addresses:
+            addresses.append((family, sockaddr))
+    addresses = _interleave(addresses)
+    with _lock:
+        _dns_cache[key] = (now + settings.DNS_CACHE_TTL, addresses)
+    return addresses
+
+
+def happy_eyeballs(addresses, timeout=5.0, delay=None):
+    """
+    Race TCP connects to `addresses`, starting the next attempt every `delay`
+    seconds (or as soon as one fails), and return the first sockaddr to connect.
+    """
+    delay = settings.HAPPY_EYEBALLS_DELAY if delay is None else delay
+    selector = selectors.DefaultSelector()
+    pending = list(addresses)
+    attempts = []
+    errors = []
+    deadline = time.monotonic() + timeout
+    next_start = time.monotonic()
+
+    try:
+        while pending or attempts:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+
+            if pending and (now >= next_start or not attempts):
+                family, sockaddr = pending.pop(0)
+                sock = socket.socket(family, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                result = sock.connect_ex(sockaddr)
+                if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    errors.append(OSError(result, f'{sockaddr[0]}: {errno.errorcode.get(result, result)}'))
+                    sock.close()
+                    continue
+                selector.register(sock, selectors.EVENT_WRITE, sockaddr)
+                attempts.append(sock)
+                next_start = now + delay
+
+            wait_until = min(deadline, next_start) if pending else deadline
+            for key, _ in selector.select(max(wait_until - time.monotonic(), 0)):
+                sock = key.fileobj
+                selector.unregister(sock)
+                attempts.remove(sock)
+                result = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                sock.close()
+                if result == 0:
+                    return key.data
+                errors.append(OSError(result, f'{key.data[0]}: {errno.errorcode.get(result, result)}'))
+                next_start = time.monotonic()  # A failure starts the next attempt right away
+    finally:
+        for sock in attempts:
+            selector.unregister(sock)
+            sock.close()
+        selector.close()
+
+    raise OSError(f"Could not connect to any of {[sockaddr[0] for _, sockaddr in addresses]}: {errors or 'timed out'}")
+
+
+def preferred_address(host, port):
+    """
+    The IP to connect to for host:port: the winner of a happy-eyeballs race,
+    remembered for DNS_CACHE_TTL seconds. Returns None if nothing is reachable
+    (callers then let the driver resolve and fail with its own error).
+    """
+    if _is_ip(host):
+        return host
+
+    key = (host, port)
+    now = time.monotonic()
+    with _lock:
+        cached = _preferred.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    try:
+        addresses = resolve(host, port)
+        if len(addresses) == 1:
+            address = addresses[0][1][0]
+        else:
+            start = time.perf_counter()
+            address = happy_eyeballs(addresses)[0]
+            _record('tcp_race', time.perf_counter() - start)
+    except OSError as e:
+        logger.warning('Could not pick an address for %s:%s: %s', host, port, e)
+        return cached[1] if cached else None
+
+    with _lock:
+        _preferred[key] = (now + settings.DNS_CACHE_TTL, address)
+    return address
+
+
+# -- Pre-established connections ----------------------------------------------
+
+def prewarm_database(alias='default', count=None):
+    """Open `count` connections into the backend's pool (private_chat_app.db only)"""
+    from django.db import connections
+    from .db.base import DatabaseWrapper
+
+    count = settings.DB_PREWARM_CONNECTIONS if count is None else count
+    wrapper = connections.create_connection(alias)
+    if not isinstance(wrapper, DatabaseWrapper) or count <= 0:
+        return 0
+    return wrapper.prewarm(count)
+
+
+async def _open_channel_layer_connections(layer, count):
+    start = time.perf_counter()
+    for index in range(len(getattr(layer, 'hosts', ()))):
+        connection = layer.connection(index)
+        # Concurrent commands each check out their own pooled connection
+        await asyncio.gather(*(connection.ping() for _ in range(count)))
+    _record('channel_layer', time.perf_counter() - start)
+
+
+def prewarm_channel_layer(count=None):
+    """
+    Open `count` Redis connections per channel-layer shard on the loop daphne
+    serves from. Channel-layer pools are bound to an event loop, so when the
+    asyncio reactor is installed the work is scheduled onto that loop and runs
+    as soon as it starts; otherwise it runs now on a temporary loop (which still
+    resolves and verifies the Redis hosts).
+    """
+    from channels.layers import get_channel_layer
+
+    count = settings.CHANNEL_LAYER_PREWARM_CONNECTIONS if count is None else count
+    layer = get_channel_layer()
+    if layer is None or not hasattr(layer, 'connection') or count <= 0:
+        return
+
+    reactor = sys.modules.get('twisted.internet.reactor')
+    loop = getattr(reactor, '_asyncioEventloop', None)
+    if loop is not None and not loop.is_closed():
+        future = asyncio.run_coroutine_threadsafe(_open_channel_layer_connections(layer, count), loop)
+        future.add_done_callback(_log_prewarm_failure)
+    else:
+        from asgiref.sync import async_to_sync
+        async_to_sync(_open_channel_layer_connections)(layer, count)
+
+
+def _log_prewarm_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning('Channel layer prewarm failed: %s', future.exception())
@@ -0,0 +1,141 @@
+# private_chat_app/db/base.py
+# PostgreSQL backend with bootstrap address selection and a per-process pool
+#
+# Django opens one connection per thread, and under ASGI every HTTP request runs in
+# a thread of its own, so CONN_MAX_AGE never gets to reuse anything there. With
+# this backend, closing a connection hands it back to a process-wide pool of up to
+# DB_POOL_SIZE idle connections and the next connect() on any thread takes it back
+# out, so CONN_MAX_AGE should stay 0. Pooled connections must not carry session
+# state (SET, temporary tables, session-level advisory locks).
+
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection as Psycopg2Connection
+from private_chat_app import bootstrap, metrics
+
+# Connections idle for longer than this are pinged before being handed out
+PING_AFTER = 30
+
+
+class PooledConnection(Psycopg2Connection):
+    """psycopg2 connection that remembers when it was opened and last returned"""
+    created_at = 0.0
+    returned_at = 0.0
+
+
+class ConnectionPool:
+    def __init__(self, size, max_lifetime):
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.idle = deque()
+        self.lock = threading.Lock()
+
+    def _usable(self, connection):
+        now = time.monotonic()
+        if connection.closed or now - connection.created_at > self.max_lifetime:
+            return False
+        if now - connection.returned_at > PING_AFTER:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            except Exception:
+                return False
+        return True
+
+    def checkout(self):
+        while True:
+            with self.lock:
+                if not self.idle:
+                    return None
+                connection = self.idle.pop()  # LIFO: the most recently used connection is the warmest
+            if self._usable(connection):
+                metrics.DB_POOL_CHECKOUTS.inc(outcome='reused')
+                return connection
+            connection.close()
+
+    def checkin(self, connection):
+        """Keep a connection for reuse; returns False if the caller should close it"""
+        if connection.closed:
+            return False
+        if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except Exception:
+                return False
+        connection.returned_at = time.monotonic()
+        with self.lock:
+            if len(self.idle) >= self.size:
+                return False
+            self.idle.append(connection)
+        return True
+
+    def __len__(self):
+        return len(self.idle)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(conn_params):
+    # Keyed by what identifies the server and session, not the resolved address
+    key = tuple(sorted(
+        (name, str(value)) for name, value in conn_params.items()
+        if name not in ('hostaddr', 'connection_factory')
+    ))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(settings.DB_POOL_SIZE, settings.DB_POOL_MAX_LIFETIME)
+    return pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        host = params.get('host')
+        if host and not host.startswith('/') and 'hostaddr' not in params:
+            # libpq connects to hostaddr but still verifies TLS against host
+            address = bootstrap.preferred_address(host, int(params.get('port') or 5432))
+            if address:
+                params['hostaddr'] = address
+        params['connection_factory'] = PooledConnection
+        return params
+
+    def get_new_connection(self, conn_params):
+        self._pool = get_pool(conn_params)
+        connection = self._pool.checkout()
+        if connection is not None:
+            options = self.settings_dict['OPTIONS']
+            self.isolation_level = IsolationLevel(options.get('isolation_level', IsolationLevel.READ_COMMITTED))
+            return connection
+        return self._open_connection(conn_params)
+
+    def _open_connection(self, conn_params):
+        start = time.perf_counter()
+        connection = super().get_new_connection(conn_params)
+        connection.created_at = connection.returned_at = time.monotonic()
+        bootstrap._record('db_connect', time.perf_counter() - start)
+        metrics.DB_POOL_CHECKOUTS.inc(outcome='opened')
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                # Inside an atomic block Django keeps referencing the connection until
+                # the block exits, so it cannot be handed to another thread
+                if self.in_atomic_block or not self._pool.checkin(self.connection):
+                    self.connection.close()
+
+    def prewarm(self, count):
+        """Open connections straight into the pool; returns how many it now holds"""
+        params = self.get_connection_params()
+        pool = get_pool(params)
+        for _ in range(max(count - len(pool), 0)):
+            if not pool.checkin(self._open_connection(params)):
+                break
+        return len(pool)
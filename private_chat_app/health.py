@@ -0,0 +1,12 @@
+# private_chat_app/health.py
+
+import os
+from django.http import JsonResponse
+from chat import drain
+
+
+def healthz(request):
+    """Liveness probe for the worker supervisor (manage.py serve) and load balancers"""
+    if drain.draining:
+        return JsonResponse({'status': 'draining', 'pid': os.getpid()}, status=503)
+    return JsonResponse({'status': 'ok', 'pid': os.getpid()})
@@ -0,0 +1,332 @@
+# private_chat_app/metrics.py
+# Low-overhead, multi-process Prometheus-style metrics
+#
+# Updates are plain dict operations under a lock in the current process. When
+# METRICS_DIR is set, a daemon thread writes this process' snapshot there every
+# METRICS_FLUSH_INTERVAL seconds, and the /metrics view merges every snapshot, so
+# the endpoint reports the whole box no matter which daphne worker serves it. The
+# counters and histograms of workers that have exited are folded into a single file
+# the first time a collect finds them, so restarts don't leave a snapshot each behind.
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.http import HttpResponse
+
+# Counters and histograms of exited workers, folded into one file (fold_exited)
+EXITED_SNAPSHOT = 'exited.json'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = {}
+_lock = threading.Lock()
+_flusher = None
+_claimed = False  # Whether this process has taken over its snapshot file
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _registry[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def snapshot(self):
+        with _lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _ensure_flusher()
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _ensure_flusher()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                # [per-bucket counts..., +Inf count, sum]
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-1] += value
+        _ensure_flusher()
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+# -- Flushing snapshots for multi-process aggregation -------------------------
+
+def _snapshot_path(pid):
+    return os.path.join(settings.METRICS_DIR, f'metrics-{pid}.json')
+
+
+def local_snapshot():
+    return {
+        'pid': os.getpid(),
+        'metrics': {name: metric.snapshot() for name, metric in _registry.items()},
+    }
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(path, snapshot):
+    fd, tmp_path = tempfile.mkstemp(dir=settings.METRICS_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as handle:
+        json.dump(snapshot, handle)
+    os.replace(tmp_path, path)
+
+
+def flush():
+    """Atomically write this process' snapshot into METRICS_DIR"""
+    global _claimed
+    if not settings.METRICS_DIR:
+        return
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    path = _snapshot_path(os.getpid())
+    if not _claimed:
+        # Left by an exited worker that had the same pid; this process is about to overwrite it
+        if os.path.exists(path):
+            fold_exited([path])
+        _claimed = True
+    _write_snapshot(path, local_snapshot())
+
+
+def fold_exited(paths):
+    """
+    Add the counters and histograms of exited workers' snapshots to EXITED_SNAPSHOT and
+    delete them, so their totals stay without a file for every worker ever started
+    """
+    with open(os.path.join(settings.METRICS_DIR, '.lock'), 'a') as lock:
+        # Held across read, write and unlink, or two collectors could fold a file twice
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        exited_path = os.path.join(settings.METRICS_DIR, EXITED_SNAPSHOT)
+        merged = {}
+        _merge(merged, _read_snapshot(exited_path) or {'metrics': {}})
+        folded = []
+        for path in paths:
+            snapshot = _read_snapshot(path)
+            if snapshot is None:
+                continue  # Folded by another process meanwhile
+            _merge(merged, snapshot, gauges=False)
+            folded.append(path)
+        if not folded:
+            return
+        _write_snapshot(exited_path, {
+            'pid': None,
+            'metrics': {name: [[list(key), value] for key, value in samples.items()] for name, samples in merged.items()},
+        })
+        for path in folded:
+            os.unlink(path)
+
+
+def _flush_forever():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None and settings.METRICS_DIR:
+        with _lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_forever, name='metrics-flush', daemon=True)
+                _flusher.start()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(merged, snapshot, gauges=True):
+    """Add a snapshot's samples into merged ({name: {label values: value}})"""
+    for name, samples in snapshot['metrics'].items():
+        metric = _registry.get(name)
+        if metric is None or (metric.kind == 'gauge' and not gauges):
+            continue
+        target = merged.setdefault(name, {})
+        for key, value in samples:
+            key = tuple(key)
+            if metric.kind == 'histogram':
+                current = target.get(key)
+                target[key] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                target[key] = target.get(key, 0) + value
+
+
+def collect():
+    """Merge snapshots from every process (live snapshot for this one)"""
+    snapshots = [local_snapshot()]
+    if settings.METRICS_DIR and os.path.isdir(settings.METRICS_DIR):
+        exited = []
+        for filename in os.listdir(settings.METRICS_DIR):
+            if not (filename.startswith('metrics-') and filename.endswith('.json')):
+                continue
+            path = os.path.join(settings.METRICS_DIR, filename)
+            snapshot = _read_snapshot(path)
+            if snapshot is None or snapshot['pid'] == os.getpid():
+                continue
+            if _pid_alive(snapshot['pid']):
+                snapshots.append(snapshot)
+            else:
+                exited.append(path)
+        if exited:
+            fold_exited(exited)
+        # Counters and histograms of exited workers stay monotonic; their gauges vanish
+        snapshot = _read_snapshot(os.path.join(settings.METRICS_DIR, EXITED_SNAPSHOT))
+        if snapshot is not None:
+            snapshots.append(snapshot)
+
+    merged = {name: {} for name in _registry}
+    for snapshot in snapshots:
+        _merge(merged, snapshot)
+    return merged
+
+
+def _escape(value, quote=True):
+    """Escape a label value (or, with quote=False, HELP text) for the text format"""
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quote else value
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values) if value != '']
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render():
+    """Render every metric in the Prometheus text exposition format"""
+    lines = []
+    for name, samples in collect().items():
+        metric = _registry[name]
+        lines.append(f'# HELP {name} {_escape(metric.documentation, quote=False)}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for key, value in sorted(samples.items()):
+            if metric.kind != 'histogram':
+                lines.append(f'{name}{_format_labels(metric.labelnames, key)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ('+Inf',), value[:-1]):
+                cumulative += count
+                labels = _format_labels(metric.labelnames, key, [('le', bound)])
+                lines.append(f'{name}_bucket{labels} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(metric.labelnames, key)} {value[-1]}')
+            lines.append(f'{name}_count{_format_labels(metric.labelnames, key)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Expose metrics to Prometheus (bearer token, or staff session if no token is set)"""
+    if settings.METRICS_TOKEN:
+        if request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+            return HttpResponse(status=401)
+    elif not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponse(status=403)
+
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# -- Metric definitions -------------------------------------------------------
+
+ACTIVE_SOCKETS = Gauge('chat_active_sockets', 'Open chat WebSockets', ['pid'])
+CONNECT_SECONDS = Histogram('chat_connect_seconds', 'Time spent in ChatConsumer.connect')
+AUTH_SECONDS = Histogram('chat_auth_seconds', 'Time spent checking room membership on connect')
+SAVE_MESSAGE_SECONDS = Histogram('chat_save_message_seconds', 'Time spent in ChatConsumer.save_message')
+GROUP_SEND_SECONDS = Histogram('chat_group_send_seconds', 'Time spent in channel layer group_send')
+FRAMES_THROTTLED = Counter('chat_frames_throttled_total', 'Inbound frames rejected by rate limits', ['scope'])
+OUTBOUND_FRAMES = Counter('chat_outbound_frames_total', 'Outbound frames coalesced or dropped by backpressure', ['outcome'])
+OUTBOUND_DISCONNECTS = Counter('chat_outbound_disconnects_total', 'Sockets closed because their outbound queue overflowed')
+UPLOAD_BYTES = Counter('chat_upload_bytes_total', 'Bytes received by upload_file', ['message_type'])
+UPLOAD_SECONDS = Histogram('chat_upload_seconds', 'Time spent storing an upload', ['message_type'])
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests by view and status', ['view', 'status'])
+HTTP_REQUEST_SECONDS = Histogram('http_request_seconds', 'HTTP request latency by view', ['view'])
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+HTTP_VIEW_QUERIES = Histogram('http_view_queries', 'ORM queries per request by view', ['view'], buckets=QUERY_BUCKETS)
+HTTP_VIEW_DB_SECONDS = Histogram('http_view_db_seconds', 'DB time per request by view', ['view'])
+CONSUMER_QUERIES = Histogram('chat_consumer_queries', 'ORM queries per consumer handler call', ['handler'], buckets=QUERY_BUCKETS)
+CONSUMER_DB_SECONDS = Histogram('chat_consumer_db_seconds', 'DB time per consumer handler call', ['handler'])
+WARMUP_SECONDS = Histogram('worker_warmup_seconds', 'Time spent in each worker warmup phase before accepting traffic', ['phase'])
+CONNECT_PHASE_SECONDS = Histogram('connection_phase_seconds', 'Time spent per connection bootstrap phase', ['phase'])
+DB_POOL_CHECKOUTS = Counter('db_pool_checkouts_total', 'Database connections handed out, by whether they were reused or newly opened', ['outcome'])
+REAPED_SOCKETS = Counter('chat_reaped_sockets_total', 'Sockets closed after going silent past their idle timeout', ['client'])
+DEAD_SOCKET_FRAMES = Counter('chat_dead_socket_frames_total', 'Frames written to sockets after their last inbound frame, counted when they are reaped', ['client'])
+RETENTION_DELETED = Counter('chat_retention_deleted_total', 'Rows and files removed by the retention reaper', ['kind'])
+RETENTION_BATCH_SECONDS = Histogram('chat_retention_batch_seconds', 'Time spent deleting one retention batch')
+DRAIN_SECONDS = Histogram('chat_drain_seconds', 'Time a stopping worker spent draining its sockets')
+DRAINED_SOCKETS = Counter('chat_drained_sockets_total', 'Sockets closed by a draining worker, by whether they finished in time', ['outcome'])
+PUSH_QUEUED = Counter('chat_push_queued_total', 'Offline push notifications queued, by whether they collapsed into a pending one', ['outcome'])
+PUSH_SENT = Counter('chat_push_sent_total', 'Push notifications handed to a transport, by outcome', ['platform', 'outcome'])
+PUSH_BATCH_SECONDS = Histogram('chat_push_batch_seconds', 'Time spent delivering one push batch', ['platform'])
+EMAIL_SENT = Counter('email_sent_total', 'Queued emails attempted by the sender, by outcome', ['outcome'])
+EMAIL_CONNECTIONS = Counter('email_smtp_connections_total', 'SMTP connections opened by the mail sender')
+EMAIL_BATCH_SECONDS = Histogram('email_batch_seconds', 'Time spent sending one batch of queued email')
+TASK_LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+TASKS_ENQUEUED = Counter('tasks_enqueued_total', 'Background tasks enqueued', ['task'])
+TASKS_FINISHED = Counter('tasks_finished_total', 'Background task runs, by outcome', ['task', 'outcome'])
+TASK_SECONDS = Histogram('task_run_seconds', 'Time spent running a background task', ['task'], buckets=TASK_LATENCY_BUCKETS)
+TASK_LATENCY_SECONDS = Histogram('task_latency_seconds', 'Time a background task waited between becoming due and starting', ['task'], buckets=TASK_LATENCY_BUCKETS)
+DB_ROUTED_READS = Counter('db_routed_reads_total', 'Reads of replica-eligible models, by target and why they stayed on the primary', ['target', 'reason'])
+REPLICA_LAG_SECONDS = Histogram('db_replica_lag_seconds', 'Replay lag seen by each replica probe', ['alias'], buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0))
@@ -0,0 +1,35 @@
+# private_chat_app/paginators.py
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Admin paginator that never runs an unbounded COUNT(*) on a large table.
+
+    Unfiltered changelists use the planner's estimate from pg_class.reltuples;
+    filtered ones count at most ADMIN_COUNT_CAP rows.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        cap = settings.ADMIN_COUNT_CAP
+
+        if not queryset.query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            # reltuples is -1 (or stale-small) before the first ANALYZE; fall through then
+            if row and row[0] >= cap:
+                return row[0]
+
+        # Counting a LIMITed subquery bounds the work to `cap` index entries
+        return queryset[:cap].count()
@@ -0,0 +1,142 @@
+# private_chat_app/profiling.py
+# Query-count and DB-time budgets for views and consumer handlers
+#
+# Every HTTP view and every decorated consumer handler runs inside a QueryTracker.
+# Budgets live in settings.QUERY_BUDGETS keyed by URL name ('chat:chat_list') or
+# handler name ('consumer:save_message'). QUERY_BUDGET_MODE decides what happens
+# when one is exceeded: 'raise' (tests; DB time only warns there), 'warn' (development)
+# or 'log' (production, where only a QUERY_TRACE_SAMPLE_RATE share of slow or
+# over-budget traces is logged).
+
+import functools
+import logging
+import random
+import time
+import warnings
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from . import metrics
+
+logger = logging.getLogger('private_chat_app.profiling')
+
+MAX_TRACE_QUERIES = 50
+# Transaction control, like the BEGIN and COMMIT that never reach an execute wrapper;
+# under TestCase every atomic() block turns into a pair of these
+SAVEPOINT_PREFIXES = ('SAVEPOINT ', 'RELEASE SAVEPOINT ', 'ROLLBACK TO SAVEPOINT ')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in 'raise' mode when an endpoint runs more queries than its budget allows"""
+
+
+class QueryBudgetWarning(UserWarning):
+    """Emitted in 'warn' mode when an endpoint goes over its query budget"""
+
+
+class QueryTracker:
+    """Count queries and DB time on the current thread's connections, replicas included"""
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.db_time += duration
+            if not sql.startswith(SAVEPOINT_PREFIXES):
+                self.count += 1
+                if len(self.queries) < MAX_TRACE_QUERIES:
+                    self.queries.append((duration, sql))
+
+    def __enter__(self):
+        # Every alias: routed reads (private_chat_app.replicas) count against the budget too
+        self._wrappers = ExitStack()
+        for alias in connections:
+            self._wrappers.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._wrappers.__exit__(*exc_info)
+
+
+def check_budget(endpoint, tracker, elapsed):
+    """Compare a finished tracker against its budget and act according to the mode"""
+    budget = settings.QUERY_BUDGETS.get(endpoint)
+    db_ms = tracker.db_time * 1000
+
+    problems = []
+    over_queries = bool(budget) and tracker.count > budget['queries']
+    if over_queries:
+        problems.append(f"{tracker.count} queries (budget {budget['queries']})")
+    if budget and db_ms > budget['db_ms']:
+        problems.append(f"{db_ms:.1f}ms DB time (budget {budget['db_ms']}ms)")
+
+    mode = settings.QUERY_BUDGET_MODE
+    # DB time depends on the machine and its load, so only the query count fails a test
+    if over_queries and mode == 'raise':
+        raise QueryBudgetExceeded(f"{endpoint}: {', '.join(problems)}")
+    if problems and mode in ('raise', 'warn'):
+        warnings.warn(f"{endpoint}: {', '.join(problems)}", QueryBudgetWarning, stacklevel=3)
+        return
+
+    slow = elapsed * 1000 >= settings.QUERY_SLOW_MS
+    if (problems or slow) and random.random() < settings.QUERY_TRACE_SAMPLE_RATE:
+        slowest = sorted(tracker.queries, reverse=True)[:5]
+        logger.warning(
+            'Slow trace %s: %.1fms total, %d queries, %.1fms DB%s\n%s',
+            endpoint, elapsed * 1000, tracker.count, db_ms,
+            f" - over budget: {', '.join(problems)}" if problems else '',
+            '\n'.join(f'  {duration * 1000:.1f}ms {sql[:300]}' for duration, sql in slowest),
+        )
+
+
+class QueryBudgetMiddleware:
+    """Profile every view: record query metrics and enforce per-URL budgets"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with QueryTracker() as tracker:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.HTTP_REQUESTS.inc(view=view, status=response.status_code)
+        metrics.HTTP_REQUEST_SECONDS.observe(elapsed, view=view)
+        metrics.HTTP_VIEW_QUERIES.observe(tracker.count, view=view)
+        metrics.HTTP_VIEW_DB_SECONDS.observe(tracker.db_time, view=view)
+
+        check_budget(view, tracker, elapsed)
+        return response
+
+
+def track_queries(name):
+    """
+    Profile a synchronous consumer handler under the budget 'consumer:<name>'.
+    Apply it below @database_sync_to_async so it runs on the DB thread.
+    """
+    endpoint = f'consumer:{name}'
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            with QueryTracker() as tracker:
+                result = func(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+
+            metrics.CONSUMER_QUERIES.observe(tracker.count, handler=name)
+            metrics.CONSUMER_DB_SECONDS.observe(tracker.db_time, handler=name)
+            check_budget(endpoint, tracker, elapsed)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,185 @@
+# private_chat_app/replicas.py
+# Read replicas with read-your-writes
+#
+# ReplicaRouter sends reads of REPLICA_READ_MODELS (message history and receipts) to
+# one of the healthy REPLICA_DATABASES, and everything else, writes included, to
+# 'default'. Authorization lookups (rooms, memberships, users, sessions) stay on the
+# primary, so a lagging replica can never let a removed member back in.
+#
+# A routed read still goes to the primary when:
+#   - it runs inside a transaction on 'default', which may hold uncommitted writes;
+#   - the current unit of work (an HTTP request, a consumer event) has written;
+#   - its user wrote anything in the last REPLICA_PIN_SECONDS, through any process or
+#     socket: a unit that wrote leaves a pin in REPLICA_PIN_CACHE when it ends;
+#   - no replica is within REPLICA_MAX_LAG seconds of the primary. Each process probes
+#     its replicas' replay lag every REPLICA_LAG_CHECK_INTERVAL seconds and skips any
+#     that is behind or unreachable until it catches up.
+#
+# Code outside a unit of work (management commands, tasks) reads replicas unpinned.
+
+import logging
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connections
+from . import metrics
+
+logger = logging.getLogger('private_chat_app.replicas')
+
+_unit = ContextVar('replica_unit', default=None)
+
+# Replay lag on a standby; 0 on a server that is not replaying (or has caught up)
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def _pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+class UnitOfWork:
+    """One request or consumer event: whether it wrote, and whether its user is pinned"""
+
+    def __init__(self, identity=None, primary=False):
+        self.identity = identity  # callable returning the user id, resolved only if needed
+        self.primary = primary
+        self.wrote = False
+        self._checked = False
+
+    def primary_reason(self):
+        """Why routed reads must use the primary, or None"""
+        if self.wrote:
+            return 'wrote'
+        if not self.primary and not self._checked:
+            self._checked = True
+            user_id = self.identity() if self.identity else None
+            self.primary = user_id is not None and bool(caches[settings.REPLICA_PIN_CACHE].get(_pin_key(user_id)))
+        return 'pinned' if self.primary else None
+
+    def _pin_user(self):
+        return self.identity() if self.wrote and self.identity else None
+
+    def finish(self):
+        user_id = self._pin_user()
+        if user_id is not None:
+            caches[settings.REPLICA_PIN_CACHE].set(_pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+
+    async def afinish(self):
+        user_id = self._pin_user()
+        if user_id is not None:
+            await caches[settings.REPLICA_PIN_CACHE].aset(_pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+
+
+@contextmanager
+def unit_of_work(identity=None, primary=False):
+    unit = UnitOfWork(identity, primary)
+    token = _unit.set(unit)
+    try:
+        yield unit
+    finally:
+        _unit.reset(token)
+        unit.finish()
+
+
+@asynccontextmanager
+async def aunit_of_work(identity=None, primary=False):
+    """unit_of_work for async code; database_sync_to_async calls inside it share the unit"""
+    unit = UnitOfWork(identity, primary)
+    token = _unit.set(unit)
+    try:
+        yield unit
+    finally:
+        _unit.reset(token)
+        await unit.afinish()
+
+
+class ReplicaPinMiddleware:
+    """Make every request a unit of work, pinned per user"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with unit_of_work(lambda: request.user.id if request.user.is_authenticated else None):
+            return self.get_response(request)
+
+
+# -- Replica health -----------------------------------------------------------
+
+_health_lock = threading.Lock()
+_healthy = []
+_checked_at = None
+
+
+def probe(alias):
+    """Replay lag of a replica in seconds, or None if it cannot be reached"""
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            return float(cursor.fetchone()[0])
+    except DatabaseError as e:
+        logger.warning('Replica %s is unreachable: %s', alias, e)
+        return None
+
+
+def healthy_replicas():
+    """Replicas within REPLICA_MAX_LAG, re-probed by one thread every REPLICA_LAG_CHECK_INTERVAL"""
+    global _healthy, _checked_at
+    now = time.monotonic()
+    if (_checked_at is None or now - _checked_at >= settings.REPLICA_LAG_CHECK_INTERVAL) \
+            and _health_lock.acquire(blocking=False):
+        try:
+            healthy = []
+            for alias in settings.REPLICA_DATABASES:
+                lag = probe(alias)
+                if lag is None:
+                    continue
+                metrics.REPLICA_LAG_SECONDS.observe(lag, alias=alias)
+                if lag <= settings.REPLICA_MAX_LAG:
+                    healthy.append(alias)
+                else:
+                    logger.info('Replica %s is %.1fs behind; reading from the primary', alias, lag)
+            _healthy, _checked_at = healthy, time.monotonic()
+        finally:
+            _health_lock.release()
+    return _healthy
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not settings.REPLICA_DATABASES or model._meta.label_lower not in settings.REPLICA_READ_MODELS:
+            return None
+        unit = _unit.get()
+        if connections['default'].in_atomic_block:
+            reason = 'transaction'
+        else:
+            reason = unit.primary_reason() if unit is not None else None
+        if reason is None:
+            replicas = healthy_replicas()
+            if replicas:
+                metrics.DB_ROUTED_READS.inc(target='replica', reason='')
+                return random.choice(replicas)
+            reason = 'lagging'
+        metrics.DB_ROUTED_READS.inc(target='primary', reason=reason)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        unit = _unit.get()
+        if unit is not None:
+            unit.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data, so objects read from any of them may be related
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
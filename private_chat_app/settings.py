@@ -1,13 +1,14 @@
 import os
-from decouple import config
+import sys
+from decouple import Csv, config
 from pathlib import Path
 import dj_database_url
-import cloudinary
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = config('SECRET_KEY', default='your-secret-key-here')
 DEBUG = config('DEBUG', default=True, cast=bool)
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test' or 'pytest' in sys.modules
 
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', '0.0.0.0', '10.0.2.2', '*','private-chat-app-j5to.onrender.com']
 CSRF_TRUSTED_ORIGINS = [
@@ -24,20 +25,19 @@ DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
 INSTALLED_APPS = [
     'daphne',  # MUST be first!
-    'django.contrib.admin',
+    # Autodiscovery runs from the HTTP urlconf (see urls.py), not from app loading
+    'django.contrib.admin.apps.SimpleAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'cloudinary_storage',
     'django.contrib.staticfiles',
-    'cloudinary',
     'channels',
     'corsheaders',
-    'crispy_forms',
-    'crispy_bootstrap5',
     'accounts',
     'chat',
+    'tasks',
 ]
 
 AUTH_USER_MODEL = 'accounts.User'
@@ -46,10 +46,12 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'private_chat_app.profiling.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'private_chat_app.replicas.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -81,14 +83,14 @@ if os.environ.get('DATABASE_URL'):
     DATABASES = {
         'default': dj_database_url.config(
             default=os.environ['DATABASE_URL'],
-            conn_max_age=600
+            engine='private_chat_app.db',
         )
     }
 else:
     # Local development database
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': 'private_chat_app.db',
             'NAME': config('DB_NAME', default='railway'),
             'USER': config('DB_USER', default='postgres'),
             'PASSWORD': config('DB_PASSWORD', default=''),
@@ -100,14 +102,49 @@ else:
         }
     }
 
+# Read replicas (private_chat_app.replicas): reads of REPLICA_READ_MODELS go to a
+# replica within REPLICA_MAX_LAG of the primary; everything else, and every read by a
+# user who wrote in the last REPLICA_PIN_SECONDS, stays on 'default'.
+REPLICA_DATABASES = []
+for index, url in enumerate(config('DATABASE_REPLICA_URLS', default='', cast=Csv())):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = dj_database_url.parse(url, engine='private_chat_app.db')
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    REPLICA_DATABASES.append(alias)
+DATABASE_ROUTERS = ['private_chat_app.replicas.ReplicaRouter']
+REPLICA_READ_MODELS = ['chat.message', 'chat.attachment', 'chat.messagerevision', 'chat.reaction', 'chat.messagereadreceipt']  # app_label.model
+REPLICA_MAX_LAG = 2             # seconds; replicas further behind are skipped until they catch up
+REPLICA_LAG_CHECK_INTERVAL = 5  # seconds between lag probes, per process
+REPLICA_PIN_SECONDS = 10        # reads stay on the primary this long after a user's write
+REPLICA_PIN_CACHE = 'default'   # cache alias; must be shared by every worker in production
+
+# Connection bootstrap (private_chat_app.bootstrap). The private_chat_app.db engine is
+# the PostgreSQL backend plus cached, happy-eyeballs address selection and a
+# per-process pool, so connections are reused across request threads even with
+# CONN_MAX_AGE=0 (which returns them to the pool after every request).
+DNS_CACHE_TTL = config('DNS_CACHE_TTL', default=60, cast=int)  # seconds
+HAPPY_EYEBALLS_DELAY = 0.25  # seconds before racing the next address (RFC 8305)
+# Not under tests: the runner cannot drop the test database while the pool holds a connection to it
+DB_POOL_SIZE = config('DB_POOL_SIZE', default=0 if TESTING else 10, cast=int)  # idle connections kept per process
+DB_POOL_MAX_LIFETIME = 30 * 60  # seconds before a pooled connection is retired
+DB_PREWARM_CONNECTIONS = config('DB_PREWARM_CONNECTIONS', default=2, cast=int)
+CHANNEL_LAYER_PREWARM_CONNECTIONS = config('CHANNEL_LAYER_PREWARM_CONNECTIONS', default=2, cast=int)
+
 # Channel Layers - works locally and on Railway
 if os.environ.get('REDIS_URL'):
-    # Railway production Redis
+    # Railway production Redis. Required with `manage.py serve --workers N`: every
+    # worker publishes and receives through Redis, so a group_send from any worker
+    # reaches sockets held by all of them. Add more URLs to "hosts" to shard
+    # channels across Redis instances (every worker must list them in the same order).
     CHANNEL_LAYERS = {
         'default': {
             'BACKEND': 'channels_redis.core.RedisChannelLayer',
             'CONFIG': {
                 "hosts": [os.environ.get('REDIS_URL')],
+                # Frames buffered per socket channel before group_send drops them
+                "capacity": 1000,
+                # Must outlive the longest socket, or long-lived members silently fall out of groups
+                "group_expiry": 24 * 60 * 60,
             },
         },
     }
@@ -119,6 +156,13 @@ else:
         }
     }
 
+# Cache - per-process memory for development; settings_production layers it over Redis
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
 # CORS for mobile app
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -150,17 +194,25 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
-# Crispy Forms
-CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
-CRISPY_TEMPLATE_PACK = "bootstrap5"
-
 # Email Settings
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.gmail.com')
 EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
-EMAIL_USE_TLS = True
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)  # False for the local sink (manage.py smtp_sink)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_TIMEOUT = 10  # seconds; a hung server fails the attempt instead of stalling the sender
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default=EMAIL_HOST_USER or 'webmaster@localhost')
+SITE_URL = config('SITE_URL', default='http://localhost:8000')  # base of links in emails
+
+# Mail queue (accounts.mail, sent by the accounts.tasks.send_queued_email task)
+EMAIL_BATCH_SIZE = 50          # messages claimed per transaction
+EMAIL_MAX_ATTEMPTS = 6
+EMAIL_RETRY_BASE = 30          # seconds before the first retry; doubles with every attempt
+EMAIL_RETRY_MAX = 3600         # seconds; longest wait between attempts
+EMAIL_CONNECTION_IDLE = 60     # seconds an open SMTP connection may sit unused before it is closed
+EMAIL_POLL_INTERVAL = 2        # seconds between scheduled sends (TASK_SCHEDULE)
+EMAIL_VERIFICATION_MAX_AGE = 3 * 24 * 3600  # seconds a verification link stays valid
 
 # Security Settings
 SECURE_BROWSER_XSS_FILTER = True
@@ -177,4 +229,176 @@ ALLOWED_FILE_EXTENSIONS = [
     'mp3', 'wav',  # Audio
     'zip', 'rar'  # Archives
 ]
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
\ No newline at end of file
+MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+MAX_ATTACHMENTS = config('MAX_ATTACHMENTS', default=10, cast=int)  # Files per message
+
+# Chat file storage: 'cloudinary' (hosted) or 'local' (self-hosted, any Django storage class)
+CHAT_FILE_BACKEND = config('CHAT_FILE_BACKEND', default='cloudinary')
+CHAT_FILE_STORAGE = config('CHAT_FILE_STORAGE', default='django.core.files.storage.FileSystemStorage')
+CHAT_FILE_ROOT = config('CHAT_FILE_ROOT', default=str(MEDIA_ROOT / 'chat_files'))
+# Offload local file transfers to the front proxy: '' (stream from Django), 'nginx'
+# (X-Accel-Redirect to an internal location mapped to CHAT_FILE_ROOT) or 'sendfile'
+# (X-Sendfile for Apache/lighttpd)
+CHAT_FILE_ACCEL = config('CHAT_FILE_ACCEL', default='')
+CHAT_FILE_ACCEL_PREFIX = config('CHAT_FILE_ACCEL_PREFIX', default='/protected/chat_files/')
+
+# Signed media URLs: valid for at least MEDIA_URL_TTL, expiry rounded up to MEDIA_URL_WINDOW
+MEDIA_URL_TTL = 6 * 60 * 60
+MEDIA_URL_WINDOW = 60 * 60
+
+# Group membership
+MAX_MEMBERSHIP_BATCH = 5000  # users per invite/remove request (and wrapped keys per upload)
+
+# End-to-end encryption key directory
+KEY_DIRECTORY_CACHE_TTL = 60 * 60  # seconds; invalidated on membership and public-key changes
+KEY_DIRECTORY_CACHE = 'default'  # cache alias; must be shared by every worker in production
+
+# WebSocket rate limiting and backpressure
+CHAT_RATE_LIMITS = {
+    'connection': {'rate': 5, 'burst': 20},   # inbound frames/sec per socket
+    'room': {'rate': 50, 'burst': 200},       # inbound frames/sec per room, per worker process
+}
+CHAT_OUTBOUND_QUEUE = {
+    'max_size': 256,        # frames buffered per socket
+    'policy': 'coalesce',   # 'coalesce' | 'drop_oldest' | 'disconnect'
+    'window': 128,          # frames written but not yet confirmed by a pong before writing stops
+}
+
+# Message retention (chat.retention, run by the chat.tasks.reap_messages task)
+RETENTION_BATCH_SIZE = 500        # messages deleted per transaction
+RETENTION_BATCH_PAUSE = 0.2       # seconds between batches
+RETENTION_MAX_REPLICA_LAG = 5     # seconds; deletes wait while a replica is further behind
+RETENTION_INTERVAL = 60           # seconds between scheduled sweeps (TASK_SCHEDULE)
+MAX_MESSAGE_TTL = 365 * 24 * 3600  # longest per-message or per-room TTL, in seconds
+
+# Room exports (chat.export). Background jobs run in the chat.tasks.run_exports task
+# and keep their work files in EXPORT_ROOT until deleted.
+EXPORT_ROOT = config('EXPORT_ROOT', default=str(MEDIA_ROOT / 'exports'))
+EXPORT_CHUNK_SIZE = 2000      # rows per server-side cursor fetch and per checkpoint
+EXPORT_STALE_AFTER = 300      # seconds without a checkpoint before another runner resumes a job
+EXPORT_MAX_ATTEMPTS = 3
+EXPORT_POLL_INTERVAL = 5      # seconds between scheduled sweeps for abandoned jobs (TASK_SCHEDULE)
+
+# Heartbeat (ChatConsumer.heartbeat): the server pings every interval and closes a
+# socket that has sent nothing, not even a pong, for its client type's idle timeout.
+# Clients pick their type with ?client=; unknown types count as 'web'.
+CHAT_HEARTBEAT_INTERVAL = 25  # seconds
+CHAT_IDLE_TIMEOUTS = {
+    'web': 75,       # seconds: three missed pings
+    'desktop': 75,
+    'mobile': 150,   # backgrounded apps get their timers throttled
+}
+
+# Graceful drain on SIGTERM (chat.drain). Clients reconnect at a random point within
+# the window; DRAIN_TIMEOUT must stay below `serve --graceful-timeout` (30s).
+DRAIN_RECONNECT_WINDOW = config('DRAIN_RECONNECT_WINDOW', default=10, cast=float)  # seconds
+DRAIN_TIMEOUT = config('DRAIN_TIMEOUT', default=20, cast=float)  # seconds
+CHAT_RESUME_LIMIT = 200  # missed messages replayed on reconnect before falling back to a resync
+CHAT_SYNC_LIMIT = 500  # edits and deletions synced on reconnect (since_seq) before falling back to a resync
+
+# Reactions and reply threads (chat.reactions). A message's counts are refreshed, and
+# sent to its room, at most once per REACTION_DEBOUNCE however busy it gets.
+REACTION_DEBOUNCE = config('REACTION_DEBOUNCE', default=1.0, cast=float)  # seconds
+REACTION_MAX_KINDS = 20  # distinct emoji per message
+THREAD_PAGE_SIZE = 100  # replies per thread request
+
+# Offline push notifications (chat.push, delivered by the chat.tasks.deliver_push task).
+# Presence must live in a cache every worker shares, or sockets on other workers
+# look offline and their users get pushed anyway.
+PRESENCE_CACHE = 'default'  # cache alias
+PRESENCE_TTL = 60  # seconds; refreshed on every heartbeat, so keep it above CHAT_HEARTBEAT_INTERVAL
+PUSH_COLLAPSE_WINDOW = 30  # seconds after a room's last push in which new messages collapse into the next one
+PUSH_TRANSPORTS = {
+    # 'chat.push.LocalTransport' is a stand-in that logs (and writes PUSH_LOCAL_OUTBOX)
+    'fcm': config('PUSH_FCM_TRANSPORT', default='chat.push.LocalTransport'),  # or chat.push.FCMTransport
+    'apns': config('PUSH_APNS_TRANSPORT', default='chat.push.LocalTransport'),
+}
+PUSH_LOCAL_OUTBOX = config('PUSH_LOCAL_OUTBOX', default='')
+PUSH_FCM_PROJECT_ID = config('PUSH_FCM_PROJECT_ID', default='')
+PUSH_FCM_CREDENTIALS = config('PUSH_FCM_CREDENTIALS', default='')  # service account JSON file
+PUSH_FCM_CONCURRENCY = 10     # parallel requests per batch (the v1 API takes one message each)
+PUSH_BATCH_SIZE = 500         # notifications per transport call
+PUSH_CLAIM_SIZE = 1000        # due rows claimed per sweep
+PUSH_RETRY_DELAY = 60         # seconds before a failed delivery is retried, doubling each time
+PUSH_RETRY_ATTEMPTS = 3       # retries of a notification before it is dropped
+PUSH_POLL_INTERVAL = 1        # seconds between scheduled sweeps (TASK_SCHEDULE)
+
+# Background tasks (tasks.queue, run by `manage.py run_tasks`). Web processes only
+# enqueue. Workers on the 'default' queue handle short, latency-sensitive work (pushes,
+# mail); the 'bulk' queue (retention sweeps, exports) gets its own workers so a long
+# export never holds up a push.
+TASK_DEFAULT_QUEUES = ['default']
+TASK_POLL_INTERVAL = 0.5   # seconds an idle worker waits between claims
+TASK_SCHEDULE_TICK = 1     # seconds between offering scheduled runs and reclaiming abandoned tasks
+TASK_RETRY_MAX = 3600      # seconds; longest backoff between attempts
+TASK_SCHEDULE = {
+    # task: seconds between runs
+    'chat.tasks.deliver_push': PUSH_POLL_INTERVAL,
+    'accounts.tasks.send_queued_email': EMAIL_POLL_INTERVAL,
+    'chat.tasks.reap_messages': RETENTION_INTERVAL,
+    'chat.tasks.run_exports': EXPORT_POLL_INTERVAL,  # resumes exports whose runner died
+}
+
+# Worker warmup (private_chat_app.warmup), run from asgi.py before daphne accepts traffic
+WARMUP_ON_STARTUP = config('WARMUP_ON_STARTUP', default=True, cast=bool)
+WARMUP_TEMPLATES = [
+    'chat/chat_list.html',
+    'chat/chat_room.html',
+    'accounts/login.html',
+]
+
+# Admin changelists: estimated counts above this many rows, capped exact counts below
+ADMIN_COUNT_CAP = 10000
+
+# Metrics (/metrics). Point METRICS_DIR at a directory shared by every worker on
+# the box so the endpoint aggregates all daphne processes.
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = 5  # seconds between snapshot writes
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # bearer token for scrapers; staff-only if empty
+
+# Query budgets (private_chat_app.profiling). Keys are URL names or 'consumer:<handler>';
+# counts include the session and user lookups done by middleware. In 'raise' mode only
+# the query count raises; going over db_ms, which varies with machine load, warns.
+QUERY_BUDGET_MODE = config(
+    'QUERY_BUDGET_MODE',
+    default='raise' if TESTING else ('warn' if DEBUG else 'log')
+)  # 'raise' | 'warn' | 'log'
+QUERY_TRACE_SAMPLE_RATE = config('QUERY_TRACE_SAMPLE_RATE', default=0.01, cast=float)
+QUERY_SLOW_MS = 500
+QUERY_BUDGETS = {
+    'healthz': {'queries': 0, 'db_ms': 0},
+    # chat.urls
+    'chat:chat_list': {'queries': 4, 'db_ms': 100},
+    'chat:chat_room': {'queries': 9, 'db_ms': 200},
+    'chat:create_room': {'queries': 9, 'db_ms': 100},
+    'chat:upload_file': {'queries': 6, 'db_ms': 100},
+    'chat:invite_members': {'queries': 10, 'db_ms': 200},
+    'chat:remove_members': {'queries': 9, 'db_ms': 200},
+    'chat:leave_group': {'queries': 8, 'db_ms': 100},
+    'chat:room_keys': {'queries': 9, 'db_ms': 200},
+    'chat:serve_file': {'queries': 3, 'db_ms': 50},
+    'chat:room_retention': {'queries': 5, 'db_ms': 50},
+    'chat:export_room': {'queries': 5, 'db_ms': 50},
+    'chat:export_status': {'queries': 3, 'db_ms': 50},
+    'chat:message_history': {'queries': 5, 'db_ms': 50},
+    'chat:message_replies': {'queries': 6, 'db_ms': 50},
+    'chat:push_devices': {'queries': 4, 'db_ms': 50},
+    # accounts.urls
+    'accounts:login': {'queries': 10, 'db_ms': 100},
+    'accounts:register': {'queries': 13, 'db_ms': 100},
+    'accounts:logout': {'queries': 5, 'db_ms': 50},
+    'accounts:profile': {'queries': 4, 'db_ms': 50},
+    'accounts:verify_email': {'queries': 3, 'db_ms': 50},
+    'accounts:user_search': {'queries': 3, 'db_ms': 50},
+    'accounts:public_key': {'queries': 4, 'db_ms': 50},
+    # ChatConsumer handlers
+    'consumer:check_participant': {'queries': 1, 'db_ms': 20},
+    'consumer:save_message': {'queries': 3, 'db_ms': 20},  # 1 unless it is a reply
+    'consumer:get_file_message': {'queries': 2, 'db_ms': 20},
+    'consumer:edit_message': {'queries': 4, 'db_ms': 20},
+    'consumer:delete_message': {'queries': 10, 'db_ms': 50},
+    'consumer:sync_changes': {'queries': 1, 'db_ms': 50},
+    'consumer:react': {'queries': 3, 'db_ms': 20},
+    'consumer:missed_messages': {'queries': 2, 'db_ms': 50},
+    'consumer:notify_offline': {'queries': 1, 'db_ms': 20},
+}
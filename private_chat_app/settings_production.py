@@ -0,0 +1,61 @@
+# private_chat_app/settings_production.py
+# Production profile: DJANGO_SETTINGS_MODULE=private_chat_app.settings_production
+#
+# Everything not overridden here comes from settings.py. Run
+# `python manage.py perfcheck` against this module before deploying.
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+# Connections come from the private_chat_app.db pool; CONN_MAX_AGE=0 returns them to
+# it after every request, and health checks re-validate any that are kept longer.
+# Replicas (DATABASE_REPLICA_URLS) get the same settings as the primary.
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=0, cast=int)
+    database['CONN_HEALTH_CHECKS'] = True
+
+# Tiered cache: a short-lived per-process tier in front of Redis. Data that must be
+# coherent across workers (sessions, key directories) uses the 'shared' alias.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'private_chat_app.cache.TieredCache',
+            'OPTIONS': {'LOCAL': 'local', 'SHARED': 'shared', 'LOCAL_TIMEOUT': 5},
+        },
+        'local': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_PREFIX': 'chat',
+        },
+    }
+    SESSION_CACHE_ALIAS = 'shared'
+    KEY_DIRECTORY_CACHE = 'shared'
+    PRESENCE_CACHE = 'shared'
+    REPLICA_PIN_CACHE = 'shared'
+
+# Sessions read from the cache, written through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Compile each template once per process
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+# Hashed, pre-compressed static files served with far-future cache headers.
+# Non-strict so a missing collectstatic degrades to unhashed URLs instead of 500s.
+STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+WHITENOISE_MANIFEST_STRICT = False
+
+# Spool uploads over 2.5MB to disk instead of holding them in worker memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
+
+QUERY_BUDGET_MODE = config('QUERY_BUDGET_MODE', default='log')
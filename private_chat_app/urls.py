@@ -5,9 +5,18 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from .health import healthz
+from .metrics import metrics_view
+
+# SimpleAdminConfig leaves autodiscovery to this urlconf. Warmup (WARMUP_ON_STARTUP,
+# the default) populates it before the worker listens, so the admin is loaded at
+# startup then; only with warmup off is that deferred to the first HTTP request
+admin.autodiscover()
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
+    path('healthz', healthz, name='healthz'),
     path('accounts/', include('accounts.urls')),
     path('', include('chat.urls')),
 ]
@@ -0,0 +1,62 @@
+# private_chat_app/warmup.py
+# Per-worker warmup, run from asgi.py before daphne starts accepting connections
+#
+# Each phase is timed into the worker_warmup_seconds histogram and logged. A failing
+# phase is logged and skipped: the worker still starts, and the first request simply
+# pays for that work as it would without warmup.
+
+import logging
+import time
+from django.conf import settings
+from django.template.loader import get_template
+from django.urls import get_resolver
+from . import bootstrap, metrics
+
+logger = logging.getLogger('private_chat_app.warmup')
+
+
+def _database():
+    bootstrap.prewarm_database()
+    for alias in settings.REPLICA_DATABASES:
+        bootstrap.prewarm_database(alias)
+
+
+def _channel_layer():
+    bootstrap.prewarm_channel_layer()
+
+
+def _urlconf():
+    # Populates every included resolver, the admin's too, so this imports the admin modules
+    get_resolver().reverse_dict
+
+
+def _templates():
+    for name in settings.WARMUP_TEMPLATES:
+        get_template(name)
+
+
+PHASES = [
+    ('database', _database),
+    ('channel_layer', _channel_layer),
+    ('urlconf', _urlconf),
+    ('templates', _templates),
+]
+
+
+def warmup():
+    """Run every warmup phase and return {phase: seconds}"""
+    timings = {}
+    for phase, func in PHASES:
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception:
+            logger.exception('Warmup phase %s failed', phase)
+            continue
+        timings[phase] = time.perf_counter() - start
+        metrics.WARMUP_SECONDS.observe(timings[phase], phase=phase)
+
+    logger.info('Worker warmed up in %.1fms (%s; connection phases: %s)', sum(timings.values()) * 1000,
+                ', '.join(f'{phase} {seconds * 1000:.1f}ms' for phase, seconds in timings.items()),
+                ', '.join(f'{phase} {seconds * 1000:.1f}ms' for phase, seconds in bootstrap.timings.items()) or 'none')
+    return timings
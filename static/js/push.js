@@ -0,0 +1,69 @@
+// static/js/push.js
+// Registers the Capacitor app's push token so offline messages reach the device.
+// Does nothing in a plain browser or without the @capacitor/push-notifications plugin.
+
+(function() {
+    'use strict';
+    const Capacitor = window.Capacitor;
+    const PushNotifications = Capacitor && Capacitor.Plugins && Capacitor.Plugins.PushNotifications;
+    if (!PushNotifications || !Capacitor.isNativePlatform()) {
+        return;
+    }
+
+    const endpoint = document.body.dataset.pushDevicesUrl;
+    const platform = Capacitor.getPlatform() === 'ios' ? 'apns' : 'fcm';
+
+    function csrfToken() {
+        const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        return match ? decodeURIComponent(match[1]) : '';
+    }
+
+    PushNotifications.addListener('registration', function(token) {
+        // Only re-send when the token changed since the last registration
+        if (localStorage.getItem('pushToken') === token.value) {
+            return;
+        }
+        fetch(endpoint, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken() },
+            body: JSON.stringify({ token: token.value, platform: platform })
+        }).then(function(response) {
+            if (response.ok) {
+                localStorage.setItem('pushToken', token.value);
+            }
+        });
+    });
+
+    // A signed-out device should stop getting this user's notifications
+    document.querySelectorAll('[data-logout]').forEach(function(link) {
+        link.addEventListener('click', function() {
+            const token = localStorage.getItem('pushToken');
+            if (!token) {
+                return;
+            }
+            localStorage.removeItem('pushToken');
+            fetch(endpoint, {
+                method: 'DELETE',
+                keepalive: true,
+                headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken() },
+                body: JSON.stringify({ token: token })
+            });
+        });
+    });
+
+    // Tapping a notification opens the room (or the chat list for a summary)
+    PushNotifications.addListener('pushNotificationActionPerformed', function(action) {
+        const url = action.notification.data && action.notification.data.url;
+        if (url) {
+            window.location.href = url;
+        }
+    });
+
+    PushNotifications.checkPermissions().then(function(status) {
+        return status.receive === 'prompt' ? PushNotifications.requestPermissions() : status;
+    }).then(function(status) {
+        if (status.receive === 'granted') {
+            PushNotifications.register();
+        }
+    });
+})();
@@ -159,4 +159,96 @@ class ChatEncryption {
         }
         return false;
     }
-}
\ No newline at end of file
+
+    // Export our public key as base64 SPKI for the key directory
+    async exportPublicKey() {
+        if (!this.encryptionAvailable || !this.keyPair) return null;
+
+        const spki = await window.crypto.subtle.exportKey("spki", this.keyPair.publicKey);
+        return btoa(String.fromCharCode(...new Uint8Array(spki)));
+    }
+
+    // Publish our public key so other members can wrap room keys for us
+    async publishPublicKey(csrfToken) {
+        const publicKey = await this.exportPublicKey();
+        if (!publicKey) return false;
+
+        const formData = new FormData();
+        formData.append('public_key', publicKey);
+        const response = await fetch('/accounts/public-key/', {
+            method: 'POST',
+            headers: { 'X-CSRFToken': csrfToken },
+            body: formData
+        });
+        return response.ok;
+    }
+
+    // Fetch every member's public key plus our wrapped room key in one request.
+    // The response is revalidated with its ETag, so unchanged directories cost a 304.
+    async fetchRoomKeys(roomId) {
+        const cacheKey = `chat_keydir_${roomId}`;
+        const cached = JSON.parse(sessionStorage.getItem(cacheKey) || 'null');
+        const headers = cached ? { 'If-None-Match': cached.etag } : {};
+
+        const response = await fetch(`/room/${roomId}/keys/`, { headers: headers });
+        if (response.status === 304 && cached) {
+            return cached.directory;
+        }
+        const directory = await response.json();
+        sessionStorage.setItem(cacheKey, JSON.stringify({
+            etag: response.headers.get('ETag'),
+            directory: directory
+        }));
+        return directory;
+    }
+
+    // Unwrap the room key delivered through the key directory
+    async unwrapRoomKey(roomId, wrappedKey) {
+        if (!this.encryptionAvailable || !this.keyPair || !wrappedKey) return false;
+
+        const wrapped = Uint8Array.from(atob(wrappedKey), c => c.charCodeAt(0));
+        this.symmetricKey = await window.crypto.subtle.unwrapKey(
+            "raw",
+            wrapped,
+            this.keyPair.privateKey,
+            { name: "RSA-OAEP" },
+            { name: "AES-GCM" },
+            true,
+            ["encrypt", "decrypt"]
+        );
+        await this.saveKey(roomId);
+        return true;
+    }
+
+    // Generate a new room key, wrap it for every member and upload all of them at once
+    async rotateRoomKey(roomId, csrfToken) {
+        if (!this.encryptionAvailable) return null;
+
+        const directory = await this.fetchRoomKeys(roomId);
+        await this.generateSymmetricKey();
+
+        const keys = {};
+        for (const member of directory.keys) {
+            if (!member.public_key) continue;
+            const spki = Uint8Array.from(atob(member.public_key), c => c.charCodeAt(0));
+            const publicKey = await window.crypto.subtle.importKey(
+                "spki", spki, { name: "RSA-OAEP", hash: "SHA-256" }, false, ["wrapKey"]
+            );
+            const wrapped = await window.crypto.subtle.wrapKey("raw", this.symmetricKey, publicKey, { name: "RSA-OAEP" });
+            keys[member.user_id] = btoa(String.fromCharCode(...new Uint8Array(wrapped)));
+        }
+
+        const response = await fetch(`/room/${roomId}/keys/`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrfToken
+            },
+            body: JSON.stringify({ epoch: directory.epoch + 1, keys: keys })
+        });
+        if (response.ok) {
+            await this.saveKey(roomId);
+        }
+        return response.json();
+    }
+}
@@ -4,18 +4,26 @@ class GroupChatManager {
         this.groupId = groupId;
         this.socket = null;
         this.onlineUsers = new Set();
+        // Newest message seen; reconnects resume from here
+        this.lastMessageId = 0;
+        this.reconnectAttempts = 0;
+        this.serverRetryMs = null;
         this.initWebSocket();
         this.setupEventListeners();
     }
 
     initWebSocket() {
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        const wsUrl = `${protocol}//${window.location.host}/ws/group/${this.groupId}/`;
+        let wsUrl = `${protocol}//${window.location.host}/ws/group/${this.groupId}/`;
+        if (this.lastMessageId) {
+            wsUrl += `?resume_after=${this.lastMessageId}`;
+        }
         
         this.socket = new WebSocket(wsUrl);
         
         this.socket.onopen = () => {
             console.log('Group chat connected');
+            this.reconnectAttempts = 0;
             this.updateConnectionStatus(true);
         };
 
@@ -24,18 +32,59 @@ class GroupChatManager {
             this.handleMessage(data);
         };
 
-        this.socket.onclose = () => {
+        this.socket.onclose = (event) => {
             console.log('Group chat disconnected');
             this.updateConnectionStatus(false);
-            // Attempt to reconnect after 3 seconds
-            setTimeout(() => this.initWebSocket(), 3000);
+            // 4403: removed from the group, 4008: fell too far behind (the page reloads)
+            if (event.code === 1000 || event.code === 4403 || event.code === 4008) {
+                return;
+            }
+            setTimeout(() => this.initWebSocket(), this.reconnectDelay());
         };
     }
 
+    reconnectDelay() {
+        if (this.serverRetryMs !== null) {
+            // A draining server already picked a jittered delay for us
+            const delay = this.serverRetryMs;
+            this.serverRetryMs = null;
+            return delay;
+        }
+        // Exponential backoff with full jitter (1s base, 30s cap), so a server
+        // restart doesn't bring every client back at the same moment
+        const ceiling = Math.min(30000, 1000 * Math.pow(2, this.reconnectAttempts));
+        this.reconnectAttempts++;
+        return Math.random() * ceiling;
+    }
+
     handleMessage(data) {
-        if (data.type === 'user_status') {
+        if (data.type === 'ping') {
+            // Heartbeat and flow control: the server stops writing to sockets that don't answer, then closes them
+            this.socket.send(JSON.stringify({type: 'pong'}));
+        } else if (data.type === 'user_status') {
             this.updateUserStatus(data.user, data.status);
+        } else if (data.type === 'membership') {
+            this.handleMembership(data);
+        } else if (data.type === 'deleted') {
+            // One frame per retention batch
+            data.message_ids.forEach(id => document.querySelector(`[data-message-id="${id}"]`)?.remove());
+        } else if (data.type === 'retention') {
+            console.log('Group retention policy changed:', data);
+        } else if (data.type === 'reconnect') {
+            // The server is restarting; it closes the socket right after this frame
+            this.serverRetryMs = data.retry_after_ms;
+            this.lastMessageId = Math.max(this.lastMessageId, data.resume_after || 0);
+        } else if (data.type === 'resync' || data.type === 'overflow') {
+            // The server dropped our backlog; reload to pick up missed history
+            window.location.reload();
+        } else if (data.type === 'error') {
+            console.warn('Group chat error:', data.error);
         } else {
+            // Replayed and live copies of a message can overlap after a reconnect
+            if (data.message_id && data.message_id <= this.lastMessageId) {
+                return;
+            }
+            this.lastMessageId = Math.max(this.lastMessageId, data.message_id || 0);
             this.displayMessage(data);
         }
     }
@@ -55,6 +104,9 @@ class GroupChatManager {
         const messagesContainer = document.getElementById('group-messages');
         const messageElement = this.createMessageElement(data);
         messagesContainer.appendChild(messageElement);
+        if (data.expires_at) {
+            setTimeout(() => messageElement.remove(), Math.max(new Date(data.expires_at) - Date.now(), 0));
+        }
         messagesContainer.scrollTop = messagesContainer.scrollHeight;
     }
 
@@ -87,6 +139,16 @@ class GroupChatManager {
         return messageDiv;
     }
 
+    handleMembership(data) {
+        if (data.removed_self) {
+            alert('You are no longer a member of this group.');
+            window.location.href = '/';
+            return;
+        }
+        (data.added || []).forEach(user => console.log(`${user.username} joined the group`));
+        (data.removed || []).forEach(userId => console.log(`User ${userId} left the group`));
+    }
+
     updateUserStatus(username, status) {
         if (status === 'online') {
             this.onlineUsers.add(username);
@@ -181,24 +243,46 @@ class GroupChatManager {
 
     // Group management functions
     inviteUser(email) {
+        this.inviteUsers([email]);
+    }
+
+    // Invite a batch of users in a single request
+    inviteUsers(emails) {
         fetch(`/groups/${this.groupId}/invite/`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
                 'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value
             },
-            body: JSON.stringify({email: email})
+            body: JSON.stringify({emails: emails})
         })
         .then(response => response.json())
         .then(data => {
             if (data.success) {
-                alert('Invitation sent successfully!');
+                let text = `Added ${data.added.length} member(s).`;
+                if (data.not_found.length) {
+                    text += `\nNot found: ${data.not_found.join(', ')}`;
+                }
+                alert(text);
             } else {
                 alert('Error sending invitation: ' + data.error);
             }
         });
     }
 
+    // Remove a batch of users by id (group creator only)
+    removeUsers(userIds) {
+        return fetch(`/groups/${this.groupId}/remove/`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value
+            },
+            body: JSON.stringify({user_ids: userIds})
+        })
+        .then(response => response.json());
+    }
+
     leaveGroup() {
         if (confirm('Are you sure you want to leave this group?')) {
             fetch(`/groups/${this.groupId}/leave/`, {
@@ -209,7 +293,7 @@ class GroupChatManager {
             })
             .then(response => {
                 if (response.ok) {
-                    window.location.href = '/groups/';
+                    window.location.href = '/';
                 }
             });
         }
@@ -0,0 +1,28 @@
+# tasks/admin.py
+
+from django.contrib import admin, messages
+from django.db import IntegrityError
+from django.utils import timezone
+from private_chat_app.paginators import EstimatedCountPaginator
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'queue', 'priority', 'status', 'attempts', 'run_at', 'locked_by']
+    list_filter = ['status', 'queue']
+    search_fields = ['=name', '=key']
+    readonly_fields = ['created_at', 'locked_at', 'locked_by']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ['-id']
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected tasks now')
+    def retry_now(self, request, queryset):
+        try:
+            updated = queryset.exclude(status='running').update(status='pending', attempts=0, run_at=timezone.now())
+        except IntegrityError:
+            self.message_user(request, 'A selected task has the same key as one already pending.', messages.ERROR)
+            return
+        self.message_user(request, f'{updated} task(s) queued again.')
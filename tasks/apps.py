@@ -0,0 +1,9 @@
+# tasks/apps.py
+
+from django.apps import AppConfig
+
+
+class TasksConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'tasks'
+    verbose_name = 'Background Tasks'
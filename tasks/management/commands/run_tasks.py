@@ -0,0 +1,28 @@
+# tasks/management/commands/run_tasks.py
+
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from tasks.worker import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run background tasks (and TASK_SCHEDULE) from the given queues until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', dest='queues', metavar='NAME',
+                            help=f"Queue to work (repeatable; default: {', '.join(settings.TASK_DEFAULT_QUEUES)})")
+        parser.add_argument('--burst', action='store_true', help='Exit once no task is due')
+
+    def handle(self, *args, **options):
+        def report(task, outcome, elapsed):
+            self.stdout.write(f'{task.name}#{task.id}: {outcome} in {elapsed:.2f}s (attempt {task.attempts})')
+            self.stdout.flush()
+
+        worker = Worker(options['queues'] or settings.TASK_DEFAULT_QUEUES, report)
+        # SIGTERM (deploys) and a first Ctrl-C let the current task finish
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+        self.stdout.write(f"Worker {worker.name} on queue(s) {', '.join(worker.queues)}")
+        worker.run(options['burst'])
+        self.stdout.write(f'Worker {worker.name} stopped')
@@ -0,0 +1,49 @@
+# tasks/models.py
+
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """One queued call of a registered task function (tasks.queue); deleted once it succeeds"""
+    
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=200)  # Dotted path of the task function
+    kwargs = models.JSONField(default=dict, blank=True)
+    queue = models.CharField(max_length=50, default='default')
+    priority = models.SmallIntegerField(default=0)  # Higher runs first among due tasks
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    # Optional dedupe key: at most one pending task per key
+    key = models.CharField(max_length=200, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    timeout = models.PositiveIntegerField(default=300)  # Seconds before a running task counts as abandoned
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            # Only waiting tasks are indexed for the claim, in the order workers take them
+            models.Index(
+                'queue', models.F('priority').desc(), 'run_at',
+                name='tasks_due_idx', condition=models.Q(status='pending'),
+            ),
+            models.Index(fields=['locked_at'], name='tasks_running_idx', condition=models.Q(status='running')),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'], name='tasks_pending_key_uniq',
+                condition=models.Q(status='pending') & ~models.Q(key=''),
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.status})"
@@ -0,0 +1,220 @@
+# tasks/queue.py
+# Background tasks on a Postgres table
+#
+# A task is a plain function registered with @task and referred to by its dotted
+# path. enqueue() inserts a Task row, inside the caller's transaction if there is
+# one, so work queued by a rolled-back request never runs. Workers (`manage.py
+# run_tasks`) claim one due row at a time with FOR UPDATE SKIP LOCKED, highest
+# priority first within their queue, run it and delete it; a failure is retried with
+# exponential backoff until max_attempts, then left as 'failed' for the admin.
+#
+# A keyed enqueue collapses into the pending task with the same key, which moves up
+# to the earlier run_at, so "run this soon" can be requested any number of times.
+# TASK_SCHEDULE runs tasks every N seconds the same way: each worker tick offers the
+# next slot under the key 'schedule:<name>', and a run that is still going keeps the
+# next one from being offered, so scheduled runs never overlap.
+
+import json
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from private_chat_app import metrics
+from .models import Task
+
+logger = logging.getLogger('tasks')
+
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+_registry = {}
+
+
+class TaskFunction:
+    """A registered task: call it to run inline, .enqueue() to run it on a worker"""
+
+    def __init__(self, func, name, queue, priority, max_attempts, retry_delay, timeout):
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.__doc__ = func.__doc__
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def __repr__(self):
+        return f'<task {self.name}>'
+
+    def enqueue(self, key='', run_at=None, delay=None, priority=None, **kwargs):
+        """Queue a run with these keyword arguments (JSON-serialisable)"""
+        if run_at is None:
+            run_at = timezone.now() + timedelta(seconds=delay or 0)
+        task = Task(
+            name=self.name, kwargs=kwargs, queue=self.queue,
+            priority=self.priority if priority is None else priority,
+            key=key, max_attempts=self.max_attempts, timeout=self.timeout, run_at=run_at,
+        )
+        if key:
+            _enqueue_keyed(task)
+        else:
+            task.save()
+        metrics.TASKS_ENQUEUED.inc(task=self.name)
+        return task
+
+    def backoff(self, attempts):
+        return timedelta(seconds=min(self.retry_delay * 2 ** (attempts - 1), settings.TASK_RETRY_MAX))
+
+
+def task(func=None, *, queue='default', priority=PRIORITY_NORMAL, max_attempts=3, retry_delay=10, timeout=300):
+    """Register a function as a task; its name is its dotted path"""
+    def register(func):
+        registered = TaskFunction(
+            func, f'{func.__module__}.{func.__qualname__}', queue, priority, max_attempts, retry_delay, timeout,
+        )
+        _registry[registered.name] = registered
+        return registered
+    return register(func) if func is not None else register
+
+
+def get_task(name):
+    """The registered task called name, importing its module on first use"""
+    if name not in _registry:
+        import_string(name)
+    return _registry[name]
+
+
+def _enqueue_keyed(task):
+    table = Task._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table}
+                (name, kwargs, queue, priority, status, key, attempts, max_attempts, timeout, run_at, locked_by, last_error, created_at)
+            VALUES (%s, %s::jsonb, %s, %s, 'pending', %s, 0, %s, %s, %s, '', '', now())
+            ON CONFLICT (key) WHERE status = 'pending' AND NOT (key = '')
+            DO UPDATE SET run_at = LEAST({table}.run_at, EXCLUDED.run_at),
+                          priority = GREATEST({table}.priority, EXCLUDED.priority)
+            RETURNING id
+            """,
+            [task.name, json.dumps(task.kwargs, cls=DjangoJSONEncoder), task.queue, task.priority,
+             task.key, task.max_attempts, task.timeout, task.run_at],
+        )
+        task.id = cursor.fetchone()[0]
+
+
+def schedule():
+    """Offer the next slot of every TASK_SCHEDULE entry that is neither pending nor running"""
+    if not settings.TASK_SCHEDULE:
+        return
+    table = Task._meta.db_table
+    rows, params = [], []
+    for name, interval in settings.TASK_SCHEDULE.items():
+        registered = get_task(name)
+        rows.append('(%s, %s::integer, %s, %s, %s, %s, %s)')
+        params += [name, max(int(interval), 1), registered.queue, registered.priority, f'schedule:{name}',
+                   registered.max_attempts, registered.timeout]
+    with connection.cursor() as cursor:
+        # Slots are aligned to multiples of the interval, so every worker offers the same one
+        cursor.execute(
+            f"""
+            INSERT INTO {table}
+                (name, kwargs, queue, priority, status, key, attempts, max_attempts, timeout, run_at, locked_by, last_error, created_at)
+            SELECT s.name, '{{}}', s.queue, s.priority, 'pending', s.key, 0, s.max_attempts, s.timeout,
+                   to_timestamp(ceil(extract(epoch FROM now()) / s.interval) * s.interval), '', '', now()
+            FROM (VALUES {', '.join(rows)}) AS s (name, interval, queue, priority, key, max_attempts, timeout)
+            WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.key = s.key AND t.status = 'running')
+            ON CONFLICT (key) WHERE status = 'pending' AND NOT (key = '') DO NOTHING
+            """,
+            params,
+        )
+
+
+def claim(worker, queues):
+    """Lock the next due task in these queues for this worker, or None"""
+    tasks = list(Task.objects.raw(
+        f"""
+        UPDATE {Task._meta.db_table} SET status = 'running', locked_by = %s, locked_at = now(), attempts = attempts + 1
+        WHERE id = (
+            SELECT id FROM {Task._meta.db_table}
+            WHERE status = 'pending' AND queue = ANY(%s) AND run_at <= now()
+            ORDER BY priority DESC, run_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+        """,
+        [worker, list(queues)],
+    ))
+    return tasks[0] if tasks else None
+
+
+def reclaim():
+    """Put tasks whose worker died (running past their timeout) back in the queue; returns how many"""
+    table = Task._meta.db_table
+    abandoned = "t.status = 'running' AND t.locked_at < now() - t.timeout * interval '1 second'"
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT t.id FROM {table} t WHERE {abandoned} ORDER BY t.id')
+        task_ids = [task_id for task_id, in cursor.fetchall()]
+
+    reclaimed = 0
+    for task_id in task_ids:
+        # One row at a time: a keyed task queued since the guard's snapshot (or another
+        # abandoned run with the same key) makes the update hit the pending-key index
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    UPDATE {table} t SET
+                        status = CASE WHEN t.attempts >= t.max_attempts THEN 'failed' ELSE 'pending' END,
+                        run_at = now(),
+                        last_error = 'Abandoned by worker ' || t.locked_by
+                    WHERE t.id = %s AND {abandoned}
+                      AND (t.key = '' OR NOT EXISTS (SELECT 1 FROM {table} p WHERE p.key = t.key AND p.status = 'pending'))
+                    """,
+                    [task_id],
+                )
+                updated = cursor.rowcount
+        except IntegrityError:
+            updated = 0
+        if updated:
+            reclaimed += 1
+            continue
+        # A keyed task that already has a pending successor is simply dropped
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} t WHERE t.id = %s AND {abandoned}', [task_id])
+    if reclaimed:
+        logger.warning('Reclaimed %d abandoned task(s)', reclaimed)
+    return reclaimed
+
+
+def finish(task, error=None):
+    """Record a run: delete on success, else reschedule with backoff or mark failed"""
+    if error is None:
+        Task.objects.filter(id=task.id).delete()
+        return 'done'
+    task.last_error = error[:5000]
+    try:
+        registered = get_task(task.name)
+    except ImportError:
+        registered = None
+    if registered is None or task.attempts >= task.max_attempts:
+        task.status = 'failed'
+        outcome = 'failed'
+    else:
+        task.status = 'pending'
+        task.run_at = timezone.now() + registered.backoff(task.attempts)
+        outcome = 'retry'
+    try:
+        Task.objects.filter(id=task.id).update(status=task.status, run_at=task.run_at, last_error=task.last_error)
+    except IntegrityError:
+        # A pending task with the same key was queued meanwhile and will do the work
+        Task.objects.filter(id=task.id).delete()
+    return outcome
@@ -0,0 +1,92 @@
+from datetime import timedelta
+from django.test import TransactionTestCase
+from django.utils import timezone
+from .models import Task
+from .queue import PRIORITY_HIGH, claim, finish, reclaim, task
+
+
+@task(max_attempts=2, retry_delay=10)
+def noop(**kwargs):
+    """Does nothing; queued by the tests below"""
+
+
+# Not TestCase: claim() and reclaim() compare against now(), which a test transaction freezes
+class QueueTests(TransactionTestCase):
+    def reclaim(self):
+        with self.assertLogs('tasks', 'WARNING'):
+            return reclaim()
+
+    def abandon(self, task_row):
+        Task.objects.filter(id=task_row.id).update(locked_at=timezone.now() - timedelta(seconds=task_row.timeout + 60))
+
+    def test_keyed_enqueue_collapses_into_the_pending_task(self):
+        first = noop.enqueue(key='k', delay=60)
+        second = noop.enqueue(key='k', delay=-5, priority=PRIORITY_HIGH)
+        self.assertEqual(first.id, second.id)
+        row = Task.objects.get()
+        self.assertLess(row.run_at, timezone.now())
+        self.assertEqual(row.priority, PRIORITY_HIGH)
+
+    def test_keyed_enqueue_while_running_queues_a_successor(self):
+        noop.enqueue(key='k', delay=-5)
+        running = claim('w1', ['default'])
+        noop.enqueue(key='k', delay=-5)
+        self.assertEqual(sorted(Task.objects.values_list('status', flat=True)), ['pending', 'running'])
+        self.assertIsNone(claim('w1', ['other']))
+        self.assertNotEqual(claim('w1', ['default']).id, running.id)
+
+    def test_claim_takes_due_tasks_by_priority(self):
+        noop.enqueue(delay=60)
+        low = noop.enqueue(delay=-10)
+        high = noop.enqueue(delay=-5, priority=PRIORITY_HIGH)
+        claimed = claim('w1', ['default'])
+        self.assertEqual((claimed.id, claimed.status, claimed.attempts, claimed.locked_by), (high.id, 'running', 1, 'w1'))
+        self.assertEqual(claim('w1', ['default']).id, low.id)
+        self.assertIsNone(claim('w1', ['default']))
+
+    def test_finish_deletes_retries_then_fails(self):
+        noop.enqueue(delay=-5)
+        self.assertEqual(finish(claim('w1', ['default'])), 'done')
+        self.assertFalse(Task.objects.exists())
+
+        noop.enqueue(delay=-5)
+        self.assertEqual(finish(claim('w1', ['default']), 'boom'), 'retry')
+        row = Task.objects.get()
+        self.assertEqual(row.status, 'pending')
+        self.assertGreater(row.run_at, timezone.now())
+        Task.objects.update(run_at=timezone.now() - timedelta(seconds=5))
+        self.assertEqual(finish(claim('w1', ['default']), 'boom'), 'failed')
+        self.assertEqual(Task.objects.get().status, 'failed')
+
+    def test_failed_keyed_task_yields_to_a_pending_successor(self):
+        noop.enqueue(key='k', delay=-5)
+        running = claim('w1', ['default'])
+        successor = noop.enqueue(key='k', delay=-5)
+        self.assertEqual(finish(running, 'boom'), 'retry')
+        self.assertEqual(list(Task.objects.values_list('id', flat=True)), [successor.id])
+
+    def test_reclaim_requeues_abandoned_tasks(self):
+        noop.enqueue(delay=-5)
+        self.abandon(claim('w1', ['default']))
+        self.assertEqual(self.reclaim(), 1)
+        row = Task.objects.get()
+        self.assertEqual((row.status, row.last_error), ('pending', 'Abandoned by worker w1'))
+
+        self.abandon(claim('w2', ['default']))
+        self.assertEqual(self.reclaim(), 1)
+        self.assertEqual(Task.objects.get().status, 'failed')
+
+    def test_reclaim_drops_keyed_tasks_with_a_pending_successor(self):
+        noop.enqueue(key='k', delay=-5)
+        self.abandon(claim('w1', ['default']))
+        successor = noop.enqueue(key='k', delay=-5)
+        self.assertEqual(reclaim(), 0)
+        self.assertEqual(list(Task.objects.values_list('id', flat=True)), [successor.id])
+
+    def test_reclaim_requeues_one_of_several_abandoned_runs_of_a_key(self):
+        noop.enqueue(key='k', delay=-5)
+        self.abandon(claim('w1', ['default']))
+        noop.enqueue(key='k', delay=-5)
+        self.abandon(claim('w2', ['default']))
+        self.assertEqual(self.reclaim(), 1)
+        self.assertEqual(list(Task.objects.values_list('status', flat=True)), ['pending'])
@@ -0,0 +1,66 @@
+# tasks/worker.py
+
+import logging
+import os
+import socket
+import time
+import traceback
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from private_chat_app import metrics
+from .queue import claim, finish, get_task, reclaim, schedule
+
+logger = logging.getLogger('tasks')
+
+
+class Worker:
+    """Claims and runs due tasks from its queues one at a time until stopped"""
+
+    def __init__(self, queues, report=None):
+        self.queues = list(queues)
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.report = report
+        self.stopping = False
+        self.next_tick = 0
+
+    def stop(self, *args):
+        # The task in progress finishes; nothing new is claimed
+        self.stopping = True
+
+    def run(self, burst=False):
+        """Work until stop(); with burst, return as soon as nothing is due"""
+        while not self.stopping:
+            if time.monotonic() >= self.next_tick:
+                schedule()
+                reclaim()
+                self.next_tick = time.monotonic() + settings.TASK_SCHEDULE_TICK
+            task = claim(self.name, self.queues)
+            if task is not None:
+                self.execute(task)
+                continue
+            if burst:
+                return
+            close_old_connections()
+            time.sleep(settings.TASK_POLL_INTERVAL)
+
+    def execute(self, task):
+        # Same connection hygiene as a request: stale or broken connections are replaced
+        close_old_connections()
+        metrics.TASK_LATENCY_SECONDS.observe(max((timezone.now() - task.run_at).total_seconds(), 0), task=task.name)
+        error = None
+        start = time.perf_counter()
+        try:
+            get_task(task.name)(**task.kwargs)
+        except Exception:
+            error = traceback.format_exc()
+            logger.exception('Task %s (%s, attempt %d) failed', task.id, task.name, task.attempts)
+        elapsed = time.perf_counter() - start
+        close_old_connections()
+
+        outcome = finish(task, error)
+        metrics.TASK_SECONDS.observe(elapsed, task=task.name)
+        metrics.TASKS_FINISHED.inc(task=task.name, outcome=outcome)
+        if self.report:
+            self.report(task, outcome, elapsed)
+        return outcome